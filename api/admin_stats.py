@@ -6,7 +6,7 @@ import json
 import logging
 
 logger = logging.getLogger("siance-api-log")
-fh = logging.FileHandler("logs/siance-api-log")
+fh = logging.FileHandler("logs/siance-api-log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
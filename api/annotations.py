@@ -36,11 +36,14 @@ def classify_sentences(pipeline: Pipeline, sentences: np.array) -> np.array:
         np.array: array of labels predictions, of the same length
     """
     embeddings = get_embeddings_sentences(sentences)
-    if "binarizer" in pipeline:
+    if "binarizer" in pipeline.named_steps:
         y = pipeline["classifier"].predict(embeddings)
         id_labels = pipeline["binarizer"].inverse_transform(y)
         return id_labels
-    elif "classifier_technical" in pipeline and "classifier_transverse" in pipeline:
+    elif (
+        "classifier_technical" in pipeline.named_steps
+        and "classifier_transverse" in pipeline.named_steps
+    ):
         return np.concatenate(
             (
                 pipeline["classifier_technical"].predict(embeddings),
@@ -12,6 +12,8 @@ from siancedb.models import (
 )
 
 from siancedb.config import get_config
+from siancedb.geography import region_names
+from siancedb.letter_summary import warm_up as warm_up_letter_summary
 
 from .schemes import (
     User,
@@ -65,6 +67,16 @@ app.include_router(watch_router)
 
 
 
+@app.on_event("startup")
+def warm_up():
+    # the caches are filled lazily anyway, a failure here must not prevent the api from starting
+    try:
+        region_names()
+        warm_up_letter_summary()
+    except Exception as e:
+        logger.warning(f"Warm-up failed, the caches will be filled on first use: {e}")
+
+
 @app.get("/")
 def read_root():
     return {"ApiStatus": "Working"}
@@ -12,7 +12,7 @@ from siancedb.models import (
     SiancedbTraining,
     SiancedbPrediction,
 )
-from siancedb.models import get_active_model_id
+from siancedb.reference_cache import active_model_id
 
 from siancedb.config import get_config
 
@@ -89,7 +89,7 @@ def get_ml_status():
         total_annotations = db.query(SiancedbTraining).count()
         total_predictions = (
             db.query(SiancedbPrediction)
-            .filter(SiancedbPrediction.id_model == get_active_model_id())
+            .filter(SiancedbPrediction.id_model == active_model_id())
             .count()
         )
 
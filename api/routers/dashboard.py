@@ -3,10 +3,8 @@ from fastapi import APIRouter, Depends, Query
 import elasticsearch as es
 import json
 
-from siancedb.elasticsearch.queries import (
-    build_geo_query,
-    GEO,
-)
+from siancedb.elasticsearch.queries import build_geo_query
+from siancedb.geography import region_names
 
 from siancedb.elasticsearch.schemes import EQuery
 from typing import Tuple, Optional, Dict
@@ -17,8 +15,7 @@ from ..visualize.visualize import (
     parse_elastic_response,
     get_dashboards_hist
 )
-
-from siancedb.models import SessionWrapper, SiancedbInb, SiancedbInterlocutor
+from ..visualize.inb_layer import get_inb_layer
 
 from siancedb.config import get_config
 
@@ -27,7 +24,7 @@ from .auth import get_current_user
 from .suggestions import suggest_generic
 
 
-from ..schemes import DashboardResponse
+from ..schemes import DashboardResponse, InbLayerResponse
 
 ES = get_config()["elasticsearch"]
 
@@ -82,65 +79,43 @@ def dashboard_letters(
     return get_dashboards_hist(df)
 
 
+@dashboard_router.get("/inb_layer", response_model=InbLayerResponse)
+def dashboard_inb_layer():
+    """
+    The static INB sites of the map, as a list of rows
+    whose values are ordered as in `columns`
+    """
+    return get_inb_layer()
+
+
 @dashboard_router.post("/letters_carto", response_model=DashboardResponse)
 def dashboard_letters(query: EQuery):
-
-    # TODO: count the number for each INB... this is
-    # done in the elasticsearch query !
-    # we should add a parameter
-    # siret_to_watch ^^
-
-    with SessionWrapper() as db:
-        inb_list = (
-            db.query(SiancedbInb, SiancedbInterlocutor)
-            .filter(SiancedbInterlocutor.siret == SiancedbInb.siret)
-            .all()
-        )
-        ludd_and_rep = [
-            {
-                "id_interlocutor": interlocutor.id_interlocutor,
-                "id_inb": inb.id_inb,
-                "point": [
-                    interlocutor.lat or 0,
-                    interlocutor.lon or 0,
-                ],
-                "name": interlocutor.name,
-                "code_inb": inb.code_inb,
-                "palier": inb.palier,
-                "ludd_level": inb.ludd_level,
-                "site_name": inb.site_name,
-                "cnpe_name": inb.cnpe_name,
-                "inb_name": inb.inb_name,
-                "inb_nature": inb.inb_nature,
-                "is_seashore": inb.is_seashore,
-            }
-            for inb, interlocutor in inb_list
-        ]
-
-    realq = build_geo_query(
-        query, id_interlocutors=[inb["id_interlocutor"] for inb in ludd_and_rep]
-    )
+    # the INB sites are served separately by `/dashboard/inb_layer`,
+    # only the aggregation depends on the query
+    realq = build_geo_query(query)
     conn = es.Elasticsearch(
         hosts=[{"host": ES["host"], "port": ES["port"]}], timeout=30
     )
     res = conn.search(index=ES["letters"], body=realq)
 
-    r = res["aggregations"]
+    regions_buckets = {
+        bucket["key"]: bucket for bucket in res["aggregations"]["regions"]["buckets"]
+    }
 
     return {
         "suggest_letters": suggest_generic(query, "letters"),
         "suggest_demands": suggest_generic(query, "demands"),
         "dashboard": {
             "regions": {
-                d["properties"]["code"]: {
-                    "name": d["properties"]["nom"],
-                    "code": d["properties"]["code"],
-                    "count": r[d["properties"]["code"]]["doc_count"],
-                    "nb_interlocutors": r[d["properties"]["code"]]["interlocutors"][
-                        "value"
-                    ],
+                code: {
+                    "name": name,
+                    "code": code,
+                    "count": regions_buckets.get(code, {}).get("doc_count", 0),
+                    "nb_interlocutors": regions_buckets.get(code, {})
+                    .get("interlocutors", {})
+                    .get("value", 0),
                 }
-                for d in GEO["features"]
+                for code, name in region_names().items()
             },
             "ludd_and_rep": [],
         },
@@ -8,7 +8,7 @@ import requests
 import tempfile
 import io
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.responses import StreamingResponse
 
 import elasticsearch as es
@@ -21,10 +21,9 @@ from siancedb.elasticsearch.schemes import EFilter, EQuery
 from siancedb.models import (
     SessionWrapper,
     SiancedbActionLog,
-    SiancedbLabel,
-    SiancedbSIv2LettersMetadata,
     log_action,
 )
+from siancedb.reference_cache import LABELS, THEMES, cached, load_labels, load_themes
 
 from siancedb.config import get_config
 
@@ -239,32 +238,35 @@ def redirect_referentials(ref_id: str):
         )
 
 
+def not_modified(request: Request, response: Response, etag: str) -> bool:
+    """
+    Set the ETag of the response, and tell whether the client already has this version
+    """
+    response.headers["ETag"] = f'"{etag}"'
+    response.headers["Cache-Control"] = "no-cache"
+    return request.headers.get("If-None-Match") == f'"{etag}"'
+
+
 @exports_router.get("/ontology", response_model=List[SianceCategory])
-def fetch_ontology():
-    with SessionWrapper() as db:
-        return [
-            {
-                "category": key,
-                "subcategories": [SianceSubcategory.from_orm(g) for g in group],
-            }
-            for key, group in itertools.groupby(
-                sorted(
-                    # pylint: disable=no-member
-                    db.query(SiancedbLabel).all(),
-                    key=lambda x: x.category,
-                ),
-                lambda x: x.category,
-            )
-        ]
+def fetch_ontology(request: Request, response: Response):
+    labels, etag = cached(LABELS, load_labels)
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return [
+        {
+            "category": key,
+            "subcategories": [SianceSubcategory(**label) for label in group],
+        }
+        for key, group in itertools.groupby(
+            sorted(labels, key=lambda x: x["category"]),
+            lambda x: x["category"],
+        )
+    ]
 
 
 @exports_router.get("/themes", response_model=List[str])
-def fetch_themes():
-    print("building themes")
-    with SessionWrapper() as db:
-        return [
-            theme[0]
-            for theme in db.query(SiancedbSIv2LettersMetadata.theme)
-            .distinct(SiancedbSIv2LettersMetadata.theme)
-            .all()
-        ]
+def fetch_themes(request: Request, response: Response):
+    themes, etag = cached(THEMES, load_themes)
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return themes
@@ -2,10 +2,12 @@ from typing import Optional
 
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 
 import elasticsearch as es
 
-from siancedb.letter_summary import hydrate_letter, PREDICTION_MODE
+from siancedb.letter_summary import hydrate_letter_cached, PREDICTION_MODE
 from siancedb.elasticsearch.queries import (
     build_explain_query,
 )
@@ -16,7 +18,7 @@ from siancedb.models import (
     SessionWrapper,
     SiancedbLetter,
 )
-from siancedb.models import get_active_model_id
+from siancedb.reference_cache import active_model_id
 
 from siancedb.config import get_config
 
@@ -45,7 +47,7 @@ def observe_letter_mode(id_letter: int, mode: str, id_model=None):
     Observe hydrated letter using the given mode (prediction or training)
     """
     # if id_model is None:
-    id_model = get_active_model_id()
+    id_model = active_model_id()
 
     with SessionWrapper() as db:
         res = (
@@ -59,7 +61,7 @@ def observe_letter_mode(id_letter: int, mode: str, id_model=None):
                 "id_letter": letter.id_letter,
                 "name": letter.name,
                 "codep": letter.codep,
-                "content": hydrate_letter(letter, mode=mode, id_model=id_model),
+                "content": None,
                 "date": letter.sent_date,
                 "nb_pages": letter.nb_pages,
                 "interlocutor": Interlocutor.from_orm(letter.interlocutor)
@@ -69,7 +71,13 @@ def observe_letter_mode(id_letter: int, mode: str, id_model=None):
                 if letter.metadata_si is not None
                 else None,
             }
-            return result
+            # the tree is already made of plain dictionaries,
+            # validating it again against the recursive `AnnotatedText` would be slow
+            result = jsonable_encoder(result)
+            result["content"] = hydrate_letter_cached(
+                db, letter, mode=mode, id_model=id_model
+            )
+            return JSONResponse(content=result)
     raise HTTPException(status_code=404, detail="The letter does not seem to exist")
 
 
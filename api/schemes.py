@@ -3,7 +3,7 @@
 # used to talk to the API as well as
 # the API responses
 
-from typing import Optional, List, Union, Tuple, Dict
+from typing import Any, Optional, List, Union, Tuple, Dict
 from fastapi.param_functions import Query
 from pydantic import BaseModel, Field
 from datetime import datetime, date
@@ -440,6 +440,12 @@ class DashboardMap(BaseModel):
     ludd_and_rep: List[LuddAndRep]
 
 
+class InbLayerResponse(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+    fingerprint: str
+
+
 class DashboardResponse(BaseModel):
     suggest_letters: SuggestResponse
     suggest_demands: SuggestResponse
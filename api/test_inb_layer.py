@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from siancedb import models
+from siancedb.models import SiancedbInb, SiancedbInterlocutor
+
+from visualize import inb_layer
+
+
+class TestInbLayer(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [SiancedbInb, SiancedbInterlocutor]:
+            model.__table__.create(engine)
+        session_local = sessionmaker(bind=engine, expire_on_commit=False)
+        self.db = session_local()
+        self.db.add_all(
+            [
+                SiancedbInterlocutor(
+                    id_interlocutor=1, siren="1", siret="11", name="CNPE A", lat=45.0, lon=4.0
+                ),
+                SiancedbInb(id_inb=10, siret="11", code_inb=100, inb_name="A1"),
+                SiancedbInb(id_inb=11, siret="11", code_inb=101, inb_name="A2"),
+            ]
+        )
+        self.db.commit()
+        for patcher in [
+            mock.patch.object(models, "SessionLocal", session_local),
+            mock.patch.multiple(inb_layer, _layer={}, _fingerprint=None, _checked_at=0.0),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.db.close)
+
+    def get_inb_layer(self, check_seconds):
+        config = {"dashboard": {"inb_layer_check_seconds": check_seconds}}
+        with mock.patch.object(inb_layer, "get_config", return_value=config), mock.patch.object(
+            inb_layer, "build_inb_layer", wraps=inb_layer.build_inb_layer
+        ) as build:
+            return inb_layer.get_inb_layer(), build.call_count
+
+    def test_hit_within_the_check_period(self):
+        layer, calls = self.get_inb_layer(300)
+        self.assertEqual(calls, 1)
+        self.assertEqual([row[1] for row in layer["rows"]], [10, 11])
+        self.db.add(SiancedbInb(id_inb=12, siret="11", code_inb=102))
+        self.db.commit()
+        cached, calls = self.get_inb_layer(300)
+        self.assertEqual(calls, 0)
+        self.assertIs(cached, layer)
+
+    def test_same_content_keeps_the_payload(self):
+        layer, _ = self.get_inb_layer(0)
+        cached, calls = self.get_inb_layer(0)
+        self.assertEqual(calls, 1)
+        self.assertIs(cached, layer)
+
+    def test_updated_row(self):
+        layer, _ = self.get_inb_layer(0)
+        # neither the number of rows nor the identifiers change
+        self.db.query(SiancedbInterlocutor).update({SiancedbInterlocutor.lat: 46.5})
+        self.db.commit()
+        updated, _ = self.get_inb_layer(0)
+        self.assertNotEqual(updated["fingerprint"], layer["fingerprint"])
+        self.assertEqual({row[2] for row in updated["rows"]}, {46.5})
+
+    def test_deleted_row(self):
+        layer, _ = self.get_inb_layer(0)
+        self.db.query(SiancedbInb).filter(SiancedbInb.id_inb == 11).delete()
+        self.db.commit()
+        updated, _ = self.get_inb_layer(0)
+        self.assertNotEqual(updated["fingerprint"], layer["fingerprint"])
+        self.assertEqual([row[1] for row in updated["rows"]], [10])
@@ -1,5 +1,6 @@
 from datetime import date
-from siancedb.models import SessionWrapper, get_active_model_id, SiancedbLabel
+from siancedb.models import SessionWrapper
+from siancedb.reference_cache import active_model_id, labels as cached_labels
 import pandas as pd
 import elasticsearch as es
 import itertools
@@ -129,7 +130,7 @@ def get_topics_count_sql(
     """
     if not subcategories:
         return
-    id_model = get_active_model_id()
+    id_model = active_model_id()
     query = f"""
         SELECT extract( year FROM ape_letters.sent_date )::int as year, COUNT(distinct(ape_predictions.id_letter)), ape_labels.subcategory
         FROM ape_predictions
@@ -326,8 +327,7 @@ def get_decreasing_subcategories(data: pd.DataFrame) -> List[str]:
         
 
 def highlight_topics() -> List[str]:
-    with SessionWrapper() as db:
-        subcategories = [label.subcategory for label in db.query(SiancedbLabel).all()]
+    subcategories = [label["subcategory"] for label in cached_labels()]
     
     subcategories = [
         unquote(subcategory).replace("'", "''") for subcategory in subcategories
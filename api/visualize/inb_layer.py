@@ -0,0 +1,124 @@
+"""
+    The static layer of the map: every INB site joined
+    with its interlocutor.
+
+    The layer only changes when the referential tables
+    (`ape_inb`, `ape_interlocutors`) are updated, so it is
+    kept in memory with a hash of its content. The join (a
+    few hundred rows) is read again at most every
+    `dashboard.inb_layer_check_seconds` seconds, and the
+    payload is replaced only when the hash changes: rows
+    inserted, deleted or updated (e.g. the coordinates of an
+    interlocutor) are all seen, whichever process wrote them.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, List
+
+from siancedb.config import get_config
+from siancedb.models import (
+    Session,
+    SessionWrapper,
+    SiancedbInb,
+    SiancedbInterlocutor,
+)
+
+INB_LAYER_COLUMNS = [
+    "id_interlocutor",
+    "id_inb",
+    "lat",
+    "lon",
+    "name",
+    "code_inb",
+    "palier",
+    "ludd_level",
+    "site_name",
+    "cnpe_name",
+    "inb_name",
+    "inb_nature",
+    "is_seashore",
+]
+
+_lock = threading.Lock()
+_layer: Dict[str, Any] = {}
+_fingerprint: str = None
+_checked_at = 0.0
+
+
+def layer_fingerprint(rows: List[List[Any]]) -> str:
+    """
+    A hash of the content of the layer, changes whenever a value changes
+    """
+    return hashlib.blake2b(
+        json.dumps(rows, default=str).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def build_inb_layer(db: Session) -> List[List[Any]]:
+    """
+    Join the INBs with their interlocutors, one row per INB,
+    with the values ordered as in `INB_LAYER_COLUMNS`
+    """
+    rows = (
+        db.query(
+            SiancedbInterlocutor.id_interlocutor,
+            SiancedbInb.id_inb,
+            SiancedbInterlocutor.lat,
+            SiancedbInterlocutor.lon,
+            SiancedbInterlocutor.name,
+            SiancedbInb.code_inb,
+            SiancedbInb.palier,
+            SiancedbInb.ludd_level,
+            SiancedbInb.site_name,
+            SiancedbInb.cnpe_name,
+            SiancedbInb.inb_name,
+            SiancedbInb.inb_nature,
+            SiancedbInb.is_seashore,
+        )
+        .filter(SiancedbInterlocutor.siret == SiancedbInb.siret)
+        .order_by(SiancedbInb.id_inb)
+        .all()
+    )
+    return [
+        [
+            id_interlocutor,
+            id_inb,
+            lat or 0,
+            lon or 0,
+            *others,
+        ]
+        for id_interlocutor, id_inb, lat, lon, *others in rows
+    ]
+
+
+def get_inb_layer() -> Dict[str, Any]:
+    """
+    The INB layer as a compact payload
+    `{"columns": [...], "rows": [[...], ...], "fingerprint": "..."}`.
+
+    The content of the referential is checked at most every
+    `dashboard.inb_layer_check_seconds` seconds (default 300),
+    the same payload is returned as long as it did not change.
+    """
+    global _layer, _fingerprint, _checked_at
+    check_seconds = (
+        get_config().get("dashboard", {}).get("inb_layer_check_seconds", 300)
+    )
+    with _lock:
+        if _fingerprint is not None and time.time() - _checked_at < check_seconds:
+            return _layer
+        with SessionWrapper() as db:
+            rows = build_inb_layer(db)
+        fingerprint = layer_fingerprint(rows)
+        if fingerprint != _fingerprint:
+            _layer = {
+                "columns": INB_LAYER_COLUMNS,
+                "rows": rows,
+                "fingerprint": fingerprint,
+            }
+            _fingerprint = fingerprint
+        _checked_at = time.time()
+        return _layer
@@ -1,5 +1,6 @@
 from siancebackend.prefect_tasks import (
     FetchLettersToRefresh,
+    PrefetchSiv2,
     RefreshSiv2MetadataInterlocutor,
     fill_index,
 )
@@ -30,7 +31,8 @@ def register_flow():
         )
         fetch_letters = FetchLettersToRefresh()
         refresh_metadata = RefreshSiv2MetadataInterlocutor()
-        letters = fetch_letters.run()
+        prefetch_siv2 = PrefetchSiv2()
+        letters = prefetch_siv2(fetch_letters.run())
         metadata_interlocutor_tuple = refresh_metadata.map(letters)
         fill_index.map(
             letters,
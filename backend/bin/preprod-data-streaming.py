@@ -1,6 +1,5 @@
 from siancebackend.prefect_tasks import (
-    FetchNewLetters,
-    Download,
+    AcquireNewLetters,
     BuildLetter,
     BuildSiv2MetadataInterlocutor,
     BuildSectionsDemands,
@@ -27,8 +26,7 @@ set_config_file(CONFIG_PREPROD)
 
 def register_flow():
 
-    fetch_new_letters = FetchNewLetters()
-    download = Download()
+    acquire_new_letters = AcquireNewLetters()
     build_letter = BuildLetter()
     build_siv2metadata = BuildSiv2MetadataInterlocutor()
     build_demands = BuildSectionsDemands()
@@ -45,8 +43,7 @@ def register_flow():
             "Model to use for predictions. Default: the last 'activated' model",
             default=get_active_model_id(),
         )
-        rss_letters = fetch_new_letters.run()
-        letter_paths = download.map(rss_letters)
+        letter_paths = acquire_new_letters()
         letters = build_letter.map(letter_paths)
         metadata_interlocutor_tuple = build_siv2metadata.map(letters)
         trigrams = build_trigrams.map(letters)
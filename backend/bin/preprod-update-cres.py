@@ -1,9 +1,8 @@
 from prefect import task, Task, Flow, context, Parameter
 from siancedb.config import set_config_file
 from siancebackend.prefect_tasks import (
-    fetch_updatable_CRES,
-    build_and_add_one_cres,
-    index_new_cres,
+    fetch_updatable_CRES_batches,
+    build_add_and_index_cres_batch,
 )
 
 # from prefect.executors import LocalDaskExecutor
@@ -18,9 +17,8 @@ set_config_file(CONFIG_PREPROD)
 
 def register_flow():
     with Flow("Ingest new data from CRES dumps") as flow:
-        find_new_cres = fetch_updatable_CRES()
-        cres_ids = build_and_add_one_cres.map(siv2cres=find_new_cres)
-        index_new_cres.map(id_cres=cres_ids)
+        new_cres_batches = fetch_updatable_CRES_batches()
+        build_add_and_index_cres_batch.map(siv2cres_batch=new_cres_batches)
         # Uses the default scheduler (threads)
     flow.register(PREPROD_PROJECT_NAME)
 
@@ -33,6 +33,7 @@ setup(
         "dateparser",
         "DateTime",
         "feedparser",
+        "aiohttp",
         "matplotlib",
         "numpy",
         "schedule",
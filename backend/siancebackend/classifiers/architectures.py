@@ -166,7 +166,7 @@ def prepare_classifier(
         )
         return get_hierarchical_architecture(labels_hierarchy)
 
-    elif architecture == "custom-hierarchical":
+    elif architecture in ["custom-hierarchical", "dual"]:
         assert labels_hierarchy is not None, (
             "If the architecture is set to `hierarchical`, "
             "`labels_dict` cannot be None and must indicate the hierarchy of classes"
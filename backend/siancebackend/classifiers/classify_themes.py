@@ -26,13 +26,19 @@ from siancedb.pandas_writer import write_from_pandas, import_objects_in_pandas,
 
 from siancebackend.letter_management.sentencizer import prepare_sentencizer
 from siancebackend.classifiers.embeddings import get_embeddings_sentences
+from siancebackend.classifiers.section_bounds import (
+    letters_bounds,
+    load_section_bounds,
+    section_bounds,
+    synthesis_mask,
+)
 from siancebackend.pipe_logger import update_log_state
 
 import logging
 
 logger = logging.getLogger("classify-themes")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/classify_themes.log")
+fh = logging.FileHandler("logs/classify_themes.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -100,9 +106,9 @@ def prepare_classifier_encoder():
 
 def build_themes(db: Session, pipe_logger=None):
     classifier, encoder = prepare_classifier_encoder()
-    # load a dataframe of sections
+    # load the bounds of the sections of every letter
     with SessionWrapper() as database:
-        sections_df = import_objects_in_pandas(SiancedbSection, database)
+        bounds = load_section_bounds(database)
 
     # load letters generator
     query = db.query(SiancedbLetter).filter(~SiancedbLetter.metadata_dyn.any())
@@ -123,9 +129,7 @@ def build_themes(db: Session, pipe_logger=None):
             classifier=classifier,
             encoder=encoder,
             letters_df=chunk_df,
-            sections_df=sections_df[
-                sections_df.id_letter.isin(chunk_df.id_letter.values)
-            ],
+            bounds=bounds,
         )
 
         write_from_pandas(metadata_df, SiancedbPredictedMetadata, db)
@@ -159,55 +163,59 @@ def classify_themes_one_letter(
     return SiancedbPredictedMetadata(id_letter=int(letter.id_letter), theme=str(theme))
 
 
-def classify_themes(classifier, encoder, letters_df, sections_df, sentencizer=None):
+def classify_themes(
+    classifier, encoder, letters_df, sections_df=None, sentencizer=None, bounds=None
+):
     """
     This function is used to predict the theme of a letter from the first sentence of synthesis
-    The sentencizing step (slow step) is performed sentence by sentence,
-     while the embedding and the theme predictions steps (quicker steps) are performed directly on a batch
+    The syntheses are sentencized in a batch, then the embedding and the theme predictions steps
+     are performed directly on the batch of first sentences
 
     Args:
         encoder (sklearn.preprocessing.LabelEncoder): encode-decode the themes categories into sklearn classes
         classifier (sklearn.base.BaseEstimator): a trained sklearn classifier
         letters_df (pandas.DataFrame): structured as the table `ape_letters`
-        sections_df (pandas.DataFrame): structured as the table `ape_sections`
+        sections_df (pandas.DataFrame): structured as the table `ape_sections`, ignored if `bounds` is given
+        bounds (pandas.DataFrame, Optional): the bounds of the sections, as returned by `section_bounds`
 
     Returns:
         pandas.DataFrame: a table with the 2 columns "id_letter", "theme"
     """
     if sentencizer is None:
         sentencizer = prepare_sentencizer()
+    if bounds is None:
+        bounds = section_bounds(sections_df)
 
-    # loop to extract first sentences of synthesis, when there is one
-    first_sentences = []
+    # the starting and the ending characters of the synthesis section (reminder: synthesis <=> priority=0)
+    bounds = letters_bounds(letters_df, bounds)
     # the mask is True when we succeed in extracting the first sentence of the synthesis
-    # the id_letters list here should equal to `letters_df.id_letter`
-    mask, id_letters = [], []
-    for _, letter in letters_df.iterrows():
-        # the starting and the ending characters of the synthesis section (reminder: synthesis <=> priority=0)
-        id_letters.append(letter.id_letter)
-        try:
-            bounds = sections_df[
-                (sections_df.id_letter == letter.id_letter)
-                & (sections_df.priority == 0)
-            ][["start", "end"]].values[0]
-            start, end = bounds
-            synthesis = letter.text[start:end]
-            first_sentence_synthesis = next(sentencizer(synthesis).sents).text
-            first_sentences.append(first_sentence_synthesis)
-            mask.append(True)
-        except:
-            mask.append(False)
+    mask = synthesis_mask(bounds)
+    syntheses = [
+        (text or "")[start:end]
+        for text, start, end in zip(
+            letters_df.text.values[mask],
+            bounds["synthesis_start"].values[mask],
+            bounds["synthesis_end"].values[mask],
+        )
+    ]
+    first_sentences = []
+    has_sentence = []
+    for doc in sentencizer.pipe(syntheses, batch_size=256):
+        first_sentence_synthesis = next(doc.sents, None)
+        has_sentence.append(first_sentence_synthesis is not None)
+        if first_sentence_synthesis is not None:
+            first_sentences.append(first_sentence_synthesis.text)
+    mask[mask] = has_sentence
 
-    # predict themes for the letters having a synthesis including at least one sentence...
-    embeddings = get_embeddings_sentences(first_sentences)
-    y_pred = classifier.predict(embeddings)
-    themes_pred = encoder.inverse_transform(y_pred)
     # fill `metadata_df` with the predicted themes, or empty string where there is no predicted theme
     # warning: dtype=object enables to have regular strings, while dtype=str only keeps the first character!
     themes_pred_padded = np.zeros(len(letters_df), dtype=object)
-    # the lists `id_letters` and `themes_pred_padded` are synchronized by construction
-    themes_pred_padded[mask] = themes_pred
+    # predict themes for the letters having a synthesis including at least one sentence...
+    if first_sentences:
+        embeddings = get_embeddings_sentences(first_sentences)
+        y_pred = classifier.predict(embeddings)
+        themes_pred_padded[mask] = encoder.inverse_transform(y_pred)
     themes_df = pd.DataFrame(
-        data={"id_letter": id_letters, "theme": themes_pred_padded}
+        data={"id_letter": letters_df.id_letter.values, "theme": themes_pred_padded}
     )
     return themes_df
@@ -1,17 +1,35 @@
 import os
 import pickle
+import shutil
+import tempfile
 import time
 import pandas as pd
 import numpy as np
 from datetime import date
 
-from siancebackend.classifiers.embeddings import get_embeddings_sentences
+from siancebackend.classifiers.embeddings import (
+    get_embeddings_sentences,
+    training_store,
+    update_training_embeddings,
+)
 from siancebackend.classifiers.architectures import prepare_classifier
+from siancebackend.classifiers.section_bounds import load_section_bounds, letters_bounds
+from siancebackend.classifiers.compiled_mlp import (
+    compile_pipeline,
+    compiled_path,
+    load_compiled,
+)
+from siancebackend.classifiers.incremental import partial_fit_pipeline, replay_rows
 
 from siancebackend.classifiers.evaluate_classifier import (
     evaluate_mono_output,
     evaluate_every_class,
     evaluate_multi_output_classifier,
+    indicator_lists,
+    label_counts,
+    label_indicators_from_pairs,
+    scores_from_counts,
+    subset_accuracy,
 )
 from siancebackend.letter_management.sentencizer import prepare_sentencizer
 from siancebackend.pipe_logger import update_log_state
@@ -27,18 +45,20 @@ from siancedb.models import (
     SiancedbModel,
     SiancedbPrediction,
     SiancedbPipeline,
+    get_active_model_id,
 )
 from siancedb.pandas_writer import write_from_pandas, import_objects_in_pandas, chunker
 
+from sqlalchemy import and_, exists
+from sklearn.model_selection import GridSearchCV
 from sklearn.pipeline import Pipeline
-from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import (
     MultiLabelBinarizer,
 )
 
 # for typing
 import spacy
-from typing import Dict, Iterable, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
 # logger
 import logging
@@ -46,7 +66,7 @@ import logging
 logger = logging.getLogger("classify-topics")
 logger.setLevel(logging.DEBUG)
 # create file handler which logs even debug messages
-fh = logging.FileHandler("logs/classify_topics.log")
+fh = logging.FileHandler("logs/classify_topics.log", delay=True)
 logger.addHandler(fh)
 
 # the minimal length of a sentence to be predicted (arbitrary hyperparameter)
@@ -96,12 +116,14 @@ def train_save_pipeline_from_embeddings(
     time_learning = time.time()
 
     if architecture == "dual":
+        # a hierarchical classifier for the technical labels and another one for the transverse labels.
+        # They are fitted one after the other in this process: each one fits its bottom classifiers
+        # in a pool of all the workers, so that the pools (and the threads of BLAS) are never nested
         technical_labels = {
-            k: v if not labels_transverse[k] else None
-            for k, v in labels_hierarchy.items()
+            k: v for k, v in labels_hierarchy.items() if not labels_transverse[k]
         }
         transverse_labels = {
-            k: v if labels_transverse[k] else None for k, v in labels_hierarchy.items()
+            k: v for k, v in labels_hierarchy.items() if labels_transverse[k]
         }
         technical_classifier = prepare_classifier(
             architecture="dual", labels_hierarchy=technical_labels, top_n=top_n
@@ -115,8 +137,9 @@ def train_save_pipeline_from_embeddings(
                 ("classifier_transverse", transverse_classifier),
             ]
         )
-        mask_technical = id_labels == technical_labels.keys()
-        mask_transverse = id_labels == technical_labels.keys()
+        y_flat = np.ravel(id_labels)
+        mask_technical = np.isin(y_flat, list(technical_labels))
+        mask_transverse = np.isin(y_flat, list(transverse_labels))
         pipeline["classifier_technical"].fit(
             embeddings[mask_technical], id_labels[mask_technical]
         )
@@ -156,6 +179,8 @@ def train_save_pipeline_from_embeddings(
 
     with open(model_path, "wb") as file:
         pickle.dump(pipeline, file)
+    if architecture == "multi-output":
+        compile_pipeline(pipeline, compiled_path(model_path))
     return pipeline
 
 
@@ -171,7 +196,23 @@ def load_pipeline(model_path: str) -> Pipeline:
     """
     with open(model_path, "rb") as file:
         pipeline = pickle.load(file)
-    return pipeline
+    # use the stacked weights of the classifier if it was compiled
+    return load_compiled(pipeline, model_path)
+
+
+def compile_model_with_id_model(id_model: int) -> str:
+    """
+    Compile the classifier of a multi-output model saved before the compilation was done at training,
+    and return the path of the compiled classifier
+    """
+    with SessionWrapper() as db:
+        model = db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).one()
+        model_path = model.link
+    with open(model_path, "rb") as file:
+        pipeline = pickle.load(file)
+    path = compiled_path(model_path)
+    compile_pipeline(pipeline, path)
+    return path
 
 
 def classify_sentences(pipeline: Pipeline, sentences: np.array) -> np.array:
@@ -188,11 +229,16 @@ def classify_sentences(pipeline: Pipeline, sentences: np.array) -> np.array:
         np.array: array of labels predictions, of the same length
     """
     embeddings = get_embeddings_sentences(sentences)
-    if "binarizer" in pipeline:
+    if getattr(pipeline, "compiled_mlp", None) is not None:
+        return pipeline.compiled_mlp.predict(embeddings)
+    elif "binarizer" in pipeline.named_steps:
         y = pipeline["classifier"].predict(embeddings)
         id_labels = pipeline["binarizer"].inverse_transform(y)
         return id_labels
-    elif "classifier_technical" in pipeline and "classifier_transverse" in pipeline:
+    elif (
+        "classifier_technical" in pipeline.named_steps
+        and "classifier_transverse" in pipeline.named_steps
+    ):
         return np.concatenate(
             (
                 pipeline["classifier_technical"].predict(embeddings),
@@ -216,8 +262,18 @@ def classify_embeddings(pipeline: Pipeline, embeddings: np.array) -> np.array:
     Returns:
         numpy.array: array of labels predictions, of the same length
     """
+    if getattr(pipeline, "compiled_mlp", None) is not None:
+        return pipeline.compiled_mlp.predict(embeddings)
+    elif "classifier_technical" in pipeline.named_steps:
+        return np.concatenate(
+            (
+                pipeline["classifier_technical"].predict(embeddings),
+                pipeline["classifier_transverse"].predict(embeddings),
+            ),
+            axis=1,
+        )
     y = pipeline["classifier"].predict(embeddings)
-    if "binarizer" in pipeline:
+    if "binarizer" in pipeline.named_steps:
         id_labels = pipeline["binarizer"].inverse_transform(y)
         return id_labels
     else:
@@ -300,74 +356,99 @@ def classify_topics_one_letter(
     return db_predictions
 
 
-def classify_topics(pipeline: Pipeline, letters_df: pd.DataFrame) -> pd.DataFrame:
+def sentencize_letters(
+    nlp: spacy.language.Language, letters_df: pd.DataFrame, bounds: pd.DataFrame
+) -> List[List[Tuple[str, int, int]]]:
     """
-    This function is used for the generation/filling of the predictions database
-    It uses the table of letters ("lettres de suites"), cut the texts into sentences,
-    and predict labels for each sentence using a trained NLP model
-
-    This function is not optimized to predict heavy volumes of data
-
-    This operation results in a new pandas.DataFrame that is returned
+    Cut the texts of the letters into sentences, in a batch
 
     Args:
-        pipeline (Pipeline): must contain a `classifier`, and may also contain a `binarizer`
-        letters_df (pd.DataFrame): structured as the table `ape_letters`
+        nlp (spacy.language.Language): the sentencizer
+        letters_df (pd.DataFrame): structured as the table `ape_letters`, with at least `id_letter` and `text`
+        bounds (pd.DataFrame): the bounds of the sections, as returned by `section_bounds`
 
     Returns:
-        pd.DataFrame: a table with the 6 columns "id_letter", "sentence",
-            "id_label", "terms", "start", "end"
+        list[list[tuple]]: for every letter, the (sentence, start, end) of its sentences
     """
-
-    nlp = prepare_sentencizer()
     n = len(letters_df)
-    letter_k = 1
-    data = []
+    # the text between the beginning of the first saved section (generally the synthesis)
+    # and the end of the last saved section (generally the observations), or the whole
+    # text if no section bounds were found for this letter
+    bounds = letters_bounds(letters_df, bounds)
+    id_letters = letters_df.id_letter.values
+    starts = bounds["start"].values
+    texts = [
+        (text or "")[start:end]
+        for text, start, end in zip(letters_df.text.values, starts, bounds["end"].values)
+    ]
 
-    with SessionWrapper() as db:
-        sections_df = import_objects_in_pandas(SiancedbSection, db)
-        sections_df = sections_df[
-            sections_df.id_letter.isin(letters_df.id_letter.values)
-        ]
+    # `letters_sentences[k]` holds the (sentence, start, end) of the k-th letter
+    letters_sentences = []
+    for k, doc in enumerate(nlp.pipe(texts, batch_size=64)):
+        logger.info(
+            "Sentencizing letter {}/{} -- id {}".format(k + 1, n, id_letters[k])
+        )
+        letters_sentences.append(
+            [
+                (sent.text, sent.start_char + starts[k], sent.end_char + starts[k])
+                for sent in doc.sents
+            ]
+        )
+    return letters_sentences
 
-    for id_letter, row in letters_df.set_index("id_letter").iterrows():
-        logger.info("Predicting letter {}/{} -- id {}".format(letter_k, n, id_letter))
-        letter_k += 1
 
-        # find the beginning of the first saved section (generally the synthesis)
-        # and the end of the last saved session (generally the observations)
-        try:
-            bounds = sections_df[(sections_df.id_letter == id_letter)][["start", "end"]]
-            start, end = bounds["start"].min(), bounds["end"].max()
-            text = row["text"]
-            text = text[start:end]
-        except TypeError:
-            # exception if no section bounds were found for this letter
-            start = 0
-            text = row["text"]
-
-        doc = nlp(text)  # field name to be changed
-        # doc.sents is a generator. The lines below stores information in arrays
-        sentences, sent_starts, sent_ends = [], [], []
-        for sent in doc.sents:
-            sentences.append(sent.text)
-            sent_starts.append(sent.start_char + start)
-            sent_ends.append(sent.end_char + start)
-        # `predicted_labels` is a list of list of labels (one cell per sentence and per predicted label)
+def classify_letters(
+    classify: Callable, inputs, letters_sentences: List[List], id_letters: Iterable[int]
+) -> List:
+    """
+    Classify the sentences of all the letters at once, or letter by letter if the batch fails
+
+    Args:
+        classify (Callable): the function predicting the labels of a slice of `inputs`
+        inputs: the sentences (or their embeddings) of all the letters, in order
+        letters_sentences (list[list]): the sentences of every letter
+        id_letters (Iterable[int]): the id of every letter
+
+    Returns:
+        list: the predicted labels of every sentence (empty for the letters that could not be classified)
+    """
+    # `predicted_labels` is a list of list of labels (one cell per sentence and per predicted label)
+    try:
+        return list(classify(inputs)) if len(inputs) > 0 else []
+    except Exception as e:
+        logger.debug(f"An exception occurred while predicting classes on a batch : {e}")
+    predicted_labels = []
+    position = 0
+    for id_letter, one_letter in zip(id_letters, letters_sentences):
+        letter_inputs = inputs[position : position + len(one_letter)]
+        position += len(one_letter)
         try:
-            predicted_labels = classify_sentences(pipeline, sentences)
+            predicted_labels.extend(classify(letter_inputs))
         except Exception as e:
             logger.debug(
                 f"An exception occurred while predicting classes on the letter {id_letter} : {e}"
             )
-            predicted_labels = [[]] * len(sentences)
+            predicted_labels.extend([[]] * len(one_letter))
+    return predicted_labels
 
+
+def predictions_frame(
+    id_letters: Iterable[int], letters_sentences: List[List], predicted_labels: List
+) -> pd.DataFrame:
+    """
+    The table of the predicted labels, with one row per sentence and per label
+
+    Returns:
+        pd.DataFrame: a table with the 5 columns "id_letter", "sentence",
+            "id_label", "start", "end"
+    """
+    data = []
+    position = 0
+    for id_letter, one_letter in zip(id_letters, letters_sentences):
         predictions_count = 0
-        for k in range(len(sentences)):
-            id_labels_one_sentence = predicted_labels[k]
-            sentence = sentences[k]
-            start = sent_starts[k]
-            end = sent_ends[k]
+        for sentence, start, end in one_letter:
+            id_labels_one_sentence = predicted_labels[position]
+            position += 1
             if not isinstance(id_labels_one_sentence, Iterable):
                 id_labels_one_sentence = [id_labels_one_sentence]
             for id_label in id_labels_one_sentence:
@@ -383,7 +464,7 @@ def classify_topics(pipeline: Pipeline, letters_df: pd.DataFrame) -> pd.DataFram
                 )
         logger.info(
             "Predict {} labels in the letter with id {}".format(
-                predictions_count, n, id_letter
+                predictions_count, id_letter
             )
         )
 
@@ -400,23 +481,54 @@ def classify_topics(pipeline: Pipeline, letters_df: pd.DataFrame) -> pd.DataFram
     )  # .drop_duplicates()
 
 
-def prepare_features_labels(
-    multi_output: bool = True,
-) -> Tuple[np.array, np.array, Dict, Dict]:
+def classify_topics(
+    pipeline: Pipeline, letters_df: pd.DataFrame, bounds: pd.DataFrame = None
+) -> pd.DataFrame:
     """
-    Return the features and the target to use to train multi-output classifiers
+    This function is used for the generation/filling of the predictions database
+    It uses the table of letters ("lettres de suites"), cut the texts into sentences,
+    and predict labels for each sentence using a trained NLP model
+
+    The letters are sentencized in a batch and the sentences of all of them are
+    classified at once (letter by letter only if the batch fails)
+
+    This operation results in a new pandas.DataFrame that is returned
 
     Args:
-        multi_output (bool): boolean specifying if labels should be grouped by the sentences they tag,
-        for multi-output classifier training
+        pipeline (Pipeline): must contain a `classifier`, and may also contain a `binarizer`
+        letters_df (pd.DataFrame): structured as the table `ape_letters`
+        bounds (pd.DataFrame, Optional): the bounds of the sections, as returned by `section_bounds`.
+            Loaded from the database for the letters of `letters_df` if missing
 
     Returns:
-        numpy.array[float] (2 dimensions), numpy.array[list[int]], dict[int, str] :
-            the embeddings of training sentences,
-            the array of labels (for each sentence, give the list of corresponding labels),
+        pd.DataFrame: a table with the 5 columns "id_letter", "sentence",
+            "id_label", "start", "end"
+    """
+
+    nlp = prepare_sentencizer()
+
+    if bounds is None:
+        with SessionWrapper() as db:
+            bounds = load_section_bounds(db, letters_df.id_letter.values)
+    id_letters = letters_df.id_letter.values
+    letters_sentences = sentencize_letters(nlp, letters_df, bounds)
+
+    sentences = [sentence for one_letter in letters_sentences for sentence, _, _ in one_letter]
+    predicted_labels = classify_letters(
+        lambda batch: classify_sentences(pipeline, batch),
+        sentences,
+        letters_sentences,
+        id_letters,
+    )
+    return predictions_frame(id_letters, letters_sentences, predicted_labels)
+
+
+def prepare_labels_dicts() -> Tuple[Dict, Dict]:
+    """
+    Returns:
+        dict[int, str], dict[int, bool]:
             a dictionary where a key is `id_label` and value is the name of the category it belongs to
             a dictionary where a key is `id_label` and value is a boolean specifying if the id_label is "transverse"
-
     """
     with SessionWrapper() as db:
         labels_df = import_objects_in_pandas(SiancedbLabel, db)
@@ -429,21 +541,37 @@ def prepare_features_labels(
     labels_transverse = {
         id_label: v["is_transverse"] for id_label, v in labels_dict.items()
     }
+    return labels_hierarchy, labels_transverse
+
+
+def prepare_features_labels(
+    multi_output: bool = True,
+) -> Tuple[np.array, np.array, Dict, Dict]:
+    """
+    Return the features and the target to use to train multi-output classifiers
+
+    Args:
+        multi_output (bool): boolean specifying if labels should be grouped by the sentences they tag,
+        for multi-output classifier training
+
+    Returns:
+        numpy.array[float] (2 dimensions), numpy.array[list[int]], dict[int, str] :
+            the embeddings of training sentences (memory-mapped for multi-output classifiers),
+            the array of labels (for each sentence, give the list of corresponding labels),
+            a dictionary where a key is `id_label` and value is the name of the category it belongs to
+            a dictionary where a key is `id_label` and value is a boolean specifying if the id_label is "transverse"
+
+    """
+    labels_hierarchy, labels_transverse = prepare_labels_dicts()
 
     # at this point a key is a label id (int), and a value becomes a category name (str)
 
-    basepath = get_config()["learning"]["precomputed"]
+    store = training_store()
     if multi_output:
-        features = np.load(os.path.join(basepath, "multi_output_embeddings.npy"))
-        multi_id_labels = np.load(
-            os.path.join(basepath, "multi_output_labels.npy"), allow_pickle=True
-        )
+        features, multi_id_labels, _ = store.multi_output()
         return features, multi_id_labels, labels_hierarchy, labels_transverse
     else:
-        features = np.load(os.path.join(basepath, "mono_output_embeddings.npy"))
-        id_labels = np.reshape(
-            np.load(os.path.join(basepath, "mono_output_labels.npy")), (-1, 1)
-        )
+        features, id_labels, _ = store.mono_output()
         return features, id_labels, labels_hierarchy, labels_transverse
 
 
@@ -478,6 +606,35 @@ def build_new_model(
         top_n=top_n,
     )
 
+    register_model(
+        pipeline,
+        x,
+        y,
+        labels_hierarchy,
+        name=name,
+        model_path=model_path,
+        multi_output=architecture == "multi-output",
+        last_id_annotation=training_store().last_id_annotation(),
+    )
+
+
+def register_model(
+    pipeline: Pipeline,
+    x: np.array,
+    y: np.array,
+    labels_hierarchy: Dict,
+    name: str,
+    model_path: str,
+    multi_output: bool,
+    last_id_annotation: int = None,
+    parent_id_model: int = None,
+) -> Tuple[SiancedbModel, float, float]:
+    """
+    Evaluate a trained pipeline on the training set and store it as a new (inactive) SiancedbModel
+
+    Returns:
+        SiancedbModel, float, float: the new model, its precision and its recall on the training set
+    """
     # compute predictions on evaluation set. Here we evaluate on the training set itself (the cross-validation has been
     # previously performed in more academical conditions) to store these training metrics for comparison purposes
 
@@ -498,13 +655,183 @@ def build_new_model(
         id_labels=unique_labels,
         score_labels=score_labels,
         score=precision,
-        is_multi_output=architecture == "multi-output",
+        is_multi_output=multi_output,
         is_active=False,
         user=1,  # test user in database
+        parent_id_model=parent_id_model,
+        last_id_annotation=last_id_annotation,
     )
     with SessionWrapper() as db:
         db.add(siance_model)
         db.commit()
+        db.refresh(siance_model)
+    return siance_model, precision, recall
+
+
+def architecture_of(pipeline: Pipeline) -> str:
+    """
+    The architecture (as in `prepare_classifier`) of a refreshable pipeline
+    """
+    if "binarizer" in pipeline.named_steps:
+        return "multi-output"
+    elif isinstance(pipeline["classifier"], GridSearchCV):
+        return "grid-search"
+    return "basic"
+
+
+def refresh_model(
+    id_model: int = None, compare_with_full_retrain: bool = False
+) -> Dict[str, float]:
+    """
+    Create a new model from a previous one with the annotations added since it was trained: only the new
+    training sentences are embedded, and the classifier of the previous model continues its training on them
+    (see `siancebackend.classifiers.incremental`). The new model keeps its lineage and is not activated
+
+    Args:
+        id_model (int, Optional): the model to refresh, defaults to the active model
+        compare_with_full_retrain (bool, Optional): also train a model from scratch (not saved)
+            to report the difference of quality between both
+
+    Returns:
+        dict: the `id_model` of the new model, the numbers of new and replayed samples, the training time,
+            the precision and the recall on the training set, and those of the full retrain if asked
+    """
+    id_model = get_active_model_id() if id_model is None else id_model
+    with SessionWrapper() as db:
+        parent = db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).one()
+    if parent.last_id_annotation is None:
+        raise ValueError(
+            f"The training set of the model {parent.id_model} is unknown, train a new model instead"
+        )
+    multi_output = bool(parent.is_multi_output)
+
+    time_refresh = time.time()
+    store = update_training_embeddings()
+    x, y, last_ids = store.multi_output() if multi_output else store.mono_output()
+    labels_hierarchy, _ = prepare_labels_dicts()
+    new_rows = np.flatnonzero(last_ids > parent.last_id_annotation)
+    if len(new_rows) == 0:
+        logger.info(f"No annotation since the model {parent.id_model} was trained")
+        return {"id_model": parent.id_model, "new_samples": 0}
+    replayed = replay_rows(len(x), new_rows)
+    rows = np.sort(np.concatenate([new_rows, replayed]))
+
+    with open(parent.link, "rb") as file:
+        pipeline = pickle.load(file)
+    partial_fit_pipeline(pipeline, x[rows], y[rows])
+    refresh_time = time.time() - time_refresh
+    logger.info(
+        f"Refreshed the model {parent.id_model} with {len(new_rows)} new and "
+        f"{len(replayed)} replayed samples in {refresh_time:.2f}s"
+    )
+
+    date_str = date.today().__str__()
+    model_path = os.path.join(
+        get_config()["learning"]["topics_models"],
+        "{}_refresh_{}_pipeline.pkl".format(date_str, parent.id_model),
+    )
+    with open(model_path, "wb") as file:
+        pickle.dump(pipeline, file)
+    if multi_output:
+        compile_pipeline(pipeline, compiled_path(model_path))
+        pipeline = load_compiled(pipeline, model_path)
+    siance_model, precision, recall = register_model(
+        pipeline,
+        x,
+        y,
+        labels_hierarchy,
+        name=date_str + "_refreshed_model",
+        model_path=model_path,
+        multi_output=multi_output,
+        last_id_annotation=store.last_id_annotation(),
+        parent_id_model=parent.id_model,
+    )
+    report = {
+        "id_model": siance_model.id_model,
+        "new_samples": len(new_rows),
+        "replayed_samples": len(replayed),
+        "training_time": refresh_time,
+        "precision": precision,
+        "recall": recall,
+    }
+
+    if compare_with_full_retrain:
+        directory = tempfile.mkdtemp(prefix="siance-retrain-")
+        try:
+            time_full = time.time()
+            full_pipeline = train_save_pipeline_from_embeddings(
+                os.path.join(directory, "pipeline.pkl"),
+                architecture_of(pipeline),
+                embeddings=x,
+                id_labels=y,
+            )
+            report["full_training_time"] = time.time() - time_full
+            full_pipeline = load_compiled(full_pipeline, os.path.join(directory, "pipeline.pkl"))
+            _, _, full_precision, full_recall = evaluate_every_class(
+                y, classify_embeddings(full_pipeline, x)
+            )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        report.update(
+            full_precision=full_precision,
+            full_recall=full_recall,
+            delta_precision=precision - full_precision,
+            delta_recall=recall - full_recall,
+        )
+    logger.info(f"Refresh of the model {parent.id_model}: {report}")
+    return report
+
+
+def load_evaluation_set(db: Session, id_model: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The annotations of the training set and the predictions of a model on the same sentences.
+    A prediction is linked to an annotation by the name of its letter, its start and its end
+
+    Args:
+        db (Session): a session to the database
+        id_model (int): the unique id of the model
+
+    Returns:
+        pd.DataFrame, pd.DataFrame: the annotations (name, start, end, sentence, id_label) of the sentences
+            predicted by the model, and its predictions (name, start, end, id_label) on annotated sentences
+    """
+    predicted = exists().where(
+        and_(
+            SiancedbPrediction.id_model == id_model,
+            SiancedbPrediction.id_letter == SiancedbLetter.id_letter,
+            SiancedbLetter.name == SiancedbTraining.name,
+            SiancedbPrediction.start == SiancedbTraining.start,
+            SiancedbPrediction.end == SiancedbTraining.end,
+        )
+    )
+    training_query = db.query(
+        SiancedbTraining.name,
+        SiancedbTraining.start,
+        SiancedbTraining.end,
+        SiancedbTraining.sentence,
+        SiancedbTraining.id_label,
+    ).filter(predicted)
+    annotated = exists().where(
+        and_(
+            SiancedbTraining.name == SiancedbLetter.name,
+            SiancedbTraining.start == SiancedbPrediction.start,
+            SiancedbTraining.end == SiancedbPrediction.end,
+        )
+    )
+    predictions_query = (
+        db.query(
+            SiancedbLetter.name,
+            SiancedbPrediction.start,
+            SiancedbPrediction.end,
+            SiancedbPrediction.id_label,
+        )
+        .join(SiancedbLetter, SiancedbLetter.id_letter == SiancedbPrediction.id_letter)
+        .filter(SiancedbPrediction.id_model == id_model, annotated)
+    )
+    return (
+        pd.read_sql(training_query.statement, db.bind),
+        pd.read_sql(predictions_query.statement, db.bind),
+    )
 
 
 def evaluate_model_with_id_model(id_model: int) -> Tuple[float, float, float]:
@@ -521,33 +848,23 @@ def evaluate_model_with_id_model(id_model: int) -> Tuple[float, float, float]:
         (or sort of precision and recall in the case of multi-output model)
     """
     with SessionWrapper() as db:
-        training_df = import_objects_in_pandas(SiancedbTraining, db)
-        predictions_df = import_objects_in_pandas(SiancedbPrediction, db)
-        predictions_df = predictions_df[
-            predictions_df.apply(
-                lambda row: int(row["id_model"]) == int(id_model), axis=1
-            )
-        ]
+        training_df, predictions_df = load_evaluation_set(db, id_model)
         model = db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).one()
         model_name = model.name
 
     # keep only the predicted sentences for which there is a match between annotated training set and testing set
-    tmp_df = pd.merge(
-        training_df,
-        predictions_df,
-        on=["id_letter", "start", "end"],
-        how="inner",
-        suffixes=["_train", "_test"],
+    # (done in SQL), and give every sentence a row in the indicator matrices of the labels
+    keys = ["name", "start", "end"]
+    sentences_df = training_df.drop_duplicates(keys).reset_index(drop=True)
+    sentences_index = pd.MultiIndex.from_frame(sentences_df[keys])
+    y_true, y_pred, classes = label_indicators_from_pairs(
+        sentences_index.get_indexer(pd.MultiIndex.from_frame(training_df[keys])),
+        training_df.id_label.values,
+        sentences_index.get_indexer(pd.MultiIndex.from_frame(predictions_df[keys])),
+        predictions_df.id_label.values,
+        n_samples=len(sentences_df),
     )
-    # by construction, the three list `sentences`, `y_true`, `y_pred` are aligned
-    tmp_group = tmp_df.groupby(["id_letter", "start", "end"])
-    sentences = tmp_group["sentence_train"].first()
-    y_true = tmp_group["id_label_train"].apply(list).values
-    y_pred = tmp_group["id_label_test"].apply(list).values
-    del tmp_df, tmp_group
-    # due to join, there are artificial duplicates. Remove them
-    y_true = [list(set(labels)) for labels in y_true]
-    y_pred = [list(set(labels)) for labels in y_pred]
+    del training_df, predictions_df
 
     # save output of model in excel for analysis
     evaluation_filename = model_name + ".xlsx"
@@ -555,84 +872,149 @@ def evaluate_model_with_id_model(id_model: int) -> Tuple[float, float, float]:
         get_config()["learning"]["evaluations"], evaluation_filename
     )
     pd.DataFrame(
-        data={"sentence": sentences, "ground truth": y_true, "predictions": y_pred}
+        data={
+            "sentence": sentences_df.sentence.values,
+            "ground truth": indicator_lists(y_true, classes),
+            "predictions": indicator_lists(y_pred, classes),
+        }
     ).to_excel(evaluation_path, index=False)
 
     # compute a precision and a recall for every class, and also a general precision and a general recall
     # using metrics from the submodule `evaluate_classifier`
-    precisions_dict, recall_dict, precision, recall = evaluate_every_class(
-        y_true, y_pred
+    precisions_dict, recall_dict, precision, recall = scores_from_counts(
+        classes, *label_counts(y_true, y_pred)
     )
-    accuracy = accuracy_score(y_true, y_pred)
+    accuracy = subset_accuracy(y_true, y_pred)
 
     # below: former function computing a precision and a recall for the model
     # precision, recall = evaluate_multi_output_classifier(y_true, y_pred)
     print(
-        f"Evaluation of model (id_model {id_model}) on {len(sentences)} sentences:"
+        f"Evaluation of model (id_model {id_model}) on {len(sentences_df)} sentences:"
         f" precision={precision}, recall={recall}, accuracy={accuracy}"
         f"Detailed recall scores is: {recall_dict}"
     )
     return precision, recall, accuracy
 
 
-def build_predictions(db: Session, siance_model: SiancedbModel, pipe_logger=None):
+def letters_without_predictions(db: Session, id_model: int, *entities):
+    """
+    Query the letters having no prediction made by the model `id_model`
+       (predictions may have been done through other models), with an anti-join `NOT EXISTS`
+
+    Args:
+        db (Session): a Session to connect to the database
+        id_model (int): the model whose predictions are missing
+        *entities: the selected columns or entities, `id_letter` and `text` by default
+    """
+    predicted = exists().where(
+        and_(
+            SiancedbPrediction.id_letter == SiancedbLetter.id_letter,
+            SiancedbPrediction.id_model == int(id_model),
+        )
+    )
+    entities = entities or (SiancedbLetter.id_letter, SiancedbLetter.text)
+    return db.query(*entities).filter(~predicted)
+
+
+def stream_letters_without_predictions(
+    db: Session,
+    id_model: int,
+    limit: int = None,
+    order_by=SiancedbLetter.id_letter,
+    batch_size: int = 500,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Stream the `(id_letter, text)` of the letters having no prediction made by the model `id_model`,
+    `batch_size` rows at a time, so that the memory does not grow with the number of letters.
+
+    The session must not be committed while streaming: use another session to write the predictions
+
+    Args:
+        db (Session): a Session to connect to the database, used only for reading
+        id_model (int): the model whose predictions are missing
+        limit (int, Optional): the maximal number of letters
+        order_by (Optional): the ordering of the letters, by `id_letter` by default
+        batch_size (int, Optional): the number of rows fetched at once
+    """
+    query = letters_without_predictions(db, id_model).order_by(order_by)
+    if limit is not None:
+        query = query.limit(limit)
+    return (tuple(row) for row in query.yield_per(batch_size))
+
+
+def count_letters_without_predictions(db: Session, id_model: int, limit: int = None) -> int:
+    count = letters_without_predictions(db, id_model).count()
+    return count if limit is None else min(count, limit)
+
+
+def predict_letters_chunks(
+    siance_model: SiancedbModel, limit: int = None, chunk_size: int = 100, bounds=None
+) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Predict the letters having no prediction made by `siance_model`, by chunks of `chunk_size` letters
+
+    Yields:
+        int, pd.DataFrame: the number of letters of the chunk and their predictions, structured as
+            the table `ape_predictions`
+    """
+    pipeline = load_pipeline(siance_model.link)
+    score_dict = prepare_score_dict(siance_model)
+
+    with SessionWrapper() as reader:
+        letters = stream_letters_without_predictions(
+            reader, siance_model.id_model, limit=limit
+        )
+        for chunk in chunker(chunk_size, letters):
+            chunk_df = pd.DataFrame(list(chunk), columns=["id_letter", "text"])
+
+            logger.debug("Start new chunk of predictions")
+            predictions_df = classify_topics(pipeline, chunk_df, bounds=bounds)
+            predictions_df["id_model"] = siance_model.id_model
+
+            # add decision score in the predictions table, on the basis of the score per class saved in the model table
+            for id_label in predictions_df.id_label.unique():
+                predictions_df.loc[
+                    predictions_df.id_label == id_label, "decision_score"
+                ] = score_dict[id_label]
+            yield len(chunk_df), predictions_df
+
+
+def build_predictions(
+    db: Session, siance_model: SiancedbModel, pipe_logger=None, limit: int = None
+):
     """
     OLD FUNCTION THAT CAN BE CALLED THROUGH backend/bin BASH SCRIPTS.
     NOT CALLED BY PREFECT PIPELINE (the function called by prefect pipelines is `classify_topics_one_letter`)
 
     For all letters for which no predictions has been done with the input SianceModel
        (predictions may have been done through other models), cut the letter into sentences, classify them in `id_labels`,
-       and save the predictions in PostreSQL
+       and save the predictions in PostreSQL. The letters are streamed, so the first predictions
+       are written at once and the memory does not grow with the number of letters
 
     Args:
         db (Session): a Session to connect to the database
         siance_model (SiancedbModel): an object to identify a model and its output. Its attributes indicates
            the path of the model, the classes met during the training and the model performances on evaluation samples
         pipe_logger (SiancedbPipeline): an object logging in PostgreSQL the advancement of data ingestion steps
+        limit (int, Optional): the maximal number of letters to predict
     """
-    pipeline = load_pipeline(siance_model.link)
-
-    score_dict = {}
-    id_labels = siance_model.id_labels
-    score_labels = siance_model.score_labels
-    if score_labels is not None:
-        for k, id_label in enumerate(id_labels):
-            score_dict[id_label] = score_labels[k]
-
     predictions_count = 0
-
-    query = db.query(SiancedbLetter).filter(
-        ~SiancedbLetter.predictions_dyn.any(
-            SiancedbPrediction.id_model == siance_model.id_model
-        )
-    )
-    letters = query.all()
-    n_documents = query.count()
+    n_documents = count_letters_without_predictions(db, siance_model.id_model, limit)
+    bounds = load_section_bounds(db)
 
     letters_count = 0
-    for chunk in chunker(100, letters):
-
-        chunk_df = pd.DataFrame(
-            [(letter.id_letter, letter.text) for letter in chunk],
-            columns=["id_letter", "text"],
-        )
-        letters_count += len(chunk_df)
-
-        logger.debug("Start new chunk of predictions")
-        predictions_df = classify_topics(pipeline, chunk_df)
-        predictions_df["id_model"] = siance_model.id_model
-
-        # add decision score in the predictions table, on the basis of the score per class saved in the model table
-        for id_label in predictions_df.id_label.unique():
-            predictions_df.loc[
-                predictions_df.id_label == id_label, "decision_score"
-            ] = score_dict[id_label]
+    for chunk_count, predictions_df in predict_letters_chunks(
+        siance_model, limit=limit, bounds=bounds
+    ):
+        letters_count += chunk_count
         write_from_pandas(predictions_df, SiancedbPrediction, db)
         predictions_count += len(predictions_df)
         logger.debug("Committed new chunk of predictions")
 
         update_log_state(
-            pipe=pipe_logger, progress=letters_count / n_documents, step="predictions"
+            pipe=pipe_logger,
+            progress=letters_count / max(n_documents, 1),
+            step="predictions",
         )
 
     logger.debug(
@@ -641,10 +1023,10 @@ def build_predictions(db: Session, siance_model: SiancedbModel, pipe_logger=None
 
 
 def build_predictions_with_id_model(
-    db: Session, id_model: int, pipe_logger: SiancedbPipeline = None
+    db: Session, id_model: int, pipe_logger: SiancedbPipeline = None, limit: int = None
 ):
     model = db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).one()
-    build_predictions(db, model, pipe_logger=pipe_logger)
+    build_predictions(db, model, pipe_logger=pipe_logger, limit=limit)
 
 
 def build_predictions_with_model_name(
@@ -654,65 +1036,35 @@ def build_predictions_with_model_name(
     build_predictions(db, model, pipe_logger=pipe_logger)
 
 
-def predict_last_letters_with_model(siance_model: SiancedbModel) -> pd.DataFrame:
-    id_labels = siance_model.id_labels
-    score_labels = siance_model.score_labels
-
-    with SessionWrapper() as db:
-        previous_predicted_letters = (
-            db.query(SiancedbPrediction.id_letter)
-            .distinct(SiancedbPrediction.id_letter)
-            .filter(SiancedbPrediction.id_model == siance_model.id_model)
-            .all()
-        )
-        # turn the generator of letters into a list of id_letters
-        previous_predicted_letters = [
-            letter[0] for letter in previous_predicted_letters
-        ]
-        letters_df = import_objects_in_pandas(SiancedbLetter, db)
-        # select only the letters for which there is no predictions generated with desired model (id_model)
-    letters_df = letters_df[
-        letters_df.apply(
-            lambda row: row.id_letter not in previous_predicted_letters, axis=1
-        )
-    ]
-    logger.debug(f"Begin predicting concepts for {len(letters_df)} new letters")
-    pipeline = load_pipeline(siance_model.link)
-    predictions_df = classify_topics(pipeline, letters_df)
-    predictions_df["id_model"] = siance_model.id_model
-
-    score_dict = {}
-    if score_labels is not None:
-        for k, id_label in enumerate(id_labels):
-            score_dict[id_label] = score_labels[k]
-
-    # add decision score in the predictions table, on the basis of the score per class saved in the model table
-    for id_label in predictions_df.id_label.unique():
-        predictions_df.loc[
-            predictions_df.id_label == id_label, "decision_score"
-        ] = score_dict[id_label]
-
+def predict_last_letters_with_model(siance_model: SiancedbModel) -> int:
+    """
+    Directly write predictions in database, chunk by chunk: the predictions
+    are not kept in memory, only their number is returned
+    """
+    logger.debug(f"Begin predicting concepts for new letters (id_model {siance_model.id_model})")
+    predictions_count = 0
     with SessionWrapper() as db:
-        write_from_pandas(predictions_df, SiancedbPrediction, db)
-        db.commit()
+        for _, predictions_df in predict_letters_chunks(siance_model):
+            write_from_pandas(predictions_df, SiancedbPrediction, db)
+            predictions_count += len(predictions_df)
     logger.debug(
-        f"Finished writing {len(predictions_df)} new entries in ape_predictions"
+        f"Finished writing {predictions_count} new entries in ape_predictions"
     )
-    return predictions_df
+    return predictions_count
 
 
-def predict_last_letters_with_id_model(id_model: int) -> pd.DataFrame:
+def predict_last_letters_with_id_model(id_model: int) -> int:
     """
-    Directly write predictions in database. Also return them for convenience.
+    Directly write predictions in database. Return the number of predictions written.
     """
     with SessionWrapper() as db:
         model = db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).one()
     return predict_last_letters_with_model(model)
 
 
-def predict_last_letters_with_model_name(model_name: str) -> pd.DataFrame:
+def predict_last_letters_with_model_name(model_name: str) -> int:
     """
-    Directly write predictions in database. Also return them for convenience.
+    Directly write predictions in database. Return the number of predictions written.
     """
     with SessionWrapper() as db:
         model = db.query(SiancedbModel).filter(SiancedbModel.name == model_name).one()
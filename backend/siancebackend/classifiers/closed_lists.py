@@ -3,6 +3,8 @@ import re
 import pandas as pd
 from collections.abc import Iterable
 
+from siancebackend.referentials import read_referential
+
 
 def get_keywords_dict():
     basepath = os.path.dirname(os.path.abspath(__file__))
@@ -11,7 +13,7 @@ def get_keywords_dict():
     )
     concept_column = "subcategory"
     terms_column = "terms"
-    df = pd.read_excel(path, index_col=None)[[concept_column, terms_column]].set_index(
+    df = read_referential(path, index_col=None)[[concept_column, terms_column]].set_index(
         terms_column
     )
     keyword_concept_dict = df.to_dict()[concept_column]
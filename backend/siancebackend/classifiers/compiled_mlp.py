@@ -0,0 +1,205 @@
+"""
+
+Compiled multi-output topic classifiers
+
+A multi-output pipeline is a `MultiLabelBinarizer` and a `OneVsRestClassifier`
+holding one small `MLPClassifier` per label: predicting with scikit-learn
+runs one forward pass per label, in float64. `compile_pipeline` stacks the
+weights of all these networks, so that a `CompiledMLP` predicts every label
+with a single matrix product per layer, in float32:
+- the first layers are concatenated into one (n_features, n_labels * n_hidden) matrix
+- the next layers are stacked into (n_labels, n_in, n_out) arrays multiplied in a batch
+
+The arrays are saved uncompressed in a `.npz` next to the pickle of the
+pipeline, and memory-mapped when loaded. A label is predicted when its
+logit is positive, which is the threshold 0.5 of scikit-learn on the
+logistic output.
+
+"""
+import os
+import struct
+import zipfile
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "logistic": lambda x: np.divide(1, 1 + np.exp(-x, out=x), out=x),
+}
+
+
+def compiled_path(model_path: str) -> str:
+    """
+    The path of the compiled classifier of the pipeline pickled in `model_path`
+    """
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def compile_pipeline(pipeline: Pipeline, path: str):
+    """
+    Save the stacked weights of a multi-output pipeline in the `.npz` file `path`
+
+    Args:
+        pipeline (Pipeline): a trained pipeline with a `binarizer` and a `classifier`,
+            a `OneVsRestClassifier` of `MLPClassifier` sharing the same layers sizes
+        path (str): the path of the `.npz` file
+    """
+    if "binarizer" not in pipeline.named_steps or not isinstance(
+        pipeline["classifier"], OneVsRestClassifier
+    ):
+        raise ValueError("Only the multi-output pipelines can be compiled")
+    estimators = pipeline["classifier"].estimators_
+    columns = [k for k, e in enumerate(estimators) if isinstance(e, MLPClassifier)]
+    # the labels always present or always missing in the training set have a constant predictor
+    always = np.array(
+        [
+            not isinstance(e, MLPClassifier) and bool(np.ravel(e.y_)[0] > 0.5)
+            for e in estimators
+        ]
+    )
+    mlps = [estimators[k] for k in columns]
+    if len(mlps) == 0:
+        raise ValueError("The pipeline has no MLPClassifier to compile")
+    shapes = {tuple(coef.shape for coef in mlp.coefs_) for mlp in mlps}
+    activations = {mlp.activation for mlp in mlps}
+    if len(shapes) > 1 or len(activations) > 1:
+        raise ValueError("The MLPClassifier of the pipeline have different architectures")
+    if any(mlp.out_activation_ != "logistic" for mlp in mlps):
+        raise ValueError("Only binary MLPClassifier can be compiled")
+
+    arrays = {
+        "labels": np.asarray(pipeline["binarizer"].classes_).astype(np.int64),
+        "columns": np.array(columns, dtype=np.int64),
+        "always": always,
+        "activation": np.array(activations.pop()),
+        # the first layer of every label in one matrix, and its biases
+        "coef_0": np.concatenate([mlp.coefs_[0] for mlp in mlps], axis=1),
+        "intercept_0": np.concatenate([mlp.intercepts_[0] for mlp in mlps]),
+    }
+    for layer in range(1, len(mlps[0].coefs_)):
+        arrays[f"coef_{layer}"] = np.stack([mlp.coefs_[layer] for mlp in mlps])
+        arrays[f"intercept_{layer}"] = np.stack([mlp.intercepts_[layer] for mlp in mlps])
+    for name, array in arrays.items():
+        if array.dtype == np.float64:
+            arrays[name] = array.astype(np.float32)
+
+    dir_name = os.path.dirname(path)
+    if dir_name and not os.path.exists(dir_name):
+        os.makedirs(dir_name, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def memmap_npz(path: str) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the arrays of an uncompressed `.npz` file (`np.load` reads them in memory)
+    """
+    arrays = dict()
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed in {path}")
+            # skip the local header of the member: 30 bytes, its name and its extra field
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            name = info.filename[: -len(".npy")]
+            if len(shape) == 0 or 0 in shape:
+                # np.memmap does not map empty arrays
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(file, dtype=dtype, count=count).reshape(shape)
+            else:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=dtype,
+                    mode="r",
+                    offset=file.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+    return arrays
+
+
+class CompiledMLP:
+    """
+    Predict the same label sets as a compiled multi-output pipeline
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.labels = np.asarray(arrays["labels"])
+        self.columns = np.asarray(arrays["columns"])
+        self.always = np.asarray(arrays["always"])
+        self.activation = ACTIVATIONS[str(np.asarray(arrays["activation"])[()])]
+        n_layers = len([name for name in arrays if name.startswith("coef_")])
+        self.coefs = [arrays[f"coef_{layer}"] for layer in range(n_layers)]
+        self.intercepts = [arrays[f"intercept_{layer}"] for layer in range(n_layers)]
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledMLP":
+        return cls(memmap_npz(path))
+
+    def decision_function(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        The logits of every compiled label, of shape (n_samples, n_columns)
+        """
+        x = np.asarray(embeddings, dtype=np.float32)
+        n_samples, n_columns = len(x), len(self.columns)
+        hidden = x @ self.coefs[0]
+        hidden += self.intercepts[0]
+        if len(self.coefs) == 1:
+            return hidden
+        self.activation(hidden)
+        # (n_samples, n_columns * n_hidden) -> (n_columns, n_samples, n_hidden)
+        hidden = hidden.reshape(n_samples, n_columns, -1).transpose(1, 0, 2)
+        for layer in range(1, len(self.coefs)):
+            hidden = np.matmul(hidden, self.coefs[layer])
+            hidden += self.intercepts[layer][:, None, :]
+            if layer < len(self.coefs) - 1:
+                self.activation(hidden)
+        return hidden[:, :, 0].T
+
+    def predict_indicator(self, embeddings: np.ndarray, batch_size: int = 1024) -> np.ndarray:
+        """
+        The boolean matrix of the predicted labels, of shape (n_samples, n_labels)
+        """
+        indicator = np.repeat(self.always[None, :], len(embeddings), axis=0)
+        for start in range(0, len(embeddings), batch_size):
+            batch = embeddings[start : start + batch_size]
+            indicator[start : start + len(batch), self.columns] = (
+                self.decision_function(batch) > 0
+            )
+        return indicator
+
+    def predict(self, embeddings: np.ndarray, batch_size: int = 1024) -> List[Tuple]:
+        """
+        The tuple of the predicted labels of every sample, as `MultiLabelBinarizer.inverse_transform`
+        """
+        if len(embeddings) == 0:
+            return []
+        rows, cols = np.nonzero(self.predict_indicator(embeddings, batch_size=batch_size))
+        splits = np.searchsorted(rows, np.arange(1, len(embeddings)))
+        return [tuple(labels) for labels in np.split(self.labels[cols], splits)]
+
+
+def load_compiled(pipeline: Pipeline, model_path: str) -> Pipeline:
+    """
+    Attach to the pipeline its compiled classifier as `compiled_mlp`,
+    if it was compiled after the pipeline was last saved
+    """
+    path = compiled_path(model_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(model_path):
+        pipeline.compiled_mlp = CompiledMLP.load(path)
+    return pipeline
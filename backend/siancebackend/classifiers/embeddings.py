@@ -1,15 +1,13 @@
 import numpy as np
+import pandas as pd
 from typing import Iterable
 import time
-import os
+from siancebackend.classifiers.training_store import TrainingStore
 from siancedb.config import get_config
 from siancedb.models import (
     SessionWrapper,
     SiancedbTraining,
 )
-from siancedb.pandas_writer import (
-    import_objects_in_pandas,
-)
 from sentence_transformers import SentenceTransformer
 
 # logger
@@ -18,7 +16,7 @@ import logging
 logger = logging.getLogger("embeddings")
 logger.setLevel(logging.DEBUG)
 # create file handler which logs even debug messages
-fh = logging.FileHandler("logs/embeddings.log")
+fh = logging.FileHandler("logs/embeddings.log", delay=True)
 
 
 def get_embeddings_sentences(sentences: Iterable[str]) -> np.array:
@@ -38,63 +36,51 @@ def get_embeddings_sentences(sentences: Iterable[str]) -> np.array:
     return embeddings
 
 
-def recompute_embeddings():
-    recompute_embeddings_mono_output()
-    recompute_embeddings_multi_output()
+def training_store() -> TrainingStore:
+    """
+    The store of the embeddings of the training sentences, in the `precomputed` folder
+    """
+    return TrainingStore(get_config()["learning"]["precomputed"])
 
 
-def recompute_embeddings_multi_output():
+def update_training_embeddings() -> TrainingStore:
     """
-    This function pre-compute embeddings for all the training sentences,
-    and save them at the dedicated location on the disk.
-    If the training set has been significantly modified, this function can be called
-    before training or evaluating new models.
+    Embed the training sentences annotated since the last update and add them to the training store
+    (see `siancebackend.classifiers.training_store`). The annotations deleted from ape_training
+    are also removed from the store
+
+    Returns:
+        TrainingStore: the updated store
     """
+    store = training_store()
+    last_id_annotation = store.last_id_annotation()
     with SessionWrapper() as db:
-        training_df = import_objects_in_pandas(SiancedbTraining, db)
-        # the `groupby` hereby is necessary to group labels defined on the same sentence
-        training_df = (
-            training_df.groupby(["name", "start", "end", "sentence"])["id_label"]
-            .apply(list)
-            .reset_index()  # the output DataFrame have columns id_label, name, start, end, sentence
+        id_annotations = [
+            id_annotation for (id_annotation,) in db.query(SiancedbTraining.id_annotation)
+        ]
+        training_df = pd.read_sql(
+            db.query(SiancedbTraining)
+            .filter(SiancedbTraining.id_annotation > last_id_annotation)
+            .statement,
+            db.bind,
         )
-        sentences = training_df.sentence.values
-        multi_id_labels = training_df.id_label.values
-        del training_df
-
-    # path of the folder where to save the regenerated embeddings
-    base_path = get_config()["learning"]["precomputed"]
+    removed = store.remove_annotations(id_annotations)
     time_embed = time.time()
-    embeddings = get_embeddings_sentences(sentences)
+    embedded = store.append(training_df, get_embeddings_sentences)
     logger.info(
-        "Time to create the required embeddings: {0:.2f}".format(
-            time.time() - time_embed
+        "{0} new annotations ({1} sentences embedded in {2:.2f}s), {3} removed".format(
+            len(training_df), embedded, time.time() - time_embed, removed
         )
     )
-    np.save(os.path.join(base_path, "multi_output_embeddings.npy"), embeddings)
-    np.save(os.path.join(base_path, "multi_output_labels.npy"), multi_id_labels)
+    return store
 
 
-def recompute_embeddings_mono_output():
+def recompute_embeddings(full: bool = False):
     """
-    This function pre-compute embeddings for all the training sentences,
+    This function pre-compute embeddings for the training sentences,
     and save them at the dedicated location on the disk.
-    If the training set has been significantly modified, this function can be called
-    before training or evaluating new models.
+    Only the sentences annotated since the last call are embedded, unless `full` is True
     """
-    with SessionWrapper() as db:
-        training_df = import_objects_in_pandas(SiancedbTraining, db)
-        sentences = training_df.sentence.values
-        id_labels = training_df.id_label.values
-        del training_df
-
-    basepath = get_config()["learning"]["precomputed"]
-    time_embed = time.time()
-    embeddings = get_embeddings_sentences(sentences)
-    logger.info(
-        "Time to create the required embeddings: {0:.2f}".format(
-            time.time() - time_embed
-        )
-    )
-    np.save(os.path.join(basepath, "mono_output_embeddings.npy"), embeddings)
-    np.save(os.path.join(basepath, "mono_output_labels.npy"), id_labels)
+    if full:
+        training_store().clear()
+    update_training_embeddings()
@@ -6,12 +6,215 @@ Example of use:
 >>> y_test = [[0], [1], [0]]
 >>> evaluate_multi_output_classifier(y_test, y_pred)
 
+The labels of the samples are binarized into two sparse (samples x labels) matrices
+sharing the same columns, and the true positives, false positives and false negatives
+of every label are sums of their columns. A label repeated for the same sample
+counts once.
+
 """
 
 from collections.abc import Iterable
+from itertools import chain
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
 from sklearn.metrics import recall_score, precision_score
 
 
+def flatten_labels(y) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The (sample, label) pairs of the labels of every sample
+
+    Args:
+        y (list[list[x]] or numpy.array): a label or a list of labels per sample
+
+    Returns:
+        numpy.array[int], numpy.array: the index of the sample and the label of every pair
+    """
+    if isinstance(y, np.ndarray) and y.dtype != object:
+        labels = y.reshape(len(y), -1)
+        return np.repeat(np.arange(len(y)), labels.shape[1]), labels.ravel()
+    try:
+        lengths = np.fromiter(map(len, y), dtype=np.int64, count=len(y))
+        labels = list(chain.from_iterable(y))
+    except TypeError:
+        # the casting below makes the function compatible with both mono-output and multi-output classifiers
+        y = [
+            sample_labels if isinstance(sample_labels, Iterable) else [sample_labels]
+            for sample_labels in y
+        ]
+        lengths = np.fromiter(map(len, y), dtype=np.int64, count=len(y))
+        labels = list(chain.from_iterable(y))
+    return (
+        np.repeat(np.arange(len(lengths)), lengths),
+        np.array(labels) if labels else np.array([], dtype=np.int64),
+    )
+
+
+def label_indicators_from_pairs(
+    true_samples: np.ndarray,
+    true_labels: np.ndarray,
+    pred_samples: np.ndarray,
+    pred_labels: np.ndarray,
+    n_samples: int,
+) -> Tuple[csr_matrix, csr_matrix, np.ndarray]:
+    """
+    Binarize the true and the predicted (sample, label) pairs
+
+    Returns:
+        csr_matrix, csr_matrix, numpy.array: the true and the predicted indicator matrices,
+            of shape (n_samples, n_labels), and the label of every column
+    """
+    codes, classes = pd.factorize(np.concatenate([true_labels, pred_labels]))
+    classes = np.asarray(classes)
+    matrices = []
+    for samples, columns in [
+        (true_samples, codes[: len(true_labels)]),
+        (pred_samples, codes[len(true_labels) :]),
+    ]:
+        matrix = csr_matrix(
+            (np.ones(len(samples), dtype=np.int64), (samples, columns)),
+            shape=(n_samples, len(classes)),
+        )
+        matrix.data[:] = 1
+        matrices.append(matrix)
+    return matrices[0], matrices[1], classes
+
+
+def label_indicators(y_test, y_pred) -> Tuple[csr_matrix, csr_matrix, np.ndarray]:
+    """
+    Binarize the true and the predicted labels of the samples (see `label_indicators_from_pairs`)
+    """
+    true_samples, true_labels = flatten_labels(y_test)
+    pred_samples, pred_labels = flatten_labels(y_pred)
+    return label_indicators_from_pairs(
+        true_samples, true_labels, pred_samples, pred_labels, n_samples=len(y_test)
+    )
+
+
+def label_counts(
+    y_true: csr_matrix, y_pred: csr_matrix
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The true positives, false positives and false negatives of every label (column)
+    """
+    true_positive = np.asarray(y_true.multiply(y_pred).sum(axis=0)).ravel()
+    false_positive = np.asarray(y_pred.sum(axis=0)).ravel() - true_positive
+    false_negative = np.asarray(y_true.sum(axis=0)).ravel() - true_positive
+    return true_positive, false_positive, false_negative
+
+
+def scores_from_counts(
+    classes: np.ndarray,
+    true_positive: np.ndarray,
+    false_positive: np.ndarray,
+    false_negative: np.ndarray,
+) -> Tuple[Dict, Dict, float, float]:
+    """
+    The precision and the recall of every label having true positives, and the overall precision and recall
+    """
+    found = np.flatnonzero(true_positive > 0)
+    labels = classes[found].tolist()
+    tp = true_positive[found]
+    precision_dict = dict(zip(labels, (tp / (tp + false_positive[found])).tolist()))
+    recall_dict = dict(zip(labels, (tp / (tp + false_negative[found])).tolist()))
+
+    true_positive = int(true_positive.sum())
+    recall = true_positive / (true_positive + int(false_negative.sum()))
+    precision = true_positive / (true_positive + int(false_positive.sum()))
+    return precision_dict, recall_dict, precision, recall
+
+
+def subset_accuracy(y_true: csr_matrix, y_pred: csr_matrix) -> float:
+    """
+    The share of samples whose predicted labels are exactly their true labels
+    """
+    difference = (y_true != y_pred).tocsr()
+    return float(np.mean(np.diff(difference.indptr) == 0)) if y_true.shape[0] else 0.0
+
+
+def indicator_lists(matrix: csr_matrix, classes: np.ndarray) -> List[List]:
+    """
+    The list of the labels of every row of an indicator matrix
+    """
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    return [
+        labels.tolist()
+        for labels in np.split(classes[matrix.indices], matrix.indptr[1:-1])
+    ]
+
+
+def agreement_counts(
+    reference_df: pd.DataFrame,
+    candidate_df: pd.DataFrame,
+    keys: Tuple[str, ...] = ("id_letter", "start", "end"),
+) -> Tuple[pd.DataFrame, int, int]:
+    """
+    Compare the labels predicted by two models on the same sentences
+
+    Only the sentences labelled by at least one of the models are compared
+
+    Args:
+        reference_df (pd.DataFrame): the predictions of the reference model, one row per sentence and label
+        candidate_df (pd.DataFrame): the predictions of the candidate model, with the same columns
+        keys (tuple[str]): the columns identifying a sentence
+
+    Returns:
+        pd.DataFrame, int, int: the number of sentences labelled by the reference, by the candidate and
+            by both models for every label (indexed by `id_label`), the number of compared sentences
+            and the number of sentences with exactly the same labels
+    """
+    keys = list(keys)
+    codes, sentences = pd.factorize(
+        pd.MultiIndex.from_frame(pd.concat([reference_df[keys], candidate_df[keys]]))
+    )
+    n_sentences = len(sentences)
+    if n_sentences == 0:
+        counts = pd.DataFrame(columns=["reference", "candidate", "both"], dtype=np.int64)
+        return counts.rename_axis("id_label"), 0, 0
+    y_reference, y_candidate, classes = label_indicators_from_pairs(
+        codes[: len(reference_df)],
+        reference_df.id_label.values,
+        codes[len(reference_df) :],
+        candidate_df.id_label.values,
+        n_samples=n_sentences,
+    )
+    both, candidate_only, reference_only = label_counts(y_reference, y_candidate)
+    counts = pd.DataFrame(
+        data={
+            "reference": both + reference_only,
+            "candidate": both + candidate_only,
+            "both": both,
+        },
+        index=pd.Index(classes, name="id_label"),
+    ).astype(np.int64)
+    identical = int(round(subset_accuracy(y_reference, y_candidate) * n_sentences))
+    return counts, n_sentences, identical
+
+
+def agreement_scores(counts: pd.DataFrame, n_sentences: int, identical: int) -> Dict:
+    """
+    Summarize the counts of `agreement_counts` (possibly summed over several batches),
+    taking the reference model as the ground truth
+
+    Returns:
+        dict: the precision and the recall of the candidate, the share of sentences with the
+            same labels, and the Jaccard index of the sentences of every label
+    """
+    both = int(counts.both.sum())
+    union = counts.reference + counts.candidate - counts.both
+    return {
+        "sentences": n_sentences,
+        "agreement": identical / n_sentences if n_sentences else None,
+        "precision": both / int(counts.candidate.sum()) if counts.candidate.sum() else None,
+        "recall": both / int(counts.reference.sum()) if counts.reference.sum() else None,
+        "jaccard": (counts.both / union.where(union > 0)).to_dict(),
+    }
+
+
 def evaluate_mono_output(y_true, y_pred):
     """
     The precision and the recall of the model.
@@ -39,50 +242,13 @@ def evaluate_every_class(y_test, y_pred):
     Args:
         y_test (list[list[x]]): list of list of labels (the length equals to the number of samples to classify)
         y_pred (list[list[x]]): list of list of labels (the length equals to the number of samples to classify)
-    """
-    true_positive_dict, false_positive_dict, false_negative_dict = {}, {}, {}
-    # loop on the external loop
-    for k, label_real_list in enumerate(y_test):
-        label_pred_list = y_pred[k]
-        # the casting below makes the function compatible with both mono-output and multi-output classifiers
-        if not isinstance(label_pred_list, Iterable):
-            label_pred_list = [label_pred_list]
-        if not isinstance(label_real_list, Iterable):
-            label_real_list = [label_real_list]
-        for label_real in label_real_list:
-            # if the real label was predicted, add it to the true positive dict. Otherwise it is a false negative
-            if label_real in label_pred_list:
-                true_positive_dict[label_real] = (
-                    true_positive_dict.get(label_real, 0) + 1
-                )
-            else:
-                false_negative_dict[label_real] = (
-                    false_negative_dict.get(label_real, 0) + 1
-                )
-        for label_pred in label_pred_list:
-            # the true positive case has already been treated. Check if is a false positive
-            if label_pred not in label_real_list:
-                false_positive_dict[label_pred] = (
-                    false_positive_dict.get(label_pred, 0) + 1
-                )
-
-    recall_dict, precision_dict = {}, {}
-    for label in true_positive_dict:
-        recall_dict[label] = true_positive_dict[label] / (
-            true_positive_dict[label] + false_negative_dict.get(label, 0)
-        )
-        precision_dict[label] = true_positive_dict[label] / (
-            true_positive_dict[label] + false_positive_dict.get(label, 0)
-        )
-
-    true_positive = sum([true_positive_dict[label] for label in true_positive_dict])
-    false_positive = sum([false_positive_dict[label] for label in false_positive_dict])
-    false_negative = sum([false_negative_dict[label] for label in false_negative_dict])
-
-    recall = true_positive / (true_positive + false_negative)
-    precision = true_positive / (true_positive + false_positive)
 
-    return precision_dict, recall_dict, precision, recall
+    Returns:
+        dict, dict, float, float: the precision and the recall of every label (having at least one true
+            positive), and the overall precision and recall
+    """
+    y_true, y_predicted, classes = label_indicators(y_test, y_pred)
+    return scores_from_counts(classes, *label_counts(y_true, y_predicted))
 
 
 def evaluate_multi_output_classifier(y_test, y_pred):
@@ -137,19 +303,10 @@ def evaluate_multi_output_classifier(y_test, y_pred):
         float: kind of recall score for multiclass multioutput
     """
     # true_positive = sum_sentences sum_GroundLabel  bool(label)
-    true_positive, false_positive, false_negative = 0, 0, 0
-    # loop on the external loop
-    for k, label_real_list in enumerate(y_test):
-        label_pred_list = y_pred[k]
-        true_positive += sum(
-            [(label_real in label_pred_list) for label_real in label_real_list]
-        )
-        false_negative += sum(
-            [(label_real not in label_pred_list) for label_real in label_real_list]
-        )
-        false_positive += sum(
-            [(label_pred not in label_real_list) for label_pred in label_pred_list]
-        )
+    y_true, y_predicted, _ = label_indicators(y_test, y_pred)
+    true_positive, false_positive, false_negative = (
+        int(counts.sum()) for counts in label_counts(y_true, y_predicted)
+    )
     recall = true_positive / (true_positive + false_negative)
     precision = true_positive / (true_positive + false_positive)
     return precision, recall
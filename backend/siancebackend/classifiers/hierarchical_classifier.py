@@ -2,10 +2,13 @@ import numpy as np
 from scipy.sparse import csr_matrix
 from typing import Dict, Tuple, List, Iterable
 from sklearn.base import BaseEstimator, clone
+from sklearn.exceptions import NotFittedError
 from sklearn.preprocessing import LabelBinarizer
 from sklearn_hierarchical_classification.classifier import HierarchicalClassifier
 from sklearn_hierarchical_classification.constants import ROOT
 
+from siancebackend.classifiers.training_scheduler import fit_parallel
+
 
 class HierarchicalCategoryClassifier(HierarchicalClassifier):
     """
@@ -60,6 +63,7 @@ class CustomHierarchicalCategoryClassifier(BaseEstimator):
         base_bottom_estimator: BaseEstimator,
         inverted_class_hierarchy: Dict,
         top_n: int = 1,
+        n_workers: int = None,
     ):
         """
         Initialize instance of hierarchical classifier
@@ -70,6 +74,8 @@ class CustomHierarchicalCategoryClassifier(BaseEstimator):
                 most probable `categories` predicted by the top level of the model. When equals to 1, it is a basic
                 classification. When > 1, there is a "safetynet" mechanism.
                 Defaults to 1.
+            n_workers (int, optional): the number of processes training the bottom classifiers.
+                Defaults to the `learning.training_workers` of the configuration.
         """
         class_hierarchy = {}
         for bottom, top in inverted_class_hierarchy.items():
@@ -82,6 +88,7 @@ class CustomHierarchicalCategoryClassifier(BaseEstimator):
         self.inverted_class_hierarchy = inverted_class_hierarchy
         self.encoder = LabelBinarizer(sparse_output=True)
         self.top_n = top_n
+        self.n_workers = n_workers
         self.top_classifier = base_top_estimator
         self.bottom_classifiers = {
             top: clone(base_bottom_estimator, safe=True) for top in class_hierarchy
@@ -97,21 +104,23 @@ class CustomHierarchicalCategoryClassifier(BaseEstimator):
             y_top
         )  # shape of `y_top`: (samples, size(encodings))
         self.top_classifier = self.top_classifier.fit(x, y_encoded)
-        # fit all classifiers of subcategories
+        # fit all classifiers of subcategories, in parallel
+        jobs = dict()
         for top_level_class in self.class_hierarchy:
-            mask = [
-                True if label in self.class_hierarchy[top_level_class] else False
-                for label in y_flat
-            ]
-            if len(y[mask]) > 0:
-                self.bottom_classifiers[top_level_class] = self.bottom_classifiers[
-                    top_level_class
-                ].fit(x[mask], y[mask])
+            rows = np.flatnonzero(np.isin(y_flat, self.class_hierarchy[top_level_class]))
+            if len(rows) > 0:
+                jobs[top_level_class] = (
+                    self.bottom_classifiers[top_level_class],
+                    rows,
+                    y[rows],
+                )
             else:
                 print(
                     f"There is no example for the category: {top_level_class}."
                     f" No specific classifier can be trained for it"
                 )
+        fitted, self.fit_times_ = fit_parallel(x, jobs, n_workers=self.n_workers)
+        self.bottom_classifiers.update(fitted)
         return self
 
     def predict(self, x: np.array) -> Iterable[int]:
@@ -138,38 +147,48 @@ def predict_top_level(
     """
     # `classes_` attribute gives the order of the classes in the output of `predict_proba` method
     probabilities = classifier.predict_proba(x)
-    best_probabilities = np.sort(-probabilities, axis=-1)[:, :top_n]
     ids_ranking = np.argsort(-probabilities, axis=-1)[:, :top_n]
+    best_probabilities = np.take_along_axis(probabilities, ids_ranking, axis=-1)
     # `ids_ranking` gives us indices of most probable classes. It must be turned into actual classes
-    classes_order = (
-        classifier.classes_
-    )  # sklearn attribute: order of class labels match the order in predict_proba
-    size_encodings = len(encoder.classes_)
-    classes_ranking = np.array(
-        [
-            [
-                classes_order[id_] for id_ in top_ids_one_sample
-            ]  # shape `classes_order`: (categories, size(encodings))
-            for top_ids_one_sample in ids_ranking
-        ]
-    )  # shape of `classes_ranking`: (samples, top_n))
+    # (sklearn attribute `classes_`: order of class labels match the order in predict_proba)
+    classes_ranking = np.asarray(classifier.classes_)[ids_ranking]
+    # Turn these actual classes into (categorical) class names understandable for the user,
+    # decoding the ranks of all the samples at once
+    # csr_matrix inputs: ((data, (row, col)), shape=(samples * top_n, size(encodings))
+    n_rows = classes_ranking.size
+    encoding_matrix = csr_matrix(
+        (np.ones(n_rows, dtype=int), (np.arange(n_rows), classes_ranking.ravel())),
+        shape=(n_rows, len(encoder.classes_)),
+    )
     # warning: dtype=object enables to have regular strings, while dtype=str only keeps the first character!
-    categories_ranking = np.zeros(shape=classes_ranking.shape, dtype=object)
-    # Turn these actual classes into (categorical) class names understandable for the user
-    for k in range(ids_ranking.shape[1]):
-        # csr_matrix inputs: ((data, (row, col)), shape=(samples, size(encodings))
-        encoding_matrix = csr_matrix(
-            (
-                np.ones(ids_ranking.shape[0], dtype=int),
-                (range(ids_ranking.shape[0]), classes_ranking[:, k]),
-            ),
-            shape=(ids_ranking.shape[0], size_encodings),
-        )
-        categories_ranking[:, k] = encoder.inverse_transform(
-            encoding_matrix
-        ).ravel()  # shape `categories_ranking`: (samples, top_n)
+    categories_ranking = np.empty(n_rows, dtype=object)
+    categories_ranking[:] = list(encoder.inverse_transform(encoding_matrix).ravel())
     # size of both output arrays: (number of samples, top_n)
-    return categories_ranking, best_probabilities
+    return categories_ranking.reshape(classes_ranking.shape), best_probabilities
+
+
+def predict_best_bottom(
+    x: np.array, top: object, bottom_classifiers: Dict[object, BaseEstimator]
+) -> Tuple[np.array, np.array]:
+    """
+    The most probable bottom level class of the top level class `top`, and its probability, for every sample.
+    The class is -1 and the probability 0 if no classifier has ever been trained on `top`
+    """
+    try:
+        bottom_classifier = bottom_classifiers[top]
+        # size: (len(x), nb of bottom classes for this top class)
+        bottom_probas = bottom_classifier.predict_proba(x)
+    except (KeyError, NotFittedError):
+        print(
+            f"Even though the model is supposed to be hierarchical, "
+            f"no classifier has ever been trained on the category {top}"
+        )
+        return np.full(len(x), -1, dtype=int), np.zeros(len(x))
+    best = np.argmax(bottom_probas, axis=-1)
+    return (
+        np.asarray(bottom_classifier.classes_)[best],
+        np.take_along_axis(bottom_probas, best[:, None], axis=-1).ravel(),
+    )
 
 
 def predict_with_safetynet(
@@ -183,6 +202,10 @@ def predict_with_safetynet(
     Hierarchically classify sentences in bottom level classes, using a "safety net" mechanism :
        the bottom level class is searched among the subclasses of the `top_n` most probable top level classes
 
+    The bottom level classifier of every top level class is called once, on the samples ranking it among
+    their `top_n` classes. For a sample, the score of a top level class is the probability of its best
+    bottom level class times its own probability, and the best candidate of the best score is predicted
+
     Args:
         x (np.array): the embeddings of the sentence to classify in categories
         top_classifier (BaseEstimator): a classifier trained for the top level classification task
@@ -195,75 +218,21 @@ def predict_with_safetynet(
     top_level_ranking, top_level_probabilities = predict_top_level(
         x, classifier=top_classifier, encoder=encoder, top_n=top_n
     )
-    y_pred = np.empty((len(x), 1), dtype=int)
-    if top_n == 1:
-        # for `conventional` predictions
-        for top in bottom_classifiers.keys():
-            mask = (top_level_ranking == top).ravel()
-            if len(x[mask]) > 0:
-                try:
-                    y_pred[mask] = np.reshape(
-                        bottom_classifiers[top].predict(x[mask]),
-                        (-1, 1),
-                    )
-                except KeyError:
-                    print(
-                        f"Even though the model is supposed to be hierarchical, "
-                        f"no classifier has ever been trained on the category {top}"
-                    )
-                    y_pred[mask] = -1
-    else:
-        # for `weighted` predictions with safety net
-        best_probabilities = np.zeros((len(x), top_n), dtype=float)
-        best_candidates = np.zeros((len(x), top_n), dtype=int)
-        # for every `top_n` most probable top level classes, give the most probable corresponding bottom level classes
-        # and the associated probability
-        
-        def score(bottom_score: float, top_score: float):
-            return bottom_score * top_score
-        
-        def score_probas(bottom_scores: np.array, top_probas: np.array):
-            # a = number of samples where 'top' class in a good candidate
-            # b = number of possible bottom classes for this 'top' class
-            a, b = bottom_scores.shape
-            a, = top_probas.shape
-            combined_scores = np.empty_like(bottom_scores, dtype=float)
-            for j in range(b):
-                combined_scores[:, j] = bottom_scores[:, j] * top_probas
-            return combined_scores
-
-            
-        
-        
-        for k in range(top_n):
-            for top in bottom_classifiers.keys():
-                mask = (top_level_ranking[:, k] == top).ravel() # the considered top classifier is ranked k-th
-                if len(x[mask]) > 0:
-                    bottom_probas = bottom_classifiers[top].predict_proba(x[mask]) # size: (len(x[mask]), nb of bottom classes for this top class)
-                    combined_probas = score_probas(
-                        bottom_probas,
-                        top_level_probabilities[:, k][mask]
-                    )
-                        
-                    """
-                    # `best_probabilities` gives the score of bottom level classification only
-                    
-                    best_probabilities[mask, k] = np.max(
-                        all_probas, axis=-1
-                    )
-                    """
-                    # `best_probabilities` combines scores of bottom and top level classifications
-                    best_probabilities[mask, k] = np.max(combined_probas, axis=-1)
-                    best_candidates[mask, k] = np.argmax(combined_probas, axis=-1)
-        # for every sample, indices gives the index of the best top level class among the top_n top level classes
-        # there are 2 solutions: either only considering the score of bottom level classification
-
-        indices = np.argmax(
-            best_probabilities, axis=-1
-        )  # shape of `indices` : (samples)
-        # TODO: put again the multiplication in score
-        y_pred = np.reshape(
-            [best_candidates[sample, indices[sample]] for sample in range(len(x))],
-            (-1, 1),
+    # for every `top_n` most probable top level classes, give the most probable corresponding bottom level classes
+    # and the combined score of bottom and top level classifications
+    best_probabilities = np.zeros((len(x), top_n), dtype=float)
+    best_candidates = np.full((len(x), top_n), -1, dtype=int)
+    for top in np.unique(top_level_ranking):
+        ranked = top_level_ranking == top  # shape: (samples, top_n)
+        rows = np.flatnonzero(ranked.any(axis=-1))
+        candidates, probabilities = predict_best_bottom(x[rows], top, bottom_classifiers)
+        ranked = ranked[rows]
+        best_probabilities[rows] = np.where(
+            ranked,
+            probabilities[:, None] * top_level_probabilities[rows],
+            best_probabilities[rows],
         )
-    return y_pred
+        best_candidates[rows] = np.where(ranked, candidates[:, None], best_candidates[rows])
+    # for every sample, `indices` gives the index of the best top level class among the top_n top level classes
+    indices = np.argmax(best_probabilities, axis=-1)  # shape of `indices` : (samples)
+    return np.take_along_axis(best_candidates, indices[:, None], axis=-1)
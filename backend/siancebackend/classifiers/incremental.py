@@ -0,0 +1,142 @@
+"""
+
+Incremental training of the topic classifiers
+
+Retraining a model from scratch after every few hundred annotations
+costs the embeddings of the whole training set and the fit of every
+network. A model can instead be refreshed from its parent: the sentences
+annotated since the parent was trained are added to the training store
+(`siancebackend.classifiers.training_store`), and the networks of the
+parent continue their training on these rows with `partial_fit`, mixed with a
+random sample of the rows the parent already saw (`replay_rows`) so that
+they do not forget them.
+
+The multi-output pipelines (one `MLPClassifier` per label) and the
+mono-output pipelines holding a `MLPClassifier` (possibly found by a
+`GridSearchCV`) can be refreshed. A label never seen by the parent
+cannot be added to it: it is ignored, and a model must be trained from
+scratch to learn it.
+
+Configuration (all optional, in the `learning` section):
+    incremental_epochs: passes over the new and replayed rows (default: 5)
+    incremental_replay: number of replayed rows per new row (default: 4)
+
+"""
+import logging
+from typing import Iterable
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.model_selection import GridSearchCV
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+
+from siancedb.config import get_config
+
+logger = logging.getLogger("incremental")
+logger.setLevel(logging.DEBUG)
+fh = logging.FileHandler("logs/incremental.log", delay=True)
+logger.addHandler(fh)
+
+
+def incremental_epochs() -> int:
+    return get_config().get("learning", dict()).get("incremental_epochs", 5)
+
+
+def incremental_replay() -> float:
+    return get_config().get("learning", dict()).get("incremental_replay", 4)
+
+
+def replay_rows(
+    n_rows: int, new_rows: np.ndarray, replay: float = None, random_state: int = 0
+) -> np.ndarray:
+    """
+    A random sample of the rows that are not new, `replay` times as many as the new rows
+
+    Args:
+        n_rows (int): the number of rows of the training matrices
+        new_rows (np.ndarray): the indices of the new rows
+        replay (float, Optional): the number of replayed rows per new row, defaults to `incremental_replay()`
+        random_state (int, Optional): the seed of the sample
+    """
+    replay = incremental_replay() if replay is None else replay
+    old_rows = np.setdiff1d(np.arange(n_rows), new_rows)
+    size = min(len(old_rows), int(round(replay * len(new_rows))))
+    rng = np.random.default_rng(random_state)
+    return np.sort(rng.choice(old_rows, size=size, replace=False))
+
+
+def partial_fit_mlp(
+    estimator: MLPClassifier,
+    x: np.ndarray,
+    y: np.ndarray,
+    epochs: int,
+    rng: np.random.Generator,
+):
+    for _ in range(epochs):
+        order = rng.permutation(len(x))
+        estimator.partial_fit(x[order], y[order])
+
+
+def partial_fit_pipeline(
+    pipeline: Pipeline,
+    x: np.ndarray,
+    id_labels: Iterable,
+    epochs: int = None,
+    random_state: int = 0,
+) -> Pipeline:
+    """
+    Continue the training of a pipeline on new samples
+
+    Args:
+        pipeline (Pipeline): a trained multi-output pipeline, or a mono-output pipeline
+            whose classifier is a `MLPClassifier` or a `GridSearchCV` of `MLPClassifier`
+        x (np.ndarray): the embeddings of the samples
+        id_labels (Iterable): the labels of every sample (a list per sample for a multi-output pipeline)
+        epochs (int, Optional): the number of passes over the samples, defaults to `incremental_epochs()`
+        random_state (int, Optional): the seed shuffling the samples at every pass
+
+    Returns:
+        Pipeline: the same pipeline, updated in place
+    """
+    epochs = incremental_epochs() if epochs is None else epochs
+    rng = np.random.default_rng(random_state)
+    x = np.asarray(x)
+    if "binarizer" in pipeline.named_steps and isinstance(
+        pipeline["classifier"], OneVsRestClassifier
+    ):
+        binarizer, classifier = pipeline["binarizer"], pipeline["classifier"]
+        known = set(binarizer.classes_)
+        id_labels = [list(labels) for labels in id_labels]
+        unknown = {label for labels in id_labels for label in labels} - known
+        if unknown:
+            logger.warning(f"Labels unknown to the model are ignored: {sorted(unknown)}")
+        y = binarizer.transform([[l for l in labels if l in known] for labels in id_labels])
+        y = y.toarray() if hasattr(y, "toarray") else np.asarray(y)
+        for k, estimator in enumerate(classifier.estimators_):
+            column = y[:, k]
+            if isinstance(estimator, MLPClassifier):
+                partial_fit_mlp(estimator, x, column, epochs, rng)
+            elif np.any(column != int(np.ravel(estimator.y_)[0] > 0.5)):
+                # the label was always present or always missing: it has now a predictor of its own
+                classifier.estimators_[k] = clone(classifier.estimator).fit(x, column)
+        return pipeline
+
+    if "classifier" not in pipeline.named_steps:
+        raise ValueError("Only the pipelines with a single classifier can be refreshed")
+    estimator = pipeline["classifier"]
+    if isinstance(estimator, GridSearchCV):
+        estimator = estimator.best_estimator_
+    if not isinstance(estimator, MLPClassifier):
+        raise ValueError(
+            f"A {type(estimator).__name__} cannot be refreshed, train a new model instead"
+        )
+    y = np.ravel(id_labels)
+    known = np.isin(y, estimator.classes_)
+    if not known.all():
+        logger.warning(
+            f"Labels unknown to the model are ignored: {sorted(set(y[~known].tolist()))}"
+        )
+    partial_fit_mlp(estimator, x[known], y[known], epochs, rng)
+    return pipeline
@@ -0,0 +1,85 @@
+"""
+
+Bounds of the sections of every letter
+
+The bulk classifications only read a part of each letter: the topics
+are predicted between the start of its first section and the end of
+its last section, and the theme from the first sentence of its
+synthesis (the section of priority 0). `section_bounds` computes these
+bounds for all the letters with a single groupby, so that the bulk
+paths look them up instead of filtering the sections for every letter.
+
+"""
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from siancedb.models import Session, SiancedbSection
+
+BOUNDS_COLUMNS = ["start", "end", "synthesis_start", "synthesis_end"]
+
+
+def section_bounds(sections_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Args:
+        sections_df (pd.DataFrame): structured as the table `ape_sections`
+
+    Returns:
+        pd.DataFrame: indexed by `id_letter`, with the columns "start" (start of the first section),
+            "end" (end of the last section), "synthesis_start" and "synthesis_end" (bounds of the first
+            synthesis, -1 when the letter has none)
+    """
+    if len(sections_df) == 0:
+        return pd.DataFrame(
+            columns=BOUNDS_COLUMNS, index=pd.Index([], name="id_letter"), dtype=int
+        )
+    grouped = sections_df.groupby("id_letter")
+    bounds = pd.DataFrame({"start": grouped["start"].min(), "end": grouped["end"].max()})
+    synthesis = (
+        sections_df[sections_df.priority == 0]
+        .groupby("id_letter")[["start", "end"]]
+        .first()
+        .rename(columns={"start": "synthesis_start", "end": "synthesis_end"})
+    )
+    return bounds.join(synthesis).fillna(-1).astype(int)
+
+
+def load_section_bounds(db: Session, id_letters: Iterable[int] = None) -> pd.DataFrame:
+    """
+    The bounds of the sections of the given letters (of all the letters if `id_letters` is None)
+    """
+    query = db.query(
+        SiancedbSection.id_letter,
+        SiancedbSection.priority,
+        SiancedbSection.start,
+        SiancedbSection.end,
+    ).order_by(SiancedbSection.id_section)
+    if id_letters is not None:
+        query = query.filter(SiancedbSection.id_letter.in_([int(i) for i in id_letters]))
+    return section_bounds(pd.read_sql(query.statement, db.bind))
+
+
+def letters_bounds(letters_df: pd.DataFrame, bounds: pd.DataFrame) -> pd.DataFrame:
+    """
+    The bounds of the letters of `letters_df`, in the same order.
+    The letters without section span their whole text and have no synthesis
+
+    Args:
+        letters_df (pd.DataFrame): with the columns "id_letter" and "text"
+        bounds (pd.DataFrame): as returned by `section_bounds`
+    """
+    aligned = bounds.reindex(letters_df.id_letter.values)
+    missing = aligned["start"].isna().values
+    lengths = letters_df.text.str.len().fillna(0).values
+    aligned = aligned.fillna(-1).astype(int)
+    aligned.loc[missing, "start"] = 0
+    aligned.loc[missing, "end"] = lengths[missing]
+    return aligned
+
+
+def synthesis_mask(bounds: pd.DataFrame) -> np.ndarray:
+    """
+    True for the letters having a synthesis
+    """
+    return bounds["synthesis_start"].values >= 0
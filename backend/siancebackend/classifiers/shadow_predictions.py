@@ -0,0 +1,331 @@
+"""
+
+Shadow predictions of several models
+
+Comparing a new model to the active one used to mean running
+`build_predictions` once per model, sentencizing and embedding the whole
+corpus every time. Here every chunk of letters is sentencized and
+embedded once, and the embeddings are given to the classifier of every
+model: a candidate model costs only its classifier. The predictions of
+every model are written in `ape_predictions` with a single insert
+statement per chunk and per model, for the letters the model has not
+predicted yet.
+
+The first model is the reference (usually the active model): the labels
+predicted by every other model are compared to its labels on the same
+sentences, and the agreement is saved in the `evaluations` folder.
+
+A model may predict no label at all for a letter (e.g. a letter without
+sentence): nothing is written for it in `ape_predictions`. Such letters
+are recorded in a JSON file (`learning.shadow_unlabelled`, in the
+`evaluations` folder by default), so that they are neither predicted nor
+compared again at the next runs.
+
+"""
+import json
+import os
+import time
+from datetime import date
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import spacy
+from sklearn.pipeline import Pipeline
+from sqlalchemy import and_, exists, insert, or_
+
+from siancebackend.classifiers.classify_topics import (
+    classify_embeddings,
+    classify_letters,
+    load_pipeline,
+    predictions_frame,
+    prepare_score_dict,
+    sentencize_letters,
+)
+from siancebackend.classifiers.embeddings import get_embeddings_sentences
+from siancebackend.classifiers.evaluate_classifier import agreement_counts, agreement_scores
+from siancebackend.classifiers.section_bounds import load_section_bounds
+from siancebackend.letter_management.sentencizer import prepare_sentencizer
+
+from siancedb.config import get_config
+from siancedb.models import (
+    Session,
+    SessionWrapper,
+    SiancedbLetter,
+    SiancedbModel,
+    SiancedbPrediction,
+)
+from siancedb.pandas_writer import chunker
+
+import logging
+
+logger = logging.getLogger("shadow-predictions")
+logger.setLevel(logging.DEBUG)
+fh = logging.FileHandler("logs/shadow_predictions.log", delay=True)
+logger.addHandler(fh)
+
+
+def shadow_predict(
+    pipelines: Dict[int, Pipeline],
+    letters_df: pd.DataFrame,
+    bounds: pd.DataFrame,
+    nlp: spacy.language.Language = None,
+) -> Dict[int, pd.DataFrame]:
+    """
+    Predict the labels of the sentences of the letters with every pipeline,
+    sentencizing and embedding the letters only once
+
+    Args:
+        pipelines (dict[int, Pipeline]): the pipelines, by `id_model`
+        letters_df (pd.DataFrame): structured as the table `ape_letters`, with at least `id_letter` and `text`
+        bounds (pd.DataFrame): the bounds of the sections, as returned by `section_bounds`
+        nlp (spacy.language.Language, Optional): the sentencizer
+
+    Returns:
+        dict[int, pd.DataFrame]: the predictions of every model, as returned by `classify_topics`
+    """
+    nlp = prepare_sentencizer() if nlp is None else nlp
+    id_letters = letters_df.id_letter.values
+    letters_sentences = sentencize_letters(nlp, letters_df, bounds)
+    sentences = [sentence for one_letter in letters_sentences for sentence, _, _ in one_letter]
+    embeddings = get_embeddings_sentences(sentences) if sentences else np.array([])
+
+    predictions = dict()
+    for id_model, pipeline in pipelines.items():
+        predicted_labels = classify_letters(
+            partial(classify_embeddings, pipeline),
+            embeddings,
+            letters_sentences,
+            id_letters,
+        )
+        predictions[id_model] = predictions_frame(id_letters, letters_sentences, predicted_labels)
+    return predictions
+
+
+def letters_missing_predictions(
+    db: Session, id_models: List[int], limit: int = None, batch_size: int = 500
+) -> Iterator[Tuple[int, str]]:
+    """
+    Stream the `(id_letter, text)` of the letters having no prediction made by at least one of the models
+
+    The session must not be committed while streaming: use another session to write the predictions
+    """
+    missing = [
+        ~exists().where(
+            and_(
+                SiancedbPrediction.id_letter == SiancedbLetter.id_letter,
+                SiancedbPrediction.id_model == int(id_model),
+            )
+        )
+        for id_model in id_models
+    ]
+    query = (
+        db.query(SiancedbLetter.id_letter, SiancedbLetter.text)
+        .filter(or_(*missing))
+        .order_by(SiancedbLetter.id_letter)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return (tuple(row) for row in query.yield_per(batch_size))
+
+
+def unlabelled_letters_path() -> str:
+    learning = get_config()["learning"]
+    return learning.get(
+        "shadow_unlabelled", os.path.join(learning["evaluations"], "shadow_unlabelled.json")
+    )
+
+
+def load_unlabelled_letters() -> Dict[int, Set[int]]:
+    """
+    The letters for which a model predicted no label, by `id_model`
+    """
+    try:
+        with open(unlabelled_letters_path(), "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = dict()
+    return {int(id_model): set(id_letters) for id_model, id_letters in state.items()}
+
+
+def save_unlabelled_letters(unlabelled: Dict[int, Set[int]]):
+    path = unlabelled_letters_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({str(k): sorted(v) for k, v in unlabelled.items()}, f)
+    os.replace(tmp_path, path)
+
+
+def predicted_letters(db: Session, id_model: int, id_letters: Iterable[int]) -> Set[int]:
+    """
+    The letters among `id_letters` having predictions made by the model
+    """
+    return {
+        id_letter
+        for id_letter, in db.query(SiancedbPrediction.id_letter)
+        .filter(
+            SiancedbPrediction.id_model == id_model,
+            SiancedbPrediction.id_letter.in_([int(i) for i in id_letters]),
+        )
+        .distinct()
+    }
+
+
+def insert_predictions(
+    db: Session, predictions_df: pd.DataFrame, id_model: int, score_dict: Dict[int, float]
+) -> int:
+    """
+    Write the predictions of a model in `ape_predictions` with a single insert statement
+
+    Returns:
+        int: the number of inserted predictions
+    """
+    if len(predictions_df) == 0:
+        return 0
+    records = [
+        {
+            "id_letter": int(id_letter),
+            "start": int(start),
+            "end": int(end),
+            "sentence": str(sentence),
+            "id_label": int(id_label),
+            "id_model": int(id_model),
+            "decision_score": None
+            if score_dict.get(id_label) is None
+            else float(score_dict[id_label]),
+        }
+        for id_letter, start, end, sentence, id_label in zip(
+            predictions_df.id_letter.values,
+            predictions_df.start.values,
+            predictions_df.end.values,
+            predictions_df.sentence.values,
+            predictions_df.id_label.values,
+        )
+    ]
+    db.execute(insert(SiancedbPrediction), records)
+    return len(records)
+
+
+def build_shadow_predictions(
+    db: Session, id_models: List[int], limit: int = None, chunk_size: int = 100
+) -> Dict[int, Dict]:
+    """
+    Predict with several models the letters that one of them at least has not predicted yet,
+    save the missing predictions and compare the models to the first one
+
+    Args:
+        db (Session): a Session to connect to the database, used for writing
+        id_models (list[int]): the models, the first one being the reference of the comparison
+        limit (int, Optional): the maximal number of letters to predict
+        chunk_size (int, Optional): the number of letters sentencized and embedded at once
+
+    Returns:
+        dict[int, dict]: the agreement of every other model with the reference, as returned by `agreement_scores`
+    """
+    id_models = list(dict.fromkeys(int(id_model) for id_model in id_models))
+    models = {
+        model.id_model: model
+        for model in db.query(SiancedbModel).filter(SiancedbModel.id_model.in_(id_models))
+    }
+    unknown = set(id_models) - set(models)
+    if unknown:
+        raise ValueError(f"Unknown models: {sorted(unknown)}")
+    pipelines = {id_model: load_pipeline(models[id_model].link) for id_model in id_models}
+    score_dicts = {id_model: prepare_score_dict(models[id_model]) for id_model in id_models}
+    reference, candidates = id_models[0], id_models[1:]
+
+    nlp = prepare_sentencizer()
+    bounds = load_section_bounds(db)
+    unlabelled = load_unlabelled_letters()
+    counts = {id_model: [None, 0, 0] for id_model in candidates}
+    inserted = {id_model: 0 for id_model in id_models}
+    letters_count = 0
+    start_time = time.time()
+    with SessionWrapper() as reader:
+        # the limit is applied below, once the letters already processed are skipped
+        letters = letters_missing_predictions(reader, id_models)
+        for chunk in chunker(chunk_size, letters):
+            chunk_df = pd.DataFrame(list(chunk), columns=["id_letter", "text"])
+            # the letters predicted (or found without label) by a model are only used for the comparison
+            done = {
+                id_model: predicted_letters(db, id_model, chunk_df.id_letter.values)
+                | unlabelled.get(id_model, set())
+                for id_model in id_models
+            }
+            missing = np.zeros(len(chunk_df), dtype=bool)
+            for id_model in id_models:
+                missing |= ~chunk_df.id_letter.isin(done[id_model]).values
+            chunk_df = chunk_df[missing]
+            if limit is not None:
+                chunk_df = chunk_df.iloc[: limit - letters_count]
+            if len(chunk_df) == 0:
+                continue
+            predictions = shadow_predict(pipelines, chunk_df, bounds, nlp=nlp)
+
+            new_unlabelled = False
+            for id_model in id_models:
+                predictions_df = predictions[id_model]
+                predictions_df = predictions_df[~predictions_df.id_letter.isin(done[id_model])]
+                inserted[id_model] += insert_predictions(
+                    db, predictions_df, id_model, score_dicts[id_model]
+                )
+                without_label = (
+                    {int(id_letter) for id_letter in chunk_df.id_letter.values}
+                    - done[id_model]
+                    - set(predictions_df.id_letter.tolist())
+                )
+                if without_label:
+                    unlabelled.setdefault(id_model, set()).update(without_label)
+                    new_unlabelled = True
+            db.commit()
+            if new_unlabelled:
+                save_unlabelled_letters(unlabelled)
+
+            for id_model in candidates:
+                chunk_counts, n_sentences, identical = agreement_counts(
+                    predictions[reference], predictions[id_model]
+                )
+                if counts[id_model][0] is not None:
+                    chunk_counts = counts[id_model][0].add(chunk_counts, fill_value=0)
+                counts[id_model][0] = chunk_counts
+                counts[id_model][1] += n_sentences
+                counts[id_model][2] += identical
+            letters_count += len(chunk_df)
+            logger.debug(f"Predicted {letters_count} letters with {len(id_models)} models")
+            if limit is not None and letters_count >= limit:
+                break
+
+    logger.info(
+        f"Shadow predictions of {letters_count} letters in {time.time() - start_time:.1f} s,"
+        f" inserted predictions per model: {inserted}"
+    )
+    if not candidates or letters_count == 0:
+        return dict()
+
+    report, rows = dict(), []
+    for id_model in candidates:
+        model_counts, n_sentences, identical = counts[id_model]
+        if model_counts is None:
+            no_predictions = predictions_frame([], [], [])
+            model_counts, _, _ = agreement_counts(no_predictions, no_predictions)
+        model_counts = model_counts.astype(np.int64)
+        report[id_model] = agreement_scores(model_counts, n_sentences, identical)
+        logger.info(
+            f"Agreement of the model {id_model} with the model {reference}: "
+            + str({k: v for k, v in report[id_model].items() if k != "jaccard"})
+        )
+        rows.append(
+            model_counts.assign(id_model=id_model, jaccard=pd.Series(report[id_model]["jaccard"]))
+            .reset_index()
+        )
+
+    # save the agreement of every label in excel for analysis
+    evaluation_path = os.path.join(
+        get_config()["learning"]["evaluations"],
+        f"{date.today()}_shadow_{reference}_vs_{'_'.join(map(str, candidates))}.xlsx",
+    )
+    pd.concat(rows)[
+        ["id_model", "id_label", "reference", "candidate", "both", "jaccard"]
+    ].to_excel(evaluation_path, index=False)
+    return report
@@ -0,0 +1,166 @@
+"""
+
+Parallel training of independent sub-models
+
+Some models are made of sub-models trained on the same embeddings,
+such as the bottom classifiers of the custom hierarchical classifier
+(one per category). `fit_parallel` fits them in a pool of processes.
+The pools must not be nested: a sub-model fitted by `fit_parallel`
+must not call it again.
+
+The embeddings are written once in a `.npy` file (or reused if they are
+already memory-mapped) and every worker maps them instead of receiving
+a copy. Each worker limits the threads of BLAS to its share of the
+cores, so that the pool does not oversubscribe the machine. The fit
+time of every sub-model is logged and returned.
+
+Configuration (all optional, in the `learning` section):
+    training_workers: number of processes (default: the number of cores)
+
+"""
+import os
+import time
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from sklearn.base import BaseEstimator
+from threadpoolctl import threadpool_limits
+
+from siancedb.config import get_config
+
+logger = logging.getLogger("training-scheduler")
+logger.setLevel(logging.DEBUG)
+fh = logging.FileHandler("logs/training_scheduler.log", delay=True)
+logger.addHandler(fh)
+
+# a sub-model to fit: the estimator, the rows of the embeddings to fit on (all of them if None) and the target
+FitJob = Tuple[BaseEstimator, Optional[np.ndarray], np.ndarray]
+# how to map an array from a worker: filename, dtype, offset, shape, fortran order
+ArrayLocation = Tuple[str, str, int, Tuple[int, ...], bool]
+
+_shared_x: Dict[ArrayLocation, np.ndarray] = dict()
+
+
+def training_workers() -> int:
+    return get_config().get("learning", dict()).get("training_workers", os.cpu_count() or 1)
+
+
+def array_location(x: np.ndarray) -> Optional[ArrayLocation]:
+    """
+    The location of the file mapped by `x`, if it is a whole memory-mapped array
+    """
+    if not isinstance(x, np.memmap) or x.filename is None:
+        return None
+    base = x
+    while isinstance(base.base, np.memmap):
+        base = base.base
+    if (
+        base.shape != x.shape
+        or x.ctypes.data != base.ctypes.data
+        or not (x.flags.c_contiguous or x.flags.f_contiguous)
+    ):
+        return None
+    return (
+        x.filename,
+        x.dtype.str,
+        x.offset,
+        x.shape,
+        bool(x.flags.f_contiguous and not x.flags.c_contiguous),
+    )
+
+
+def open_shared(location: ArrayLocation) -> np.ndarray:
+    if location not in _shared_x:
+        filename, dtype, offset, shape, fortran_order = location
+        _shared_x[location] = np.memmap(
+            filename,
+            dtype=np.dtype(dtype),
+            mode="r",
+            offset=offset,
+            shape=shape,
+            order="F" if fortran_order else "C",
+        )
+    return _shared_x[location]
+
+
+def init_worker(blas_threads: int):
+    threadpool_limits(limits=blas_threads)
+
+
+def fit_one(
+    key: Hashable,
+    estimator: BaseEstimator,
+    x: np.ndarray,
+    rows: Optional[np.ndarray],
+    y: np.ndarray,
+) -> Tuple[Hashable, BaseEstimator, float]:
+    start = time.time()
+    estimator = estimator.fit(x if rows is None else x[rows], y)
+    return key, estimator, time.time() - start
+
+
+def fit_shared(
+    key: Hashable,
+    estimator: BaseEstimator,
+    location: ArrayLocation,
+    rows: Optional[np.ndarray],
+    y: np.ndarray,
+) -> Tuple[Hashable, BaseEstimator, float]:
+    return fit_one(key, estimator, open_shared(location), rows, y)
+
+
+def fit_parallel(
+    x: np.ndarray, jobs: Dict[Hashable, FitJob], n_workers: int = None
+) -> Tuple[Dict[Hashable, BaseEstimator], Dict[Hashable, float]]:
+    """
+    Fit independent sub-models on rows of the same embeddings
+
+    Args:
+        x (np.ndarray): the embeddings, shape (samples, size(embeddings))
+        jobs (Dict[key, FitJob]): for every sub-model, the estimator, the indices of its rows
+            in `x` (None for all the rows) and its target
+        n_workers (int, Optional): the number of processes, defaults to `training_workers()`.
+            The sub-models are fitted in this process if it is 1
+
+    Returns:
+        Dict[key, BaseEstimator], Dict[key, float]: the fitted sub-models and their fit times in seconds
+    """
+    n_workers = min(n_workers or training_workers(), len(jobs))
+    fitted, times = dict(), dict()
+    start = time.time()
+    if n_workers <= 1:
+        results = [fit_one(key, e, x, rows, y) for key, (e, rows, y) in jobs.items()]
+    else:
+        directory = None
+        location = array_location(x)
+        if location is None:
+            directory = tempfile.mkdtemp(prefix="siance-training-")
+            path = os.path.join(directory, "embeddings.npy")
+            np.save(path, np.ascontiguousarray(x))
+            location = array_location(np.load(path, mmap_mode="r"))
+        blas_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_workers, initializer=init_worker, initargs=(blas_threads,)
+            ) as executor:
+                futures = [
+                    executor.submit(fit_shared, key, e, location, rows, y)
+                    for key, (e, rows, y) in jobs.items()
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+    for key, estimator, seconds in results:
+        fitted[key] = estimator
+        times[key] = seconds
+        n_rows = len(x) if jobs[key][1] is None else len(jobs[key][1])
+        logger.info(f"Fitted the sub-model {key} on {n_rows} samples in {seconds:.2f}s")
+    logger.info(
+        f"Fitted {len(jobs)} sub-models with {n_workers} worker(s) in {time.time() - start:.2f}s"
+    )
+    return fitted, times
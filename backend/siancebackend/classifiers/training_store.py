@@ -0,0 +1,241 @@
+"""
+
+Store of the embeddings of the training sentences
+
+The mono-output and the multi-output classifiers are trained on the same
+sentences: the store embeds every annotated sentence once, whatever the
+number of its labels. A sentence is identified by a key hashing the name
+of its letter, its start, its end and its text, so that a sentence whose
+text changed is embedded again. The store is made of three `.npy` files
+in the `precomputed` folder:
+- `training_embeddings.npy`: one row per sentence, memory-mapped when read
+- `training_keys.npy`: the key of every row
+- `training_annotations.npy`: one (id_annotation, row, id_label) per
+  row of ape_training, in the order of the `id_annotation`
+
+Updating the store embeds only the sentences of the new annotations, and
+appends them to the files (only the header of a `.npy` file is rewritten).
+The annotations deleted from ape_training are dropped from the store,
+their sentences stay in the embeddings but are not used anymore.
+
+The training sets are views of the store: the mono-output one has a row
+per annotation, the multi-output one a row per sentence with the list of
+its labels.
+
+"""
+import io
+import os
+import hashlib
+from typing import Callable, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+EMBEDDINGS = "training_embeddings.npy"
+KEYS = "training_keys.npy"
+ANNOTATIONS = "training_annotations.npy"
+
+
+def append_npy(path: str, rows: np.ndarray):
+    """
+    Append rows to the array saved in the `.npy` file `path`, without reading it.
+    Only the header (the shape) is rewritten, unless the array is an array of objects
+    or the new header is longer than the previous one: the file is then rewritten
+    """
+    rows = np.asarray(rows)
+    if not os.path.exists(path):
+        np.save(path, rows)
+        return
+    with open(path, "r+b") as file:
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        header_length = file.tell()
+        if not (fortran_order or dtype.hasobject) and shape[1:] == rows.shape[1:]:
+            header = {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": False,
+                "shape": (shape[0] + len(rows),) + shape[1:],
+            }
+            buffer = _header_bytes(header, version)
+            if len(buffer) == header_length:
+                file.seek(0, os.SEEK_END)
+                file.write(np.ascontiguousarray(rows, dtype=dtype).tobytes())
+                file.seek(0)
+                file.write(buffer)
+                return
+    previous = np.load(path, allow_pickle=True)
+    np.save(path, np.concatenate([previous, rows.astype(previous.dtype)]))
+
+
+def _header_bytes(header: dict, version) -> bytes:
+    buffer = io.BytesIO()
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(buffer, header)
+    else:
+        np.lib.format.write_array_header_2_0(buffer, header)
+    return buffer.getvalue()
+
+
+def sentence_key(name: str, start: int, end: int, sentence: str) -> int:
+    """
+    The 64 bits key of an annotated sentence
+    """
+    digest = hashlib.blake2b(
+        "\x1f".join([name, str(start), str(end), sentence]).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class TrainingStore:
+    """
+    The embeddings of the training sentences saved in a folder, and their annotations
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def exists(self) -> bool:
+        return all(os.path.exists(self.path(f)) for f in [EMBEDDINGS, KEYS, ANNOTATIONS])
+
+    def clear(self):
+        for filename in [EMBEDDINGS, KEYS, ANNOTATIONS]:
+            if os.path.exists(self.path(filename)):
+                os.remove(self.path(filename))
+
+    def keys(self) -> np.ndarray:
+        if not self.exists():
+            return np.array([], dtype=np.int64)
+        return np.load(self.path(KEYS))
+
+    def annotations(self) -> np.ndarray:
+        """
+        The (id_annotation, row, id_label) of every annotation, of shape (n_annotations, 3)
+        """
+        if not self.exists():
+            return np.zeros((0, 3), dtype=np.int64)
+        return np.load(self.path(ANNOTATIONS))
+
+    def embeddings(self) -> np.ndarray:
+        """
+        The memory-mapped embeddings, one row per key
+        """
+        embeddings = np.load(self.path(EMBEDDINGS), mmap_mode="r")
+        n_keys = len(self.keys())
+        # rows appended after the keys, by an update that did not finish, are not used
+        return embeddings if len(embeddings) == n_keys else embeddings[:n_keys]
+
+    def drop_unused_embeddings(self, n_keys: int):
+        """
+        Remove the embeddings without a key, left by an interrupted update
+        """
+        path = self.path(EMBEDDINGS)
+        if os.path.exists(path) and len(np.load(path, mmap_mode="r")) > n_keys:
+            embeddings = np.array(np.load(path, mmap_mode="r")[:n_keys])
+            np.save(path, embeddings)
+
+    def last_id_annotation(self) -> int:
+        annotations = self.annotations()
+        return int(annotations[:, 0].max()) if len(annotations) else 0
+
+    def remove_annotations(self, kept_ids: Iterable[int]) -> int:
+        """
+        Drop the annotations whose `id_annotation` is not in `kept_ids`, and return how many were dropped
+        """
+        annotations = self.annotations()
+        kept = np.isin(annotations[:, 0], np.fromiter(kept_ids, dtype=np.int64))
+        if not kept.all():
+            np.save(self.path(ANNOTATIONS), annotations[kept])
+        return int((~kept).sum())
+
+    def append(
+        self,
+        training_df: pd.DataFrame,
+        embed: Callable[[np.ndarray], np.ndarray],
+    ) -> int:
+        """
+        Add new annotations to the store, embedding only the sentences it does not hold yet
+
+        Args:
+            training_df (pd.DataFrame): rows of ape_training (with the columns id_annotation, name,
+                start, end, sentence and id_label) more recent than `last_id_annotation()`
+            embed (Callable): the function embedding an array of sentences
+
+        Returns:
+            int: the number of embedded sentences
+        """
+        if len(training_df) == 0:
+            return 0
+        if not self.exists():
+            # the files left by an interrupted first update
+            self.clear()
+        training_df = training_df.sort_values("id_annotation")
+        keys = np.array(
+            [
+                sentence_key(name, start, end, sentence)
+                for name, start, end, sentence in zip(
+                    training_df.name, training_df.start, training_df.end, training_df.sentence
+                )
+            ],
+            dtype=np.int64,
+        )
+        known_keys = self.keys()
+        rows = pd.Index(known_keys).get_indexer(keys)
+        missing = rows < 0
+        new_keys, first, inverse = np.unique(
+            keys[missing], return_index=True, return_inverse=True
+        )
+        if len(new_keys) > 0:
+            embeddings = embed(training_df.sentence.values[missing][first])
+            self.drop_unused_embeddings(len(known_keys))
+            # the embeddings are written before their keys: an interrupted update leaves unused rows
+            append_npy(self.path(EMBEDDINGS), np.asarray(embeddings, dtype=np.float32))
+            append_npy(self.path(KEYS), new_keys)
+        rows[missing] = len(known_keys) + inverse
+        annotations = np.stack(
+            [training_df.id_annotation.values, rows, training_df.id_label.values], axis=1
+        ).astype(np.int64)
+        append_npy(self.path(ANNOTATIONS), annotations)
+        return len(new_keys)
+
+    def mono_output(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The training set of the mono-output classifiers, with a row per annotation
+
+        Returns:
+            numpy.array, numpy.array, numpy.array: the embeddings, the labels of shape (n_annotations, 1)
+                and the `id_annotation` of every row
+        """
+        annotations = self.annotations()
+        return (
+            self.embeddings()[annotations[:, 1]],
+            annotations[:, 2:3],
+            annotations[:, 0],
+        )
+
+    def multi_output(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The training set of the multi-output classifiers, with a row per annotated sentence
+
+        Returns:
+            numpy.array, numpy.array[list[int]], numpy.array: the embeddings (memory-mapped if every
+                sentence is annotated), the list of the labels of every sentence and the last
+                `id_annotation` of every sentence
+        """
+        annotations = self.annotations()
+        embeddings = self.embeddings()
+        order = np.argsort(annotations[:, 1], kind="stable")
+        rows, starts = np.unique(annotations[order, 1], return_index=True)
+        id_labels = np.empty(len(rows), dtype=object)
+        id_labels[:] = [
+            labels.tolist() for labels in np.split(annotations[order, 2], starts[1:])
+        ]
+        last_ids = np.maximum.reduceat(annotations[order, 0], starts) if len(rows) else rows
+        if len(rows) < len(embeddings):
+            embeddings = embeddings[rows]
+        return embeddings, id_labels, last_ids
@@ -4,8 +4,10 @@ Consolidate information extracted from SiV2 using referential tables
 
 """
 from siancedb.models import SiancedbThemeValorisation
-from typing import Dict, Optional, List, Tuple, Iterable
+from typing import Callable, Dict, Optional, List, Set, Tuple, Iterable
 import logging
+from collections import defaultdict
+from functools import lru_cache
 import requests
 from datetime import datetime, date, timedelta
 import pandas as pd
@@ -32,6 +34,7 @@ from siancedb.models import (
 from siancedb.config import get_config
 from siancedb.pandas_writer import chunker
 from siancebackend.pipe_logger import update_log_state
+from siancebackend.referentials import read_referential
 
 logger = logging.getLogger("siancebackend")
 
@@ -214,25 +217,116 @@ DOMAINS_COLUMN = "domaine"
 
 KEY_THEME_COLUMN = "key_theme"
 
-INB_DF = pd.read_excel(
-    get_config()["letters"]["INBs"], engine="openpyxl", index_col=None, dtype=str
-)
 
-HOSPITALS_DF = pd.read_excel(
-    get_config()["letters"]["hospitals"], engine="openpyxl", index_col=None, dtype=str
-)
+def inb_referential() -> pd.DataFrame:
+    return read_referential(
+        get_config()["letters"]["INBs"], engine="openpyxl", index_col=None, dtype=str
+    )
 
-THEMES_DF = pd.read_excel(
-    get_config()["letters"]["themes"], engine="openpyxl", dtype=str
-).dropna(subset=[THEME_COLUMN])
-THEMES_DF[KEY_THEME_COLUMN] = THEMES_DF.apply(
-    lambda row: unidecode.unidecode(row[THEME_COLUMN].lower().replace(" ", "")),
-    axis=1,
-)
+
+def hospitals_referential() -> pd.DataFrame:
+    return read_referential(
+        get_config()["letters"]["hospitals"],
+        engine="openpyxl",
+        index_col=None,
+        dtype=str,
+    )
+
+
+def themes_referential() -> pd.DataFrame:
+    themes_df = read_referential(
+        get_config()["letters"]["themes"], engine="openpyxl", dtype=str
+    ).dropna(subset=[THEME_COLUMN])
+    themes_df[KEY_THEME_COLUMN] = themes_df[THEME_COLUMN].map(
+        lambda theme: unidecode.unidecode(theme.lower().replace(" ", ""))
+    )
+    return themes_df
 
 with open(get_config()["letters"]["fix_siret"], "r") as f:
     FIX_SIRET = json.load(f)
 
+
+def normalize_key(value) -> Optional[str]:
+    """
+    The key used to compare the values of the SIv2 and of the referentials
+    """
+    if not isinstance(value, str):
+        return None
+    return value.lower().replace(" ", "")
+
+
+def identity_key(value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    return value
+
+
+class ReferentialIndex:
+    """
+    Inverted indexes of some columns of a referential,
+    built once so that matching a SIv2 response is only a matter of set operations.
+
+    Args:
+        df (pd.DataFrame): the referential
+        columns (List[str]): the columns to index
+        normalize (Callable): computes the key of a cell, None for the cells to ignore
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        columns: List[str],
+        normalize: Callable[[str], Optional[str]] = normalize_key,
+    ):
+        self.df = df
+        self.all_rows = frozenset(range(len(df)))
+        self.indexes = dict()
+        for column in columns:
+            index = defaultdict(set)
+            for position, value in enumerate(df[column]):
+                key = normalize(value)
+                if key is not None:
+                    index[key].add(position)
+            self.indexes[column] = dict(index)
+
+    def rows(self, column: str, keys: Iterable[str]) -> Set[int]:
+        """
+        The positions of the rows whose key in this column is one of `keys`
+        """
+        index = self.indexes[column]
+        return set().union(*(index.get(key, ()) for key in keys))
+
+    def select(self, rows: Iterable[int]) -> pd.DataFrame:
+        """
+        The rows of the referential, in their original order
+        """
+        return self.df.iloc[sorted(rows)]
+
+
+@lru_cache(maxsize=None)
+def inb_index() -> ReferentialIndex:
+    return ReferentialIndex(
+        inb_referential(),
+        [
+            SIRET_COLUMN,
+            INB_NAME_COLUMN,
+            INB_CODE_COLUMN,
+            CLASSIFICATION_COLUMN,
+            OLD_CLASSIFICATION_COLUMN,
+        ],
+    )
+
+
+@lru_cache(maxsize=None)
+def hospitals_index() -> ReferentialIndex:
+    return ReferentialIndex(hospitals_referential(), [SIRET_COLUMN], identity_key)
+
+
+@lru_cache(maxsize=None)
+def themes_index() -> ReferentialIndex:
+    return ReferentialIndex(themes_referential(), [KEY_THEME_COLUMN], identity_key)
+
+
 class SIv2EnrichedResponse(BaseModel):
     # to the referentials
     # to correct possible mistakes
@@ -290,12 +384,8 @@ def dataframe_matching_INBs(sr: SIv2SmartResponse):
         for siret in (possible_siret, fix_common_errors_cnpe_siret(possible_siret))
     ]
 
-    checkable_site_name = [
-        possible_name.lower().replace(" ", "") for possible_name in sr.site
-    ]
-
-    checkable_inb_num = [nom.lower().replace(" ", "") for nom in sr.num_nom_inb]
-    checkable_inb_name = [nom.lower().replace(" ", "") for nom in sr.nom_ura]
+    checkable_inb_num = [normalize_key(nom) for nom in sr.num_nom_inb]
+    checkable_inb_name = [normalize_key(nom) for nom in sr.nom_ura]
     if "réacteur1" in checkable_inb_name or "réacteur2" in checkable_inb_name:
         checkable_inb_name.append("réacteurs1&2")
     if "réacteur3" in checkable_inb_name or "réacteur4" in checkable_inb_name:
@@ -314,38 +404,26 @@ def dataframe_matching_INBs(sr: SIv2SmartResponse):
     if siv2_ludd:
         checkable_classification.extend(sectors_to_classification(["LUDD"]))
 
-    checkable_classification = [u.lower() for u in checkable_classification]
+    checkable_classification = [normalize_key(u) for u in checkable_classification]
 
-    possibles_inb_df = INB_DF
-         
+    # the site names of the SIv2 are too unreliable to filter the referential
+    index = inb_index()
+    possible_rows = index.all_rows
     for (colname, condition) in [
         (SIRET_COLUMN, checkable_sirets),
-        (INB_SITE_COLUMN, checkable_site_name),
-        (CLASSIFICATION_COLUMN, checkable_classification),
         (INB_NAME_COLUMN, checkable_inb_name),
         (INB_CODE_COLUMN, checkable_inb_num),
     ]:
         # given a list of candidate values, keep only the rows of refenretial consistent with these candidates
-        if len(condition) > 0 and colname != INB_SITE_COLUMN and colname != CLASSIFICATION_COLUMN:
-            possibles_inb_df = possibles_inb_df[
-                possibles_inb_df[colname]
-                .str.lower()
-                .str.replace(" ", "")
-                .isin(condition)
-            ]
-        if len(condition) > 0 and colname == CLASSIFICATION_COLUMN:
-            possibles_inb_df = possibles_inb_df[
-                (possibles_inb_df[CLASSIFICATION_COLUMN]
-                .str.lower()
-                .str.replace(" ", "")
-                .isin(condition)) |
-                (possibles_inb_df[OLD_CLASSIFICATION_COLUMN]
-                .str.lower()
-                .str.replace(" ", "")
-                .isin(condition))
-            ]
-
-    return possibles_inb_df
+        if len(condition) > 0:
+            possible_rows = possible_rows & index.rows(colname, condition)
+    if len(checkable_classification) > 0:
+        possible_rows = possible_rows & (
+            index.rows(CLASSIFICATION_COLUMN, checkable_classification)
+            | index.rows(OLD_CLASSIFICATION_COLUMN, checkable_classification)
+        )
+
+    return index.select(possible_rows)
 
 
 def dataframe_matching_themes(sr: SIv2SmartResponse):
@@ -353,11 +431,13 @@ def dataframe_matching_themes(sr: SIv2SmartResponse):
     Selects all the rows of the themes dataframe
     that match the current SIv2SmartResponse
     """
-    return THEMES_DF[
-        THEMES_DF[KEY_THEME_COLUMN].isin(
-            [unidecode.unidecode(theme.lower().replace(" ", "")) for theme in sr.themes]
+    index = themes_index()
+    return index.select(
+        index.rows(
+            KEY_THEME_COLUMN,
+            [unidecode.unidecode(normalize_key(theme)) for theme in sr.themes],
         )
-    ]
+    )
 
 
 def dataframe_matching_hospitals(sr: SIv2SmartResponse):
@@ -365,7 +445,8 @@ def dataframe_matching_hospitals(sr: SIv2SmartResponse):
     Selects all the rows of the hospitals dataframe
     that match the current SIv2SmartResponse
     """
-    return HOSPITALS_DF[HOSPITALS_DF[SIRET_COLUMN].isin(sr.siret)]
+    index = hospitals_index()
+    return index.select(index.rows(SIRET_COLUMN, sr.siret))
 
 
 def consolidate_smart_response(sr: SIv2SmartResponse) -> SIv2EnrichedResponse:
@@ -0,0 +1,284 @@
+"""
+
+Clients of the APIs used to enrich the interlocutors
+
+    - the SIRENE API of the INSEE (SIRET -> establishment)
+    - geo.api.gouv.fr (postal code -> city, region, centroid)
+
+Both clients share a pooled HTTP session, keep their answers
+in a SQLite cache with a time to live, and the INSEE client
+waits for a token of a token bucket before each request,
+so that several threads can query it without exceeding the quota.
+
+Configuration (all optional, in the `enrichment` section):
+    cache: path of the SQLite cache (default `enrichment_cache.sqlite`)
+    ttl_days: how long an answer is kept (default 30)
+    insee_url: default `https://api.insee.fr`
+    geo_url: default `https://geo.api.gouv.fr`
+    insee_requests_per_minute: the quota of the INSEE API (default 30)
+    timeout: timeout in seconds of one request (default 30)
+    workers: number of threads used by bulk refreshes (default 4)
+
+"""
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from siancedb.config import get_config
+
+logger = logging.getLogger("interlocutors")
+
+
+def enrichment_config() -> Dict:
+    return get_config().get("enrichment", dict())
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket: `rate` tokens are added every second,
+    up to `capacity`. `acquire` blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last) * self.rate
+                )
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """
+        Empty the bucket, used when the server answers that
+        the quota is exceeded
+        """
+        with self.lock:
+            self.tokens = 0
+            self.last = time.monotonic()
+
+
+class TTLCache:
+    """
+    A key-value store in SQLite where the values (JSON serializable)
+    expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self.connection.commit()
+
+    def get(self, namespace: str, key: str):
+        """
+        Returns the pair (found, value)
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, fetched_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return False, None
+        return True, json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time()),
+            )
+            self.connection.commit()
+
+
+def pooled_session(pool_size: int = 10) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class InseeClient:
+    """
+    Client of the SIRENE API.
+
+    Args:
+        token (Callable): returns the current bearer token
+        refresh_token (Callable): asks for a new token, called on a 401
+        base_url (str): the url of the INSEE API
+        cache (TTLCache): the cache of the answers
+        bucket (TokenBucket): limits the number of requests
+    """
+
+    def __init__(
+        self,
+        token: Callable[[], str],
+        refresh_token: Callable[[], str],
+        base_url: str,
+        cache: TTLCache,
+        bucket: TokenBucket,
+        session: Optional[requests.Session] = None,
+        timeout: float = 30,
+        max_attempts: int = 10,
+    ):
+        self.token = token
+        self.refresh_token = refresh_token
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.bucket = bucket
+        self.session = session or pooled_session()
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def _get(self, siret: str, token: str) -> requests.Response:
+        self.bucket.acquire()
+        return self.session.get(
+            f"{self.base_url}/entreprises/sirene/V3/siret/{siret}",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=self.timeout,
+        )
+
+    def establishment(self, siret: str) -> Optional[Dict]:
+        """
+        The `etablissement` of the SIRENE API for this siret,
+        or None if the siret is unknown
+        """
+        found, value = self.cache.get("insee", siret)
+        if found:
+            return value
+
+        token = self.token()
+        for _ in range(self.max_attempts):
+            response = self._get(siret, token)
+            if response.status_code == 401:  # unauthorized token
+                token = self.refresh_token()
+                continue
+            if response.status_code == 429:  # quota exceeded
+                self.bucket.drain()
+                time.sleep(float(response.headers.get("Retry-After", 0)))
+                continue
+            break
+        else:
+            raise RuntimeError(f"The INSEE API did not answer for {siret}")
+
+        logger.debug(f"In request {siret}, response is {response}.")
+        if response.status_code == 404:
+            self.cache.set("insee", siret, None)
+            return None
+        response.raise_for_status()
+        value = response.json()["etablissement"]
+        self.cache.set("insee", siret, value)
+        return value
+
+
+class GeoClient:
+    """
+    Client of geo.api.gouv.fr
+
+    Args:
+        base_url (str): the url of the API
+        cache (TTLCache): the cache of the answers
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        cache: TTLCache,
+        session: Optional[requests.Session] = None,
+        timeout: float = 30,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.session = session or pooled_session()
+        self.timeout = timeout
+
+    def commune(self, postal_code: str) -> Optional[Dict]:
+        """
+        The first commune with this postal code, as a dictionary
+        `{"city": ..., "region": ..., "geojson": ...}`, or None
+        """
+        postal_code = str(postal_code)
+        found, value = self.cache.get("geo", postal_code)
+        if found:
+            return value
+
+        response = self.session.get(
+            f"{self.base_url}/communes",
+            params={
+                "codePostal": postal_code,
+                "fields": "centre,codeRegion",
+                "format": "json",
+                "geometry": "centre",
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        communes = response.json()
+        value = None
+        if len(communes) > 0:
+            value = {
+                "city": communes[0]["nom"],
+                "region": communes[0]["codeRegion"],
+                "geojson": communes[0]["centre"],
+            }
+        self.cache.set("geo", postal_code, value)
+        return value
+
+
+_shared = dict()
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> TTLCache:
+    with _shared_lock:
+        if "cache" not in _shared:
+            config = enrichment_config()
+            _shared["cache"] = TTLCache(
+                config.get("cache", "enrichment_cache.sqlite"),
+                ttl=config.get("ttl_days", 30) * 24 * 3600,
+            )
+        return _shared["cache"]
+
+
+def shared_session() -> requests.Session:
+    with _shared_lock:
+        if "session" not in _shared:
+            _shared["session"] = pooled_session()
+        return _shared["session"]
+
+
+def shared_bucket() -> TokenBucket:
+    with _shared_lock:
+        if "bucket" not in _shared:
+            per_minute = enrichment_config().get("insee_requests_per_minute", 30)
+            _shared["bucket"] = TokenBucket(rate=per_minute / 60, capacity=1)
+        return _shared["bucket"]
@@ -5,19 +5,18 @@ import pandas as pd
 import numpy as np
 import logging
 
-import json
-
 from siancebackend.pipe_logger import update_log_state
 
 from siancedb.elasticsearch.schemes import ELetter, EDemand
 
 from siancedb.config import get_config
+from siancedb.geography import get_region_name
+from siancedb.reference_cache import labels as cached_labels
 
 from siancedb.models import (
     Session,
     SessionWrapper,
     SiancedbIsotope,
-    SiancedbLabel,
     SiancedbSection,
     SiancedbLetter,
     SiancedbDemand,
@@ -29,7 +28,7 @@ from siancedb.models import (
 
 logger = logging.getLogger("elastic-index")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/elastic_index.log")
+fh = logging.FileHandler("logs/elastic_index.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -38,43 +37,36 @@ DECISION_THRESH = 0.3
 
 LabelDict = Dict[int, Tuple[str, str]]
 InbDict = Dict[int, any]
+RegionDict = Dict[int, Tuple[str, str]]
 
-with open(get_config()["geography"]["regions"], "r") as f:
-    GEO = json.load(f)
-
-
-def get_region_name(region_code: str):
-    if region_code == "":
-        region_code = "0"
-    try:
-        l = [
-            f["properties"]["nom"]
-            for f in GEO["features"]
-            if f["properties"]["code"] == str(region_code)
-        ]
 
-        return l[0]
-    except:
-        return "INCONNU·E·S"
+def interlocutors_regions(db: Session) -> RegionDict:
+    """
+    Assign in bulk every interlocutor to its region,
+    the result maps id_interlocutor -> (region code, region name)
+    """
+    logger.debug("Assigning the interlocutors to their regions")
+    return {
+        id_interlocutor: (region_code or "", get_region_name(region_code or ""))
+        for id_interlocutor, region_code in db.query(
+            SiancedbInterlocutor.id_interlocutor, SiancedbInterlocutor.region
+        )
+    }
 
 
 def labels_dict() -> LabelDict:
-    logger.debug("Fetching label names from the database")
-    with SessionWrapper() as db:
-        labels = db.query(SiancedbLabel).all()
-        #        return {label.id_label: [label.category, label.subcategory] for label in labels}
-        return {
-            label.id_label: {
-                "name": label.subcategory,
-                # some labels (typically many transverse labels) are not proposed for research but can be displayed in Observer. They are called "complementary"
-                "complementary": not label.research,
-                "is_rep": label.is_rep,
-                "is_ludd": label.is_ludd,
-                "is_npx": label.is_npx,
-                "is_transverse": label.is_transverse,
-            }
-            for label in labels
+    return {
+        label["id_label"]: {
+            "name": label["subcategory"],
+            # some labels (typically many transverse labels) are not proposed for research but can be displayed in Observer. They are called "complementary"
+            "complementary": not label["research"],
+            "is_rep": label["is_rep"],
+            "is_ludd": label["is_ludd"],
+            "is_npx": label["is_npx"],
+            "is_transverse": label["is_transverse"],
         }
+        for label in cached_labels()
+    }
 
 
 def filter_labels_predictions(
@@ -133,6 +125,7 @@ def build_documents(db: Session, id_model: int, pipe_logger=None):
     n_documents = db.query(SiancedbLetter).count()
     letters_count = 0
     labels = labels_dict()
+    regions = interlocutors_regions(db)
     for letter in letters:
         letters_count += 1
         logger.debug(f"Indexing letter {letter.id_letter} (number {letters_count})")
@@ -141,7 +134,7 @@ def build_documents(db: Session, id_model: int, pipe_logger=None):
             update_log_state(
                 pipe=pipe_logger, progress=letters_count / n_documents, step="indexing"
             )
-        for doc in letter_generator(letter, labels, id_model):
+        for doc in letter_generator(letter, labels, id_model, regions):
             yield doc
 
 
@@ -196,10 +189,13 @@ def extract_summary(text: str, sections: List[SiancedbSection]) -> str:
     return ""
 
 
-def prepare_interlocutor_fields(interlocutor):
+def prepare_interlocutor_fields(interlocutor, regions: RegionDict = None):
+    region_name = None
     if interlocutor is not None:
         identifiers = [interlocutor.siret]
         region_code = interlocutor.region
+        if regions is not None and interlocutor.id_interlocutor in regions:
+            region_code, region_name = regions[interlocutor.id_interlocutor]
         point_gps = {"lat": interlocutor.lat or 0, "lon": interlocutor.lon or 0}
         interlocutor_name = interlocutor.name
         city = interlocutor.city
@@ -213,7 +209,8 @@ def prepare_interlocutor_fields(interlocutor):
         id_interlocutor = ""
         point_gps = {"lat": 0, "lon": 0}
         main_site = ""
-    region_name = get_region_name(region_code)
+    if region_name is None:
+        region_name = get_region_name(region_code)
     return (
         identifiers,
         interlocutor_name,
@@ -272,7 +269,12 @@ def prepare_metadata_fields(metadata_si, letter):
     )
 
 
-def letter_generator(letter: SiancedbLetter, labels: LabelDict, id_model: int):
+def letter_generator(
+    letter: SiancedbLetter,
+    labels: LabelDict,
+    id_model: int,
+    regions: RegionDict = None,
+):
     logger.debug(f"Building letter {letter.name}")
 
     logger.debug(f"Letter date {letter.sent_date} {type(letter.sent_date)}")
@@ -303,7 +305,7 @@ def letter_generator(letter: SiancedbLetter, labels: LabelDict, id_model: int):
         region_name,
         region_code,
         point_gps,
-    ) = prepare_interlocutor_fields(interlocutor)
+    ) = prepare_interlocutor_fields(interlocutor, regions)
     (
         theme,
         inb_site,
@@ -3,19 +3,23 @@
 Process CRES events
 
 """
-import json
+import logging
 
-from typing import List, Optional, Dict, Tuple
+from typing import Iterator, List, Optional, Dict, Set, Tuple
 from pydantic import BaseModel
 from datetime import datetime, date, timedelta
 from siancebackend import siv2metadata
 
 
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 
 from siancedb.config import get_config
 
 from siancedb.models import (
+    Session,
     SessionWrapper,
     SiancedbCres,
     SiancedbDocument,
@@ -45,6 +49,9 @@ from siancebackend.consolidate_metadata import (
 )
 
 from siancebackend.interlocutors import get_or_create_interlocutor
+from siancebackend.siv2_store import open_store, load_records
+
+logger = logging.getLogger("siancebackend")
 
 ##
 # STEP 1:
@@ -158,25 +165,75 @@ class SIv2EnrichedCres(BaseModel):
     siret: List[str]
 
 
+class FolderPrefixIndex:
+    """
+    A character trie over the `r_folder_path` of the interlocutors.
+
+    Each node stores the position (in the dump) of the interlocutors
+    having a folder path ending there, so that the interlocutors whose
+    folder path is a prefix of a given path are found by walking
+    the path once, whatever the number of interlocutors.
+    """
+
+    def __init__(self, records: List[Dict]):
+        self.records = records
+        self.root = {}
+        for position, record in enumerate(records):
+            # same semantic as `str.startswith(tuple(r_folder_path))`
+            for prefix in tuple(record.get("r_folder_path", None) or []):
+                node = self.root
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append(position)
+
+    def prefixes_of(self, path: str) -> Set[int]:
+        positions = set(self.root.get(None, []))
+        node = self.root
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            positions.update(node.get(None, []))
+        return positions
+
+    def matching(self, paths: List[str]) -> List[Dict]:
+        """
+        The interlocutors having one folder path that is a prefix
+        of one of the `paths`, in the order of the dump
+        """
+        positions = set()
+        for path in paths:
+            positions |= self.prefixes_of(path)
+        return [self.records[position] for position in sorted(positions)]
+
+
+_folder_indexes: Dict[str, Tuple[str, FolderPrefixIndex]] = {}
+
+
+def folder_prefix_index(interlocutor_file: str) -> FolderPrefixIndex:
+    """
+    The prefix index of the interlocutor dump, built once
+    and kept until the file changes
+    """
+    signature = open_store(interlocutor_file).source_signature()
+    cached_signature, index = _folder_indexes.get(interlocutor_file, (None, None))
+    if cached_signature != signature:
+        index = FolderPrefixIndex(load_records(interlocutor_file))
+        _folder_indexes[interlocutor_file] = (signature, index)
+    return index
+
+
 def build_enriched_cres(
     cres: SIv2SmartCres,
     interlocutor_file="asn_interlocuteur.txt",
 ) -> SIv2EnrichedCres:
-    p = cres.r_folder_path
-
-    test_match = lambda x: any(
-        ps.startswith(tuple(x.get("r_folder_path", []))) for ps in p
-    )
-
-    with open(interlocutor_file, "r") as content:
-        jsons = (json.loads(line) for line in content.readlines())
-        matchers = filter(test_match, jsons)
-        potential_sirets = map(lambda x: x.get("siret", None), matchers)
-        sirets = filter(lambda x: x, potential_sirets)
-        c_sirets = map(fix_common_errors_cnpe_siret, sirets)
-        first_3_sirets = (x for x, _ in zip(c_sirets, range(3)))
+    matchers = folder_prefix_index(interlocutor_file).matching(cres.r_folder_path)
+    potential_sirets = map(lambda x: x.get("siret", None), matchers)
+    sirets = filter(lambda x: x, potential_sirets)
+    c_sirets = map(fix_common_errors_cnpe_siret, sirets)
+    first_3_sirets = (x for x, _ in zip(c_sirets, range(3)))
 
-        return SIv2EnrichedCres(siret=list(first_3_sirets))
+    return SIv2EnrichedCres(siret=list(first_3_sirets))
 
 
 ##
@@ -206,7 +263,7 @@ def find_potential_interlocutor(sirets: List[str]):
         for interlocutor in interlocutors:
             return interlocutor
 
-        interlocutor = get_or_create_interlocutor(sirets[0])
+        return get_or_create_interlocutor(sirets[0])
 
 
 def find_potential_cres(r_object_ids: List[str]):
@@ -252,6 +309,158 @@ def build_one_cres(
     return (cres, interlocutor)
 
 
+def resolve_interlocutors(
+    db: Session, sirets_lists: List[List[str]]
+) -> List[Optional[int]]:
+    """
+    For each list of candidate sirets, the id of the first interlocutor
+    known in the database, with a single query for the whole batch.
+    When none is known, the interlocutor of the first siret is created.
+    """
+    all_sirets = {siret for sirets in sirets_lists for siret in sirets}
+    known = dict(
+        db.query(SiancedbInterlocutor.siret, SiancedbInterlocutor.id_interlocutor)
+        .filter(SiancedbInterlocutor.siret.in_(all_sirets))
+        .all()
+    )
+    ids = []
+    for sirets in sirets_lists:
+        id_interlocutor = next(
+            (known[siret] for siret in sirets if siret in known), None
+        )
+        if id_interlocutor is None and len(sirets) > 0:
+            interlocutor = get_or_create_interlocutor(sirets[0])
+            if interlocutor is not None:
+                id_interlocutor = interlocutor.id_interlocutor
+                known[sirets[0]] = id_interlocutor
+        ids.append(id_interlocutor)
+    return ids
+
+
+def resolve_sites(db: Session, id_interlocutors: List[int]) -> Dict[int, str]:
+    """
+    The site written in the SIv2 metadata of the (first) letter
+    sent to each interlocutor, with a single query for the whole batch
+    """
+    rows = (
+        db.query(SiancedbLetter.id_interlocutor, SiancedbSIv2LettersMetadata.site)
+        .filter(SiancedbSIv2LettersMetadata.id_metadata == SiancedbLetter.id_letter)
+        .filter(SiancedbLetter.id_interlocutor.in_(set(id_interlocutors)))
+        .order_by(SiancedbLetter.id_letter)
+        .all()
+    )
+    sites = {}
+    for id_interlocutor, site in rows:
+        sites.setdefault(id_interlocutor, site)
+    return sites
+
+
+def build_cres_batch(
+    db: Session,
+    siv2responses: List[Dict],
+    interlocutor_file="asn_interlocuteur.txt",
+) -> List[Dict]:
+    """
+    Same as `build_one_cres` for a batch of dump records,
+    but returns the values of the rows of `ape_cres` to upsert.
+    The records without any known interlocutor are skipped.
+    """
+    smart_list = [build_smart_cres(siv2response) for siv2response in siv2responses]
+    sirets_lists = [
+        build_enriched_cres(smart_cres, interlocutor_file=interlocutor_file).siret
+        for smart_cres in smart_list
+    ]
+    id_interlocutors = resolve_interlocutors(db, sirets_lists)
+    sites = resolve_sites(db, [i for i in id_interlocutors if i is not None])
+
+    now = datetime.now()
+    rows = {}
+    for smart_cres, id_interlocutor in zip(smart_list, id_interlocutors):
+        if id_interlocutor is None:
+            logger.warning(
+                f"No interlocutor found for the CRES {smart_cres.r_object_name[0]}"
+            )
+            continue
+        # a CRES appearing twice in the batch is upserted once, with its last version
+        rows[smart_cres.r_object_id[0]] = {
+            "id_interlocutor": id_interlocutor,
+            "site": sites.get(id_interlocutor),
+            "siv2": smart_cres.r_object_id[0],
+            "name": smart_cres.r_object_name[0],
+            "summary": " ### ".join(smart_cres.description),
+            "date": select_first_date(smart_cres.date),
+            "natures": smart_cres.natures,
+            "inb_information": smart_cres.inbs,
+            "last_touched": now,
+        }
+    return list(rows.values())
+
+
+def upsert_statement(rows: List[Dict]):
+    """
+    The statement inserting the CRES, or updating those whose siv2 object id
+    is already in the database, and returning their ids
+    """
+    statement = insert(SiancedbCres).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[SiancedbCres.siv2],
+        set_={
+            column: statement.excluded[column]
+            for column in rows[0].keys()
+            if column != "siv2"
+        },
+    ).returning(SiancedbCres.id_cres)
+
+
+def upsert_cres(db: Session, rows: List[Dict]) -> List[int]:
+    """
+    Insert the CRES, or update those whose siv2 object id
+    is already in the database, in a single statement.
+
+    The name of a CRES is unique too: a CRES whose name is already used
+    by another siv2 object makes the whole statement fail. The rows of the
+    batch are then upserted one by one, and only the conflicting ones are skipped.
+
+    Returns:
+        List[int]: the ids of the inserted or updated CRES
+    """
+    if len(rows) == 0:
+        return []
+    try:
+        with db.begin_nested():
+            id_cres = [row[0] for row in db.execute(upsert_statement(rows))]
+    except IntegrityError:
+        id_cres = []
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    id_cres.extend(r[0] for r in db.execute(upsert_statement([row])))
+            except IntegrityError as e:
+                logger.warning(
+                    f"The CRES {row['name']} (siv2 {row['siv2']}) is skipped, "
+                    f"it conflicts with another CRES: {e.orig}"
+                )
+    db.commit()
+    return id_cres
+
+
+def ingest_cres_batch(
+    siv2responses: List[Dict],
+    interlocutor_file="asn_interlocuteur.txt",
+) -> List[int]:
+    """
+    Build, upsert and index a batch of CRES from the dump.
+
+    Returns:
+        List[int]: the ids of the CRES of the batch
+    """
+    with SessionWrapper() as db:
+        rows = build_cres_batch(db, siv2responses, interlocutor_file=interlocutor_file)
+        id_cres = upsert_cres(db, rows)
+    index_cres(id_cres)
+    return id_cres
+
+
 ##
 #  STEP 4:
 #     Reading a dump file and figure out all the
@@ -266,18 +475,17 @@ def last_update_time() -> date:
         return UNKNOWN_DATE.date()
 
 
-def select_updatable_from_dump(dump_file: str) -> List[Dict]:
+def select_updatable_from_dump(dump_file: str) -> Iterator[Dict]:
+    """
+    Streams the CRES of the dump modified since the last update,
+    using the date index of the local copy of the dump
+    """
     last_touched = last_update_time()
+    store = open_store(dump_file)
 
-    with open(dump_file, "r") as content:
-        jsons = (json.loads(line) for line in content.readlines())
-
-        return [
-            cres
-            for cres in jsons
-            if last_touched == UNKNOWN_DATE
-            or process_french_date(cres.get("r_modify_date")).date() >= last_touched
-        ]
+    if last_touched == UNKNOWN_DATE:
+        return store.scan()
+    return store.scan(modified_since=last_touched)
 
 
 ###
@@ -287,7 +495,10 @@ def select_updatable_from_dump(dump_file: str) -> List[Dict]:
 def index_cres(id_cres: List[int]):
     with SessionWrapper() as db:
         cres_res = (
-            db.query(SiancedbCres).filter(SiancedbCres.id_cres.in_(id_cres)).all()
+            db.query(SiancedbCres)
+            .options(joinedload(SiancedbCres.interlocutor))
+            .filter(SiancedbCres.id_cres.in_(id_cres))
+            .all()
         )
 
         return bulk_insert(
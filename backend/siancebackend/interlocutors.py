@@ -1,30 +1,70 @@
 import time
+import threading
 import sqlalchemy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from siancedb.models import SiancedbInterlocutor, SessionWrapper
+from siancebackend.enrichment import (
+    GeoClient,
+    InseeClient,
+    enrichment_config,
+    shared_bucket,
+    shared_cache,
+    shared_session,
+)
 import requests
 import logging
 
 logger = logging.getLogger("interlocutors")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/interlocutors.log")
+fh = logging.FileHandler("logs/interlocutors.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
 
+def insee_client() -> InseeClient:
+    """
+    The client of the SIRENE API shared within the process
+    """
+    global _insee_client
+    if _insee_client is None:
+        config = enrichment_config()
+        _insee_client = InseeClient(
+            token=lambda: get_memoized_token("token"),
+            refresh_token=refresh_memoized_token,
+            base_url=config.get("insee_url", "https://api.insee.fr"),
+            cache=shared_cache(),
+            bucket=shared_bucket(),
+            session=shared_session(),
+            timeout=config.get("timeout", 30),
+        )
+    return _insee_client
+
+
+def geo_client() -> GeoClient:
+    """
+    The client of geo.api.gouv.fr shared within the process
+    """
+    global _geo_client
+    if _geo_client is None:
+        config = enrichment_config()
+        _geo_client = GeoClient(
+            base_url=config.get("geo_url", "https://geo.api.gouv.fr"),
+            cache=shared_cache(),
+            session=shared_session(),
+            timeout=config.get("timeout", 30),
+        )
+    return _geo_client
+
+
 def get_latlon_interlocutor(zip_code):
     """
     Request GEO.API.GOUV.FR to get city name and geojson coordinates from French code postal
     """
-    zip_code = str(zip_code)
-    url = "https://geo.api.gouv.fr/communes?codePostal={}&fields=centre,codeRegion&format=json&geometry=centre".format(
-        zip_code
-    )
-    response = requests.get(url).json()[0]
-    return {
-        "city": response["nom"],
-        "region": response["codeRegion"],
-        "geojson": response["centre"],
-    }
+    latlon = geo_client().commune(str(zip_code))
+    if latlon is None:
+        raise ValueError(f"Unknown postal code {zip_code}")
+    return latlon
 
 
 def get_insee_information(siret: str):
@@ -37,39 +77,21 @@ def get_insee_information(siret: str):
     Returns:
         dict: commercial (SIREN, name, main site) and geographical (zip code) information about the company
     """
-    def get_api_response(siret: str, token: str):
-        url = "https://api.insee.fr/entreprises/sirene/V3/siret/{}".format(siret)
-        return requests.get(url, headers={"Authorization": "Bearer {}".format(token)})
-
-    token = get_memoized_token("token")
-    response = get_api_response(siret, token)
-    if response.status_code == 401: # unauthorized token
-        token  = get_token("token")
-        get_memoized_token.set("token", token)
-        response = get_api_response(siret, token)
-        
-    # in case of error 429 (too many requests in a timelapse), wait a bit before requesting again
-    while response.status_code == 429:
-        time.sleep(5)
-        response = get_api_response(siret, token)
-
-    logger.debug(f"In request {siret}, response is {response}.")
-
-    if response.status_code == 404:
-        logger.debug(
-            f"The siret {siret} is not registered at INSEE. This interlocutor is unknown "
-        )
-        return None
-
     try:
         # gather information about the local company office (French: établissement) matching the SIRET
-        response = response.json()["etablissement"]
+        response = insee_client().establishment(siret)
     except KeyError:
         logger.error(
             f"The format of INSEE API appears to have changed. Please look at INSEE doc to fix it quickly"
         )
         return None
 
+    if response is None:
+        logger.debug(
+            f"The siret {siret} is not registered at INSEE. This interlocutor is unknown "
+        )
+        return None
+
     insee_information = {
         "siren": response["siren"],
         "siret": response["siret"],
@@ -91,22 +113,29 @@ def memoize(f):
     """
     Useful function used as decorator to "memoize" objets (to avoid request the same objects too often)
 
-    In pratice, used to memorize and return an `interlocutor` instance thanks to a SIRET while filling the interlocutors table
-    TODO: add limit in time of the memoization so that it does not return too long the old info
-    about a company if its info changes
+    In pratice, used to memorize and return an `interlocutor` instance thanks to a SIRET while filling the interlocutors table.
+    The memorized values expire after `enrichment.memoize_seconds` (default: one day)
+    so that the info about a company is eventually updated if it changes
 
     Args:
         f (function): The function where to apply memoization
 
     Returns:
-        [type]: [description]
+        function: the memoized function
     """
     memo = {}
+    lock = threading.Lock()
 
     def helper(*x):
-        if not x[0] in memo:
-            memo[x[0]] = f(*x)
-        return memo[x[0]]
+        ttl = enrichment_config().get("memoize_seconds", 24 * 3600)
+        with lock:
+            value, expires = memo.get(x[0], (None, 0))
+        if time.monotonic() < expires:
+            return value
+        value = f(*x)
+        with lock:
+            memo[x[0]] = (value, time.monotonic() + ttl)
+        return value
 
     return helper
 
@@ -140,6 +169,16 @@ def get_token(desc: str="token"):
 
 get_memoized_token = MemoizeToken(get_token)
 
+
+def refresh_memoized_token() -> str:
+    token = get_token("token")
+    get_memoized_token.set(("token",), token)
+    return token
+
+
+_insee_client = None
+_geo_client = None
+
 @memoize
 def get_or_create_interlocutor(siret: str):
     """
@@ -213,3 +252,30 @@ def prepare_interlocutor(siret: str):
             interlocutor["postal_code"] = None
             interlocutor["region"] = None
         return interlocutor
+
+
+def prepare_interlocutor_or_none(siret: str) -> Optional[Dict]:
+    """
+    `prepare_interlocutor`, logging the failures instead of raising them
+    """
+    try:
+        return prepare_interlocutor(siret)
+    except Exception as e:
+        logger.error(f"Impossible to gather the information of the siret {siret}: {e}")
+        return None
+
+
+def prepare_interlocutors(sirets: List[str]) -> Dict[str, Optional[Dict]]:
+    """
+    `prepare_interlocutor` for many sirets at once. The requests are sent
+    by `enrichment.workers` threads, the INSEE quota being enforced
+    by the token bucket of the client rather than by waiting after errors.
+    A siret whose information cannot be gathered does not stop the others.
+
+    Returns:
+        Dict[str, Optional[Dict]]: the information of each siret, None when it failed
+    """
+    sirets = list(dict.fromkeys(str(siret) for siret in sirets))
+    workers = enrichment_config().get("workers", 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(sirets, executor.map(prepare_interlocutor_or_none, sirets)))
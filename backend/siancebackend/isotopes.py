@@ -7,13 +7,14 @@ from siancebackend.letter_management import normalize_text
 
 from siancedb.pandas_writer import chunker
 from siancedb.config import get_config
+from siancebackend.referentials import read_referential
 
 import logging
 
 
 logger = logging.getLogger("isotopes")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/isotopes.log")
+fh = logging.FileHandler("logs/isotopes.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -21,7 +22,7 @@ CONFIG = get_config()
 
 
 def get_isotopes_ref():
-    return pd.read_excel(CONFIG["letters"]["isotopes"], engine="openpyxl")
+    return read_referential(CONFIG["letters"]["isotopes"], engine="openpyxl")
 
 
 def extract_isotopes(text: str, isotopes_ref: pd.DataFrame) -> List[Dict]:
@@ -0,0 +1,142 @@
+"""
+
+Parallel extraction of the text of the pdfs
+
+The pdfs are dispatched on a pool of threads to one or several
+Tika servers, with a timeout and retries for every document.
+The results are yielded as soon as they are ready.
+
+Configuration (all optional, in the `tika` section):
+    endpoints: list of Tika urls, defaults to `http://host:port`
+    concurrency: number of documents parsed at the same time
+        (default: 2 per endpoint)
+    timeout: timeout in seconds of one request (default 120)
+    retries: number of new attempts after a failure (default 2)
+    local_fallback: when true, a document that failed on every attempt
+        is parsed one last time by the Tika server that `tika-python`
+        starts locally
+
+"""
+import logging
+import threading
+from itertools import cycle, islice
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tika import parser
+
+from siancedb.config import get_config
+
+from siancebackend.letter_management.parse_cache import parse_pdf
+
+logger = logging.getLogger("letters")
+
+
+def tika_endpoints() -> List[str]:
+    tika = get_config()["tika"]
+    return tika.get("endpoints", [f"http://{tika['host']}:{tika['port']}"])
+
+
+class ExtractionPool:
+    """
+    Dispatches the pdfs on the Tika endpoints in round robin.
+
+    Args:
+        endpoints (List[str]): the Tika servers, defaults to `tika_endpoints()`
+        concurrency (int): the number of documents parsed at the same time
+        timeout (float): the timeout in seconds of one request
+        retries (int): how many times a failed document is tried again
+        local_fallback (bool): parse with a local Tika server as a last resort
+    """
+
+    def __init__(
+        self,
+        endpoints: Optional[List[str]] = None,
+        concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        local_fallback: Optional[bool] = None,
+    ):
+        tika = get_config()["tika"]
+        self.endpoints = endpoints or tika_endpoints()
+        self.concurrency = concurrency or tika.get(
+            "concurrency", 2 * len(self.endpoints)
+        )
+        self.timeout = timeout or tika.get("timeout", 120)
+        self.retries = retries if retries is not None else tika.get("retries", 2)
+        self.local_fallback = (
+            local_fallback
+            if local_fallback is not None
+            else tika.get("local_fallback", False)
+        )
+        self._endpoints = cycle(self.endpoints)
+        self._lock = threading.Lock()
+
+    def next_endpoint(self) -> str:
+        with self._lock:
+            return next(self._endpoints)
+
+    def extract_one(self, pdf_path: str) -> Dict:
+        """
+        Parse one pdf, trying the next endpoint after each failure
+        """
+        error = None
+        for attempt in range(self.retries + 1):
+            endpoint = self.next_endpoint()
+            try:
+                raw = parse_pdf(
+                    pdf_path, endpoint, request_options={"timeout": self.timeout}
+                )
+                if raw.get("status", 200) == 200 and raw.get("metadata") is not None:
+                    return raw
+                error = f"status {raw.get('status')}"
+            except Exception as e:
+                error = e
+            logger.warning(
+                f"Attempt {attempt + 1} to parse {pdf_path} on {endpoint} failed: {error}"
+            )
+        if self.local_fallback:
+            logger.warning(f"Parsing {pdf_path} with the local Tika server")
+            return parser.from_file(pdf_path)
+        raise RuntimeError(f"Impossible to parse {pdf_path}: {error}")
+
+    def extract(self, pdf_paths: Iterable[str]) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Parse the pdfs concurrently and yield the pairs (path, raw)
+        in the order of completion. `raw` is None when the document
+        could not be parsed.
+
+        At most `2 * concurrency` documents are submitted at the same time:
+        a new one is submitted each time a result is yielded, so that the
+        memory does not grow with the number of pdfs.
+        """
+        pdf_paths = iter(pdf_paths)
+        max_pending = 2 * self.concurrency
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {
+                executor.submit(self.extract_one, pdf_path): pdf_path
+                for pdf_path in islice(pdf_paths, max_pending)
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                while done:
+                    future = done.pop()
+                    pdf_path = pending.pop(future)
+                    try:
+                        raw = future.result()
+                    except Exception as e:
+                        logger.error(e)
+                        raw = None
+                    del future
+                    for next_path in islice(pdf_paths, 1):
+                        pending[executor.submit(self.extract_one, next_path)] = next_path
+                    yield pdf_path, raw
+
+
+@lru_cache(maxsize=None)
+def default_pool() -> ExtractionPool:
+    """
+    The pool configured in the `tika` section, shared within the process
+    """
+    return ExtractionPool()
@@ -7,9 +7,14 @@
 #
 
 from dataclasses import dataclass
-from typing import List
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import os
 import re
+import json
+import asyncio
+import hashlib
+import logging
+import aiohttp
 import feedparser
 import wget
 from siancedb.config import get_config
@@ -23,6 +28,8 @@ from siancedb.models import (
 cfg = get_config()
 LETTERS = cfg["letters"]
 
+logger = logging.getLogger("siancebackend")
+
 
 def letters_to_append(names: List[str]):
     with SessionWrapper() as db:
@@ -142,6 +149,244 @@ def fetch_rss_letters():
             yield letter_from_rss(item)
 
 
+####
+# Concurrent acquisition: the feeds and the pdfs
+# are requested with conditional requests (ETag / Last-Modified)
+# and the pdfs already known are not requested at all.
+# The validators and the hashes of the downloaded files
+# are kept in a small JSON state file.
+####
+
+
+def acquisition_state_path() -> str:
+    return LETTERS.get("acquisition_state", f"{LETTERS['path']}.acquisition.json")
+
+
+def load_acquisition_state() -> Dict:
+    try:
+        with open(acquisition_state_path(), "r") as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        state = dict()
+    state.setdefault("feeds", dict())
+    state.setdefault("letters", dict())
+    return state
+
+
+def save_acquisition_state(state: Dict):
+    path = acquisition_state_path()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path: str) -> Optional[Dict]:
+    """
+    Size and sha256 of a file, or None if it does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha256.update(block)
+    return {"size": os.path.getsize(path), "sha256": sha256.hexdigest()}
+
+
+def conditional_headers(validators: Dict) -> Dict[str, str]:
+    headers = dict()
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def response_validators(response: aiohttp.ClientResponse) -> Dict[str, str]:
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+async def fetch_feed(
+    session: aiohttp.ClientSession, feed: str, state: Dict
+) -> Tuple[List, Optional[Dict]]:
+    """
+    The RSS items of a feed and its new validators, or nothing
+    if the feed did not change since the last acquisition.
+    The validators are not saved in the state here: they are
+    only worth keeping once all the letters of the feed are fetched
+    """
+    validators = state["feeds"].get(feed, dict())
+    async with session.get(feed, headers=conditional_headers(validators)) as response:
+        if response.status == 304:
+            logger.info(f"The feed {feed} did not change")
+            return [], None
+        response.raise_for_status()
+        content = await response.read()
+        validators = response_validators(response)
+    return feedparser.parse(content).entries, validators
+
+
+def letter_origin(letter: RSSLetter) -> Dict[str, str]:
+    """
+    What is needed to fetch the letter again without its feed
+    """
+    return {"url": letter.url, "summary": letter.summary, "rss_uid": letter.rss_uid}
+
+
+async def fetch_letter(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    letter: RSSLetter,
+    state: Dict,
+) -> RSSLetter:
+    """
+    Download a letter unless the copy on disk is up to date.
+    The file is written in a temporary file then renamed, so that
+    a partial download never replaces a complete one.
+
+    Returns:
+        the letter, whose pdf is on disk, whether it was downloaded
+        again or not: a pdf downloaded by a previous acquisition may
+        never have been built into `ape_letters`
+    """
+    known = state["letters"].get(letter.name, dict())
+    on_disk = file_fingerprint(letter.path)
+    up_to_date = on_disk is not None and on_disk == known.get("fingerprint")
+    headers = conditional_headers(known) if up_to_date else dict()
+
+    async with semaphore:
+        async with session.get(letter.url, headers=headers) as response:
+            if response.status == 304:
+                state["letters"][letter.name] = {**known, **letter_origin(letter)}
+                return letter
+            response.raise_for_status()
+            tmp_path = f"{letter.path}.part"
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                with open(tmp_path, "wb") as f:
+                    async for block in response.content.iter_chunked(1 << 16):
+                        sha256.update(block)
+                        size += len(block)
+                        f.write(block)
+                fingerprint = {"size": size, "sha256": sha256.hexdigest()}
+                if fingerprint != on_disk:
+                    os.replace(tmp_path, letter.path)
+            finally:
+                # an interrupted download (or a copy identical to the one on disk) is not kept
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            validators = response_validators(response)
+
+    state["letters"][letter.name] = {
+        **validators,
+        "fingerprint": fingerprint,
+        **letter_origin(letter),
+    }
+    return letter
+
+
+def pending_letters(known_names: Set[str], state: Dict) -> List[RSSLetter]:
+    """
+    The letters downloaded by a previous acquisition that are not in the
+    database yet (e.g. the build of the letters failed), even if their feed
+    did not change since or does not list them anymore
+    """
+    return [
+        RSSLetter(
+            known["url"],
+            build_letter_path(known["summary"]),
+            known.get("rss_uid"),
+            known["summary"],
+            name,
+        )
+        for name, known in state["letters"].items()
+        if "url" in known and name not in known_names and known["summary"] not in known_names
+    ]
+
+
+async def acquire_letters(known_names: Set[str], state: Dict) -> List[RSSLetter]:
+    concurrency = LETTERS.get("download_concurrency", 8)
+    timeout = aiohttp.ClientTimeout(total=LETTERS.get("download_timeout", 300))
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        feeds = await asyncio.gather(
+            *(fetch_feed(session, feed, state) for feed in LETTERS["rss"]),
+            return_exceptions=True,
+        )
+        new_validators = dict()
+        letters = []
+        for feed, result in zip(LETTERS["rss"], feeds):
+            if isinstance(result, Exception):
+                # the previous validators are kept, the feed is read again next time
+                logger.error(f"Impossible to read the feed {feed}: {result}")
+                continue
+            items, validators = result
+            if validators is not None:
+                new_validators[feed] = validators
+            letters.extend(
+                (feed, letter)
+                for letter in (letter_from_rss(item) for item in items)
+                if letter.name not in known_names and letter.summary not in known_names
+            )
+        in_feeds = {letter.name for _, letter in letters}
+        letters.extend(
+            (None, letter)
+            for letter in pending_letters(known_names, state)
+            if letter.name not in in_feeds
+        )
+        results = await asyncio.gather(
+            *(
+                fetch_letter(session, semaphore, letter, state)
+                for _, letter in letters
+            ),
+            return_exceptions=True,
+        )
+    downloaded = []
+    incomplete_feeds = set()
+    for (feed, letter), result in zip(letters, results):
+        if isinstance(result, Exception):
+            logger.error(f"Impossible to download {letter.url}: {result}")
+            incomplete_feeds.add(feed)
+        else:
+            downloaded.append(result)
+    for feed in incomplete_feeds:
+        # the feed must be read again next time to retry its letters
+        new_validators.pop(feed, None)
+        state["feeds"].pop(feed, None)
+    state["feeds"].update(new_validators)
+    return downloaded
+
+
+def acquire_new_letters(known_names: Iterable[str] = None) -> List[RSSLetter]:
+    """
+    Fetch the RSS feeds and download, concurrently, the letters
+    that are not in the database (a pdf already on disk and up to date
+    is not downloaded again). The state of the acquisition is saved
+    only after a complete pass.
+
+    Args:
+        known_names (Iterable[str]): the names to skip,
+            defaults to the names of the letters in the database
+
+    Returns:
+        List[RSSLetter]: the letters not in the database, whose pdf is on disk
+    """
+    if known_names is None:
+        with SessionWrapper() as db:
+            known_names = [row[0] for row in db.query(SiancedbLetter.name).all()]
+    state = load_acquisition_state()
+    before = json.dumps(state, sort_keys=True)
+    letters = asyncio.run(acquire_letters(set(known_names), state))
+    if json.dumps(state, sort_keys=True) != before:
+        save_acquisition_state(state)
+    return letters
+
+
 ####
 # These functions now interact with the
 # database to determine whether or not
@@ -1,5 +1,4 @@
 import re
-import dateparser
 import logging
 from datetime import date, datetime
 import json
@@ -11,7 +10,7 @@ import pandas as pd
 
 logger = logging.getLogger("letters")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/letters.log")
+fh = logging.FileHandler("logs/letters.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -88,6 +87,32 @@ def extract_inspection(text: str):
         return None
 
 
+FRENCH_MONTHS = {
+    "janvier": 1,
+    "fevrier": 2,
+    "février": 2,
+    "mars": 3,
+    "avril": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "aout": 8,
+    "août": 8,
+    "septembre": 9,
+    "octobre": 10,
+    "novembre": 11,
+    "decembre": 12,
+    "décembre": 12,
+}  #: French month names (with and without accents) -> month number
+
+sent_date_re = re.compile(
+    r"le[ ]*([0-9]{1,2})[ ]*"
+    r"(janvier|f[e|é]vrier|mars|avril|mai|juin|juillet|ao[u|û]t"
+    r"|septembre|octobre|novembre|d[e|é]cembre)"
+    r"[ ]*([0-9]{4})"
+)  #: A French date such as « le 12 février 2019 »
+
+
 def extract_sent_date(text: str):
     """
     Extract the date of the letter that is written in French at the beginning of the letter
@@ -104,30 +129,18 @@ def extract_sent_date(text: str):
     text_beginning = text[
         :500
     ]  # the date is supposed to be at the very beginning of the letter
-    pattern = [
-        r"le[ ]*[0-9]{1,2}[ ]*janvier[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*f[e|é]vrier[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*mars[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*avril[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*mai[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*juin[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*juillet[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*ao[u|û]t[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*septembre[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*octobre[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*novembre[ ]*[0-9]{4}",
-        r"le[ ]*[0-9]{1,2}[ ]*d[e|é]cembre[ ]*[0-9]{4}",
-    ]
-    pattern = "|".join(pattern)
     # assuming the sent date is the first date in the letter that follows the word "le"
+    match = sent_date_re.search(text_beginning)
+    if match is None:  # no date-like found in letter
+        return date(1970, 1, 1)
+    day, month, year = match.groups()
     try:
-        date_str = re.findall(pattern=pattern, string=text_beginning)[0]
-        date_dt = dateparser.parse(date_str).date()
-        if date_dt <= date.today():
-            return date_dt
-        else:
-            return date(1970, 1, 1)
-    except IndexError:  # no date-like found in letter
+        date_dt = date(int(year), FRENCH_MONTHS[month], int(day))
+    except (KeyError, ValueError):  # eg: « f|vrier » or « le 31 avril »
+        return date(1970, 1, 1)
+    if date_dt <= date.today():
+        return date_dt
+    else:
         return date(1970, 1, 1)
 
 
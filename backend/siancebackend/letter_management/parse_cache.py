@@ -0,0 +1,159 @@
+"""
+
+Cache of the Tika parse results
+
+The content and metadata extracted by Tika from a pdf are stored
+on the local disk, gzipped, under the SHA-256 of the pdf bytes.
+Rebuilding the letters (or experimenting with the cleaning functions)
+then reuses the extracted text without calling the Tika server.
+
+The cache lives in `tika.cache_directory` (default `tika_cache`)
+and can be disabled with `tika.parse_cache: false` in the configuration.
+
+"""
+import os
+import gzip
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional
+
+from tika import parser
+
+from siancedb.config import get_config
+
+logger = logging.getLogger("letters")
+
+# updated by the threads of the extraction pool
+STATS = {"hits": 0, "misses": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def count(stat: str):
+    with _stats_lock:
+        STATS[stat] += 1
+
+
+def cache_directory() -> str:
+    return get_config()["tika"].get("cache_directory", "tika_cache")
+
+
+def cache_enabled() -> bool:
+    return get_config()["tika"].get("parse_cache", True)
+
+
+def pdf_sha256(pdf_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def cache_path(sha256: str) -> str:
+    return os.path.join(cache_directory(), sha256[:2], f"{sha256}.json.gz")
+
+
+def read_cached_parse(sha256: str) -> Optional[Dict]:
+    try:
+        with gzip.open(cache_path(sha256), "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError) as e:
+        logger.error(f"Corrupted parse cache entry {sha256}: {e}")
+        return None
+
+
+def write_cached_parse(sha256: str, raw: Dict):
+    path = cache_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a temporary file per writer: two threads may parse identical pdfs at the same time
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp, gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"content": raw["content"], "metadata": raw["metadata"]}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def parse_pdf(pdf_path: str, url_tika: str, request_options: Dict = None) -> Dict:
+    """
+    Same as `tika.parser.from_file`, but the result
+    is read from the cache when the same pdf was already parsed.
+
+    Args:
+        pdf_path (str): the path of the pdf to parse
+        url_tika (str): the url of the Tika server
+        request_options (Dict): passed to `requests` (eg: the timeout)
+
+    Returns:
+        Dict: a dictionary with the keys `content` and `metadata`
+    """
+    request_options = request_options or {}
+    if not cache_enabled():
+        return parser.from_file(pdf_path, url_tika, requestOptions=request_options)
+
+    sha256 = pdf_sha256(pdf_path)
+    cached = read_cached_parse(sha256)
+    if cached is not None:
+        count("hits")
+        return cached
+
+    count("misses")
+    raw = parser.from_file(pdf_path, url_tika, requestOptions=request_options)
+    # failed parses are not cached, they will be tried again
+    if raw.get("status", 200) == 200 and raw.get("metadata") is not None:
+        write_cached_parse(sha256, raw)
+    else:
+        count("errors")
+    return raw
+
+
+def cache_stats() -> Dict[str, int]:
+    """
+    The number of entries and bytes of the cache on disk,
+    and the hits / misses of the current process
+    """
+    entries, size = 0, 0
+    directory = cache_directory()
+    if os.path.isdir(directory):
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.endswith(".json.gz"):
+                    entries += 1
+                    size += os.path.getsize(os.path.join(root, filename))
+    with _stats_lock:
+        return {"entries": entries, "bytes": size, **STATS}
+
+
+def invalidate_cache(pdf_paths: Optional[Iterable[str]] = None) -> int:
+    """
+    Remove the cached parses of the given pdfs,
+    or the whole cache when no pdf is given.
+
+    Returns:
+        int: the number of entries removed
+    """
+    if pdf_paths is None:
+        paths = [
+            os.path.join(root, filename)
+            for root, _, files in os.walk(cache_directory())
+            for filename in files
+            if filename.endswith(".json.gz")
+        ]
+    else:
+        paths = [cache_path(pdf_sha256(pdf_path)) for pdf_path in pdf_paths]
+
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -31,11 +31,11 @@ from siancedb.pandas_writer import chunker
 
 from siancedb.config import get_config
 
-from tika import parser
+from siancebackend.letter_management.extraction_pool import default_pool
 
 logger = logging.getLogger("letters")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/letters.log")
+fh = logging.FileHandler("logs/letters.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -43,20 +43,23 @@ CONFIG = get_config()
 SIV2 = get_config()["siv2"]
 
 
-def build_one_letter(pdf_path: str, already_seen=None):
+def build_one_letter(pdf_path: str, already_seen=None, raw=None):
     """
     This is the main function of this document.
     It builds the letter / doc / metadata / interlocutor
     using the info passed as arguments.
     This function checks the letter is not already in the database
 
+    The result of the Tika parse can be given with `raw`,
+    otherwise the pdf is parsed here (a RuntimeError is raised
+    if it cannot be parsed)
     """
     if already_seen is None:
         already_seen = set()
 
     # PARSE PDF WITH TIKA
-    url_tika_local = f"http://{CONFIG['tika']['host']}:{CONFIG['tika']['port']}"
-    raw = parser.from_file(pdf_path, url_tika_local)
+    if raw is None:
+        raw = default_pool().extract_one(pdf_path)
     # Exclude scanned PDF (content = None) and PDF with encodings that TIKA does not know
     if (
         raw["content"] is not None
@@ -128,18 +131,23 @@ def build_letters(db: Session, pipe_logger=None):
     letters_count = 0
     chunk_size = 100
     letters = []
-    for chunk in chunker(chunk_size, documents_list):
+    # the pdfs are parsed concurrently, and the letters built
+    # in the order in which the parses complete
+    extracted = default_pool().extract(
+        f"{CONFIG['letters']['data']['letters_pdf']}/{filename}"
+        for filename in documents_list
+    )
+    for chunk in chunker(chunk_size, extracted):
         logger.info("Starting new chunk of data")
 
-        for filename in chunk:
-            letter, is_old = build_one_letter(
-                f"{CONFIG['letters']['data']['letters_pdf']}/{filename}",
-                already_seen,
-            )
+        for pdf_path, raw in chunk:
+            if raw is None:
+                continue
+            letter, is_old = build_one_letter(pdf_path, already_seen, raw=raw)
             if not is_old:
                 db.add(letter)
                 letters.append(letter)
-        letters_count += chunk_size
+        letters_count += len(chunk)
         update_log_state(
             pipe=pipe_logger, progress=letters_count / n_documents, step="letters"
         )
@@ -26,7 +26,7 @@ REFERENTIALS = cfg["letters"]["referentials"]
 logger = logging.getLogger("siance-pdf-server")
 logger.setLevel(logging.DEBUG)
 # create file handler which logs even debug messages
-fh = TimedRotatingFileHandler("siance_pdf_server.log")
+fh = TimedRotatingFileHandler("siance_pdf_server.log", delay=True)
 fh.setLevel(logging.DEBUG)
 # create console handler with a higher log level
 ch = logging.StreamHandler()
@@ -1,20 +1,26 @@
 from siancedb.models import SiancedbInterlocutor, SessionWrapper
-from siancebackend.interlocutors import prepare_interlocutor
+from siancedb.pandas_writer import chunker
+from siancebackend.interlocutors import prepare_interlocutors
 
 
-def migrate():
-    count = 1
+def migrate(chunk_size: int = 100):
+    count = 0
     with SessionWrapper() as db:
-        for interlocutor in db.query(SiancedbInterlocutor).all():
-            if count % 10 == 0:
-                print(f"Processed {count} documents", flush=True)
-            if interlocutor.siret:
-                continue
-
-            try:
-                insee_information = prepare_interlocutor(interlocutor.siret)
-                interlocutor.region = insee_information.get("region") or "0"
-                db.commit()
-                count += 1
-            except:
-                pass
+        interlocutors = [
+            interlocutor
+            for interlocutor in db.query(SiancedbInterlocutor).all()
+            if interlocutor.siret
+        ]
+        # the INSEE and geo requests are sent in parallel, within the quota,
+        # and every chunk is committed so that the progress survives a failure
+        for chunk in chunker(chunk_size, interlocutors):
+            informations = prepare_interlocutors(
+                [interlocutor.siret for interlocutor in chunk]
+            )
+            for interlocutor in chunk:
+                insee_information = informations.get(str(interlocutor.siret))
+                if insee_information is not None:
+                    interlocutor.region = insee_information.get("region") or "0"
+            db.commit()
+            count += len(chunk)
+            print(f"Processed {count} documents", flush=True)
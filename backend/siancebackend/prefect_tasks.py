@@ -9,6 +9,7 @@ from siancebackend.letter_management.letter_acquisition import (
     RSSLetter,
     fetch_rss_letters,
     download_letter,
+    acquire_new_letters,
 )
 from siancedb.models import (
     SiancedbIsotope,
@@ -24,12 +25,18 @@ from siancedb.models import (
     SessionWrapper,
 )
 from siancebackend.letters import build_one_letter
-from siancebackend.siv2metadata import build_siv2metadata_one_letter
+from siancebackend.siv2metadata import (
+    build_siv2metadata_one_letter,
+    prefetch_siv2,
+    refresh_siv2metadata_one_letter,
+)
+from siancebackend.siv2_client import siv2_client
 from siancebackend.sections_demands import build_sections_demands_one_letter
 from siancebackend.trigrams import build_trigrams_one_letter, get_edf_trigrams_ref
 from siancebackend.isotopes import build_isotopes_one_letter, get_isotopes_ref
 from siancebackend.classifiers.classify_topics import (
     classify_topics_one_letter,
+    letters_without_predictions,
     load_pipeline,
     prepare_score_dict,
 )
@@ -39,6 +46,7 @@ from siancebackend.classifiers.classify_themes import (
 )
 from siancebackend.letter_management.sentencizer import prepare_sentencizer
 from siancedb.elasticsearch.management import bulk_insert
+from siancedb.pandas_writer import chunker
 from siancebackend.indexation import (
     letter_generator,
     labels_dict,
@@ -46,6 +54,7 @@ from siancebackend.indexation import (
 
 from siancebackend.ingest_cres import (
     build_one_cres,
+    ingest_cres_batch,
     select_updatable_from_dump,
     index_cres,
 )
@@ -93,6 +102,20 @@ def index_new_cres(id_cres: int):
     return index_cres([id_cres])
 
 
+@task
+def fetch_updatable_CRES_batches(batch_size: int = 500) -> List[List[Dict]]:
+    return [
+        list(batch)
+        for dump_file in PRF["asn_cres"]
+        for batch in chunker(batch_size, select_updatable_from_dump(dump_file))
+    ]
+
+
+@task
+def build_add_and_index_cres_batch(siv2cres_batch: List[Dict]) -> List[int]:
+    return ingest_cres_batch(siv2cres_batch, PRF["asn_interlocutor"])
+
+
 ########
 
 
@@ -111,6 +134,16 @@ class Download(Task):
         return download_letter(letter)
 
 
+class AcquireNewLetters(Task):
+    """
+    Fetch the feeds and download concurrently the letters that are new,
+    returns the paths of the downloaded pdfs
+    """
+
+    def run(self) -> List[str]:
+        return [letter.path for letter in acquire_new_letters()]
+
+
 class BuildLetter(Task):
     def __init__(self, already_seen: Iterable[str] = None, **kwargs):
         if already_seen is None:
@@ -308,12 +341,26 @@ class FetchLettersToRefresh(Task):
             return to_refresh
 
 
+class PrefetchSiv2(Task):
+    def run(self, letters: List[SiancedbLetter]) -> List[SiancedbLetter]:
+        # request the SIv2 concurrently for all the letters before they are refreshed one by one
+        prefetch_siv2(letter.name for letter in letters)
+        return letters
+
+
 class RefreshSiv2MetadataInterlocutor(Task):
     def run(self, letter: SiancedbLetter) -> SiancedbLetter:
         # if there is already siv2metadata in database, replace them
         # if there is already interlocutor in database, it should be exactly the same due to memoization.
         # As interlocutors-letters relation is one-to-many, interlocutor must NOT be deleted during this process
-        siv2metadata, interlocutor = build_siv2metadata_one_letter(letter)
+        refreshed = refresh_siv2metadata_one_letter(letter)
+        if refreshed is None:  # the SIv2 payload did not change, nothing to rebuild
+            with SessionWrapper() as db:
+                letter.last_touched = datetime.now()
+                db.add(letter)
+                db.commit()
+            return letter
+        siv2metadata, interlocutor, siv2_response = refreshed
         with SessionWrapper() as db:
             old_metadata = (
                 db.query(SiancedbSIv2LettersMetadata)
@@ -326,6 +373,8 @@ class RefreshSiv2MetadataInterlocutor(Task):
             if interlocutor is not None:
                 db.add(interlocutor)
             db.commit()
+        # the payload is known to be built only once the metadata are committed
+        siv2_client().record_payload_hash(letter.name, siv2_response)
         with SessionWrapper() as db:
             if interlocutor is not None:
                 letter.id_interlocutor = interlocutor.id_interlocutor
@@ -374,7 +423,9 @@ def build_predictions(
 
 
 @task
-def fill_index(letter, id_model, labels=labels_dict()):
+def fill_index(letter, id_model, labels=None):
+    if labels is None:
+        labels = labels_dict()
     # refreshing in "hard way" the letter to refresh all of its children
     with SessionWrapper() as db:
         letter = (
@@ -390,11 +441,7 @@ def fill_index(letter, id_model, labels=labels_dict()):
 def get_letters_no_predictions(id_model):
     with SessionWrapper() as db:
         return (
-            db.query(SiancedbLetter)
-            .filter(
-                ~SiancedbLetter.predictions_dyn.any(
-                    SiancedbPrediction.id_model == id_model
-                )
-            )
+            letters_without_predictions(db, id_model, SiancedbLetter)
+            .order_by(SiancedbLetter.id_letter)
             .all()
         )
@@ -0,0 +1,92 @@
+"""
+
+Loading of the Excel referentials
+
+Reading a xlsx with openpyxl takes seconds, so each referential
+is converted once into a pickle, stored under a key made of
+the path, the modification time and the size of the xlsx and of the
+arguments given to `pd.read_excel`. A referential modified on disk
+is therefore read again, and every process (workers, CLI) afterwards
+only reads the pickle. Within a process, the dataframes are also
+kept in memory and shared by all the tasks.
+
+The pickles live in `letters.referentials_cache`
+(default `referentials_cache`) of the configuration.
+
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Tuple
+
+import pandas as pd
+
+from siancedb.config import get_config
+
+logger = logging.getLogger("siancebackend")
+
+_loaded: Dict[Tuple, pd.DataFrame] = dict()
+_lock = threading.Lock()
+
+
+def cache_directory() -> str:
+    return get_config()["letters"].get("referentials_cache", "referentials_cache")
+
+
+def referential_key(path: str, read_kwargs: Dict) -> Tuple:
+    """
+    What identifies a version of a referential read with some arguments
+    """
+    stat = os.stat(path)
+    return (
+        os.path.abspath(path),
+        stat.st_mtime_ns,
+        stat.st_size,
+        json.dumps(read_kwargs, sort_keys=True, default=str),
+    )
+
+
+def pickle_path(key: Tuple) -> str:
+    digest = hashlib.sha256(
+        json.dumps([*key, pd.__version__]).encode("utf-8")
+    ).hexdigest()
+    name = os.path.splitext(os.path.basename(key[0]))[0]
+    return os.path.join(cache_directory(), f"{name}-{digest[:16]}.pkl")
+
+
+def load_referential(key: Tuple, path: str, read_kwargs: Dict) -> pd.DataFrame:
+    cached = pickle_path(key)
+    try:
+        return pd.read_pickle(cached)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Corrupted cache {cached} of the referential {path}: {e}")
+    logger.info(f"Converting the referential {path}")
+    df = pd.read_excel(path, **read_kwargs)
+    try:
+        os.makedirs(cache_directory(), exist_ok=True)
+        tmp_path = f"{cached}.{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cached)
+    except OSError as e:
+        logger.error(f"Impossible to cache the referential {path}: {e}")
+    return df
+
+
+def read_referential(path: str, **read_kwargs) -> pd.DataFrame:
+    """
+    Same as `pd.read_excel(path, **read_kwargs)`, but the referential
+    is read from the cache when it was not modified.
+
+    The result is a copy, so the caller can modify it
+    """
+    key = referential_key(path, read_kwargs)
+    with _lock:
+        if key not in _loaded:
+            for outdated in [k for k in _loaded if k[0] == key[0] and k[3] == key[3]]:
+                del _loaded[outdated]
+            _loaded[key] = load_referential(key, path, read_kwargs)
+        return _loaded[key].copy()
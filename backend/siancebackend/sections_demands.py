@@ -18,7 +18,7 @@ from siancedb.pandas_writer import chunker
 
 logger = logging.getLogger("sections_demands")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/sections_demands.log")
+fh = logging.FileHandler("logs/sections_demands.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
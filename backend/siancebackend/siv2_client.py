@@ -0,0 +1,159 @@
+"""
+
+Client of the SIv2 REST API
+
+The requests share a pooled (keep-alive) session, have a timeout,
+and can be sent concurrently for many letters at once (`fetch_many`).
+The responses prefetched this way are kept in memory until they are used.
+
+The hash of the last payload received for each letter is kept
+in a SQLite file, so that a refresh can tell whether the SIv2
+changed anything since the last time the letter was built.
+
+Configuration (all optional, in the `siv2` section):
+    timeout: timeout in seconds of one request (default 30)
+    concurrency: number of requests sent at the same time (default 8)
+    payload_hashes: path of the SQLite file of the hashes
+        (default `siv2_payloads.sqlite`)
+
+"""
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import requests
+
+from siancedb.config import get_config
+
+from siancebackend.enrichment import TTLCache, pooled_session
+
+logger = logging.getLogger("siancebackend")
+
+
+def payload_hash(payload) -> str:
+    """
+    A hash of a SIv2 payload that does not depend on the order of the keys
+    """
+    if hasattr(payload, "to_dict"):  # the mock returns pandas Series
+        payload = payload.to_dict()
+    serialized = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class Siv2Client:
+    """
+    Args:
+        url (str): the url of the SIv2
+        timeout (float): timeout in seconds of one request
+        concurrency (int): number of requests sent at the same time by `fetch_many`
+        hashes (TTLCache): where the hashes of the payloads are kept
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 30,
+        concurrency: int = 8,
+        hashes: Optional[TTLCache] = None,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.session = pooled_session(pool_size=concurrency)
+        self.hashes = hashes
+        self.prefetched = dict()
+        self.lock = threading.Lock()
+
+    def request(self, name: str) -> Optional[Dict]:
+        """
+        Returns either None (on error), an empty dictionary (no entry in the SIv2)
+        or the successful result extracted
+        """
+        params = {"instructName": name}
+        try:
+            logger.debug(f"Requesting the SIV2 with {name}")
+            response = self.session.post(
+                url=f"{self.url}/asn-rest/rest/api/searchInstruct",
+                headers={"Content-Type": "application/json"},
+                json=params,
+                timeout=self.timeout,
+            ).json()
+            if not response["successful"]:
+                return dict()
+            logger.debug(f"Sucessful SIV2 retrieval for {name}: {response}")
+            return response["result"]
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Impossible to fetch SIV2 {name} due to network error {e}")
+        except KeyError as v:
+            logger.error(f"Impossible to fetch SIV2 {name}: {v}")
+
+    def fetch(self, name: str) -> Optional[Dict]:
+        """
+        Same as `request`, but uses the prefetched response if there is one
+        """
+        with self.lock:
+            if name in self.prefetched:
+                return self.prefetched.pop(name)
+        return self.request(name)
+
+    def fetch_many(self, names: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Request the SIv2 for all the names, `concurrency` at a time.
+        The responses are also kept for the next calls to `fetch`.
+        """
+        names = list(dict.fromkeys(names))
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            responses = dict(zip(names, executor.map(self.request, names)))
+        with self.lock:
+            self.prefetched.update(
+                (name, response)
+                for name, response in responses.items()
+                if response is not None
+            )
+        return responses
+
+    def payload_changed(self, name: str, payload) -> bool:
+        """
+        Whether the payload differs from the last one recorded for this letter
+        with `record_payload_hash`
+        """
+        if self.hashes is None:
+            return True
+        found, old_hash = self.hashes.get("siv2", name)
+        return not found or old_hash != payload_hash(payload)
+
+    def record_payload_hash(self, name: str, payload):
+        """
+        Record the hash of the payload the metadata of this letter were built from.
+        To be called once the metadata are committed, so that a failed build
+        is attempted again at the next refresh
+        """
+        if self.hashes is not None:
+            self.hashes.set("siv2", name, payload_hash(payload))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def siv2_client() -> Siv2Client:
+    """
+    The SIv2 client configured in the `siv2` section, shared within the process
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            siv2 = get_config()["siv2"]
+            _client = Siv2Client(
+                url=siv2["url"],
+                timeout=siv2.get("timeout", 30),
+                concurrency=siv2.get("concurrency", 8),
+                hashes=TTLCache(
+                    siv2.get("payload_hashes", "siv2_payloads.sqlite"),
+                    ttl=float("inf"),
+                ),
+            )
+        return _client
@@ -0,0 +1,294 @@
+"""
+
+Local, indexed copy of the SIv2 extractions
+
+The SIv2 mock (a pickled DataFrame) and the JSON-lines dumps
+(`asn_interlocuteur.txt`, `asn_evenmt_signif_*.txt`) are converted once
+into a SQLite file, with one row per record and indexes on the object name,
+the r_object_id, the folder paths and the modification date.
+The conversion is done again only when the source file changes.
+
+"""
+import os
+import json
+import pickle
+import sqlite3
+import logging
+import threading
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from siancedb.config import get_config
+
+from siancebackend.letter_management.letter_cleaning import process_french_date
+
+logger = logging.getLogger("siancebackend")
+
+SCHEMA = """
+CREATE TABLE source (signature TEXT NOT NULL);
+CREATE TABLE records (
+    id INTEGER PRIMARY KEY,
+    object_name TEXT,
+    r_object_id TEXT,
+    modify_date TEXT,
+    payload BLOB NOT NULL
+);
+CREATE TABLE folders (
+    path TEXT NOT NULL,
+    id_record INTEGER NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX records_object_name ON records (object_name);
+CREATE INDEX records_r_object_id ON records (r_object_id);
+CREATE INDEX records_modify_date ON records (modify_date);
+CREATE INDEX folders_path ON folders (path);
+"""
+
+BATCH_SIZE = 1000
+
+
+def _as_list(value) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(x) for x in value if isinstance(x, str) and x]
+    if isinstance(value, str) and value:
+        return [value]
+    return []
+
+
+def _as_key(value) -> Optional[str]:
+    values = _as_list(value)
+    return values[0] if values else None
+
+
+def _read_records(source: str) -> Iterator[Tuple[object, Dict]]:
+    """
+    Yields the pairs (label, record) of the source file,
+    in the order of the file. Pickles are expected to
+    contain a DataFrame, other files are read as JSON lines.
+    """
+    if source.endswith((".pkl", ".pickle")):
+        df = pd.read_pickle(source)
+        for label, row in df.iterrows():
+            yield label, row.to_dict()
+        return
+    with open(source, "r") as content:
+        for line in content:
+            if line.strip():
+                yield None, json.loads(line)
+
+
+def _to_row(label, record: Dict) -> Tuple:
+    modify_date = process_french_date(record.get("r_modify_date")).date()
+    return (
+        _as_key(record.get("object_name")),
+        _as_key(record.get("r_object_id")),
+        modify_date.isoformat(),
+        pickle.dumps((label, record), protocol=pickle.HIGHEST_PROTOCOL),
+    )
+
+
+class Siv2Store:
+    """
+    Read only access to a SIv2 extraction converted to SQLite.
+
+    Args:
+        source (str): the mock pickle or the JSON-lines dump
+        directory (str): where the SQLite files are kept, defaults to
+            `siv2.store_directory` in the configuration, or `siv2_store`
+    """
+
+    def __init__(self, source: str, directory: Optional[str] = None):
+        self.source = source
+        if directory is None:
+            directory = get_config()["siv2"].get("store_directory", "siv2_store")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, os.path.basename(source) + ".sqlite")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._signature = None
+        self.refresh()
+
+    def source_signature(self) -> str:
+        stat = os.stat(self.source)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections cannot be shared between threads
+        if getattr(self._local, "signature", None) != self._signature:
+            self._local.connection = sqlite3.connect(self.path)
+            self._local.signature = self._signature
+        return self._local.connection
+
+    def _stored_signature(self) -> Optional[str]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with sqlite3.connect(self.path) as connection:
+                row = connection.execute("SELECT signature FROM source").fetchone()
+                return row[0] if row else None
+        except sqlite3.DatabaseError:
+            return None
+
+    def refresh(self):
+        """
+        Convert the source file again if it changed
+        since the last conversion
+        """
+        with self._lock:
+            signature = self.source_signature()
+            if signature == self._signature:
+                return
+            if self._stored_signature() != signature:
+                self._build(signature)
+            self._signature = signature
+
+    def _build(self, signature: str):
+        logger.info(f"Converting {self.source} into {self.path}")
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.executescript(SCHEMA)
+            n_records = 0
+            batch = []
+            for label, record in _read_records(self.source):
+                batch.append((label, record))
+                if len(batch) >= BATCH_SIZE:
+                    n_records = self._insert(connection, batch, n_records)
+                    batch = []
+            n_records = self._insert(connection, batch, n_records)
+            connection.executescript(INDEXES)
+            connection.execute("INSERT INTO source VALUES (?)", (signature,))
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, self.path)
+        logger.info(f"{n_records} records converted from {self.source}")
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, batch: List, offset: int) -> int:
+        connection.executemany(
+            "INSERT INTO records (id, object_name, r_object_id, modify_date, payload)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                (offset + i, *_to_row(label, record))
+                for i, (label, record) in enumerate(batch)
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO folders (path, id_record) VALUES (?, ?)",
+            (
+                (path, offset + i)
+                for i, (_, record) in enumerate(batch)
+                for path in _as_list(record.get("r_folder_path"))
+            ),
+        )
+        return offset + len(batch)
+
+    @staticmethod
+    def _load(payload: bytes) -> Dict:
+        _, record = pickle.loads(payload)
+        return record
+
+    def _first(self, column: str, value: str) -> Optional[bytes]:
+        row = (
+            self._connection()
+            .execute(
+                f"SELECT payload FROM records WHERE {column} = ? ORDER BY id LIMIT 1",
+                (value,),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def by_object_name(self, object_name: str) -> Optional[Dict]:
+        """
+        The first record (in the order of the source) with this object name
+        """
+        payload = self._first("object_name", object_name)
+        return self._load(payload) if payload is not None else None
+
+    def by_r_object_id(self, r_object_id: str) -> Optional[Dict]:
+        payload = self._first("r_object_id", r_object_id)
+        return self._load(payload) if payload is not None else None
+
+    def series_by_object_name(self, object_name: str) -> Optional[pd.Series]:
+        """
+        Same as `by_object_name`, but returns the row of the mock
+        DataFrame as pandas would (a Series named after its index)
+        """
+        payload = self._first("object_name", object_name)
+        if payload is None:
+            return None
+        label, record = pickle.loads(payload)
+        return pd.Series(record, name=label, dtype=object)
+
+    def by_folder_path(self, path: str) -> List[Dict]:
+        rows = self._connection().execute(
+            "SELECT records.payload FROM folders"
+            " JOIN records ON records.id = folders.id_record"
+            " WHERE folders.path = ? ORDER BY records.id",
+            (path,),
+        )
+        return [self._load(payload) for payload, in rows]
+
+    def scan(self, modified_since: Optional[date] = None) -> Iterator[Dict]:
+        """
+        Streams the records in the order of the source file.
+
+        Args:
+            modified_since (date): when given, only the records whose
+                `r_modify_date` is on or after this date are returned.
+                Records without a valid date are dated 1970-01-01.
+        """
+        if modified_since is None:
+            rows = self._connection().execute(
+                "SELECT payload FROM records ORDER BY id"
+            )
+        else:
+            rows = self._connection().execute(
+                "SELECT payload FROM records WHERE modify_date >= ? ORDER BY id",
+                (modified_since.isoformat(),),
+            )
+        for payload, in rows:
+            yield self._load(payload)
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def _open_store(source: str) -> Siv2Store:
+    return Siv2Store(source)
+
+
+def open_store(source: str) -> Siv2Store:
+    """
+    The store of a source file, shared within the process
+    and converted again if the file changed.
+    """
+    store = _open_store(source)
+    store.refresh()
+    return store
+
+
+_records_cache: Dict[str, Tuple[str, List[Dict]]] = {}
+
+
+def load_records(source: str) -> List[Dict]:
+    """
+    All the records of a (small) source file, such as
+    `asn_interlocuteur.txt`, kept in memory until the file changes
+    """
+    store = open_store(source)
+    signature, records = _records_cache.get(source, (None, None))
+    if signature != store.source_signature():
+        records = list(store.scan())
+        _records_cache[source] = (store.source_signature(), records)
+    return records
@@ -5,7 +5,6 @@ Parse information extracted from SiV2 and store them in the SiV2 metadata SIANCE
 """
 from typing import Dict, Union, List, Tuple, Iterable
 import logging
-import requests
 from datetime import date, timedelta
 import pandas as pd
 
@@ -25,6 +24,8 @@ from siancedb.models import (
 from siancedb.config import get_config
 from siancedb.pandas_writer import chunker
 from siancebackend.pipe_logger import update_log_state
+from siancebackend.siv2_store import open_store
+from siancebackend.siv2_client import siv2_client
 
 from siancebackend.consolidate_metadata import (
     build_smart_response,
@@ -40,7 +41,7 @@ logger = logging.getLogger("siancebackend")
 
 if SIV2["mock"]:
     try:
-        mock = pd.read_pickle(SIV2["mock"])
+        mock = open_store(SIV2["mock"])
         logger.info(f"Using mock extracted from {SIV2['mock']}")
     except:
         raise ValueError("Impossible to load the mockfile for SIV2")
@@ -54,10 +55,10 @@ def safe_fetch_siv2(name: str, text: str) -> Tuple[Dict, str]:
     # if there was an error in the letter filename
 
     if SIV2["mock"]:
-        try:
-            return mock[mock.object_name == name].iloc[0], name
-        except:
+        siv2_response = mock.series_by_object_name(name)
+        if siv2_response is None:
             return dict(), ""
+        return siv2_response, name
 
     simeta = fetch_siv2(name)
 
@@ -68,7 +69,7 @@ def safe_fetch_siv2(name: str, text: str) -> Tuple[Dict, str]:
                 f"There was an error in the filename {name}. The proper letter name was {new_name}"
             )
             new_simeta = fetch_siv2(new_name)
-            if new_simeta is None or not len(simeta):
+            if new_simeta is None or not len(new_simeta):
                 logger.error(
                     f"Even under the name {new_name}, there was no entry in the SIv2"
                 )
@@ -88,24 +89,17 @@ def fetch_siv2(name: str) -> (Dict or None):
     """
     Returns either None or the successful result extracted
     """
-    params = {"instructName": name}
-    try:
-        logger.debug(f"Requesting the SIV2 with {name}")
-        response = requests.post(
-            url=f"{SIV2['url']}/asn-rest/rest/api/searchInstruct",
-            headers={"Content-Type": "application/json"},
-            json=params,
-        ).json()
-        if not response["successful"]:
-            return dict()
-        logger.debug(f"Sucessful SIV2 retrieval for {name}: {response}")
-        return response["result"]
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Impossible to fetch SIV2 {name} due to network error {e}")
-    except KeyError as v:
-        logger.error(f"Impossible to fetch SIV2 {name}: {v}")
+    return siv2_client().fetch(name)
 
 
+def prefetch_siv2(names: Iterable[str]):
+    """
+    Request the SIv2 concurrently for all these letters,
+    the next `fetch_siv2` of these names will not wait for the network
+    """
+    if not SIV2["mock"]:
+        siv2_client().fetch_many(names)
+
 
 def build_siv2metadata_one_letter(
     letter: SiancedbLetter,
@@ -128,6 +122,28 @@ def build_siv2metadata_one_letter(
     return siv2metadata, interlocutor
 
 
+def refresh_siv2metadata_one_letter(
+    letter: SiancedbLetter,
+) -> Union[Tuple[SiancedbSIv2LettersMetadata, SiancedbInterlocutor, Dict], None]:
+    """
+    Same as `build_siv2metadata_one_letter`, but returns None
+    when the SIv2 payload of the letter did not change since it was last built.
+    The payload is also returned: its hash must be recorded with
+    `siv2_client().record_payload_hash` once the metadata are committed
+    """
+    siv2_response, correct_name = safe_fetch_siv2(letter.name, letter.text)
+    changed = siv2_client().payload_changed(correct_name, siv2_response)
+    if not changed and correct_name == letter.name:
+        logger.debug(f"The SIv2 payload of {letter.name} did not change")
+        return None
+    letter.name = correct_name
+    siv2metadata, interlocutor = prepare_siv2metadata_interlocutor_one_letter(
+        siv2_response
+    )
+    siv2metadata.id_metadata = letter.id_letter
+    return siv2metadata, interlocutor, siv2_response
+
+
 def build_siv2metadata(db: Session):
     """
     Build metadata and interlocutors for all letters. Slow function for a complete rebuilding of database
@@ -156,22 +172,25 @@ def refresh_metadata(db: Session):
     today = date.today()
     letters = db.query(SiancedbLetter).all()
     refresh_interval = timedelta(days=10)
+    # if a letter has not been touched for `refresh_interval` days, request the SIv2 again
+    letters = [
+        letter for letter in letters if letter.last_touched + refresh_interval < today
+    ]
+    prefetch_siv2(letter.name for letter in letters)
+    payloads = []
     for letter in letters:
-        if letter.last_touched + refresh_interval >= today:
-            pass
-        # if a letter has not been touched for `refresh_interval` days, request the SIv2 again
-        else:
-            siv2_response, correct_name = safe_fetch_siv2(letter.name, letter.text)
-            print(interlocutor)
-            si_meta, interlocutor = prepare_siv2metadata_interlocutor_one_letter(
-                siv2_response
-            )
-            letter.name = correct_name
+        refreshed = refresh_siv2metadata_one_letter(letter)
+        letter.last_touched = today
+        if refreshed is not None:
+            si_meta, interlocutor, siv2_response = refreshed
             if interlocutor is not None:
                 letter.interlocutor = interlocutor
-            db.add(letter)
-            db.add(si_meta)
+            db.merge(si_meta)
+            payloads.append((letter.name, siv2_response))
+        db.add(letter)
     db.commit()
+    for name, siv2_response in payloads:
+        siv2_client().record_payload_hash(name, siv2_response)
 
 
 def prepare_siv2metadata_interlocutor_one_letter(
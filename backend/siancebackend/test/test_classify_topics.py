@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.model_selection import GridSearchCV
+from sklearn.neural_network import MLPClassifier
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from siancebackend.classifiers import classify_topics, training_scheduler
+from siancebackend.classifiers.hierarchical_classifier import (
+    CustomHierarchicalCategoryClassifier,
+)
+from siancedb.models import SiancedbLetter, SiancedbPrediction, SiancedbTraining
+
+
+def prepare_classifier(architecture, labels_hierarchy, top_n):
+    # a small version of the custom hierarchical architecture
+    mlp = MLPClassifier(hidden_layer_sizes=(8,), max_iter=40, random_state=0)
+    top = GridSearchCV(mlp, {"alpha": [1e-4, 1e-3]}, n_jobs=-1, cv=2)
+    return CustomHierarchicalCategoryClassifier(top, mlp, labels_hierarchy, top_n)
+
+
+class TestDualPipeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        self.addCleanup(warnings.resetwarnings)
+
+    def test_classifiers_are_fitted_one_after_the_other(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(12, 16))
+        y = rng.integers(0, 12, size=400)
+        x = centers[y] + rng.normal(scale=1.5, size=(400, 16))
+        model_path = os.path.join(self.directory, "dual.pkl")
+        with mock.patch.object(
+            classify_topics, "prepare_classifier", side_effect=prepare_classifier
+        ), mock.patch.object(
+            training_scheduler, "training_workers", return_value=2
+        ), mock.patch.object(
+            training_scheduler, "ProcessPoolExecutor", wraps=ProcessPoolExecutor
+        ) as pools:
+            pipeline = classify_topics.train_save_pipeline_from_embeddings(
+                model_path,
+                "dual",
+                x,
+                np.reshape(y, (-1, 1)),
+                labels_hierarchy={label: f"category {label % 3}" for label in range(12)},
+                labels_transverse={label: label >= 8 for label in range(12)},
+            )
+        self.assertTrue(os.path.exists(model_path))
+        # one pool of all the workers per classifier, both opened by this process: no pool is nested
+        self.assertEqual([call.kwargs["max_workers"] for call in pools.call_args_list], [2, 2])
+        for name, labels in [
+            ("classifier_technical", set(range(8))),
+            ("classifier_transverse", {8, 9, 10, 11}),
+        ]:
+            classifier = pipeline[name]
+            self.assertEqual(set(classifier.inverted_class_hierarchy), labels)
+            fitted_labels = {
+                label
+                for bottom in classifier.bottom_classifiers.values()
+                for label in bottom.classes_
+            }
+            self.assertEqual(fitted_labels, labels)
+
+
+class TestLoadEvaluationSet(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [SiancedbLetter, SiancedbTraining, SiancedbPrediction]:
+            model.__table__.create(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.addCleanup(self.db.close)
+        for id_letter in [1, 2]:
+            self.db.add(
+                SiancedbLetter(
+                    id_letter=id_letter,
+                    name=f"INSSN-LYO-2021-000{id_letter}",
+                    codep="LYO",
+                    text="",
+                    sent_date=datetime.date(2021, 1, 1),
+                )
+            )
+        for name, start, end, id_label in [
+            ("INSSN-LYO-2021-0001", 0, 10, 5),
+            ("INSSN-LYO-2021-0001", 10, 20, 6),
+            ("INSSN-LYO-2021-0002", 0, 15, 7),
+            # an annotated sentence that is not predicted
+            ("INSSN-LYO-2021-0002", 15, 30, 8),
+        ]:
+            self.db.add(
+                SiancedbTraining(
+                    name=name, start=start, end=end, sentence="", id_label=id_label
+                )
+            )
+        for id_letter, start, end, id_label, id_model in [
+            (1, 0, 10, 5, 1),
+            (1, 10, 20, 9, 1),
+            (2, 0, 15, 7, 1),
+            # a sentence that is not annotated
+            (2, 40, 50, 5, 1),
+            # the predictions of another model
+            (2, 15, 30, 8, 2),
+            (1, 0, 10, 6, 2),
+        ]:
+            self.db.add(
+                SiancedbPrediction(
+                    id_letter=id_letter,
+                    start=start,
+                    end=end,
+                    sentence="",
+                    id_label=id_label,
+                    id_model=id_model,
+                )
+            )
+        self.db.commit()
+
+    def test_annotated_sentences_predicted_by_the_model(self):
+        training_df, predictions_df = classify_topics.load_evaluation_set(self.db, 1)
+        self.assertEqual(
+            sorted(training_df[["name", "start", "end", "id_label"]].itertuples(index=False)),
+            [
+                ("INSSN-LYO-2021-0001", 0, 10, 5),
+                ("INSSN-LYO-2021-0001", 10, 20, 6),
+                ("INSSN-LYO-2021-0002", 0, 15, 7),
+            ],
+        )
+        self.assertEqual(
+            sorted(predictions_df.itertuples(index=False)),
+            [
+                ("INSSN-LYO-2021-0001", 0, 10, 5),
+                ("INSSN-LYO-2021-0001", 10, 20, 9),
+                ("INSSN-LYO-2021-0002", 0, 15, 7),
+            ],
+        )
+
+    def test_other_model(self):
+        training_df, predictions_df = classify_topics.load_evaluation_set(self.db, 2)
+        self.assertEqual(sorted(training_df.id_label.tolist()), [5, 8])
+        self.assertEqual(
+            sorted(predictions_df.itertuples(index=False)),
+            [("INSSN-LYO-2021-0001", 0, 10, 6), ("INSSN-LYO-2021-0002", 15, 30, 8)],
+        )
+
+    def test_unknown_model(self):
+        training_df, predictions_df = classify_topics.load_evaluation_set(self.db, 3)
+        self.assertEqual(len(training_df), 0)
+        self.assertEqual(len(predictions_df), 0)
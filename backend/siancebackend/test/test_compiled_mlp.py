@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from siancebackend.classifiers.compiled_mlp import (
+    CompiledMLP,
+    compile_pipeline,
+    compiled_path,
+    memmap_npz,
+)
+
+
+def train_pipeline(rng, n_samples=600, n_features=32, n_labels=12, hidden=(16,)):
+    """
+    A multi-output pipeline as `train_save_pipeline_from_embeddings` builds it,
+    with a label present in every sample
+    """
+    x = rng.normal(size=(n_samples, n_features))
+    weights = rng.normal(size=(n_features, n_labels))
+    id_labels = [
+        [100]
+        + [int(label) for label in np.flatnonzero(row > 1) + 1]
+        for row in x @ weights / np.sqrt(n_features)
+    ]
+    pipeline = Pipeline(
+        steps=[
+            ("binarizer", MultiLabelBinarizer(sparse_output=True)),
+            (
+                "classifier",
+                OneVsRestClassifier(
+                    MLPClassifier(hidden_layer_sizes=hidden, max_iter=30, random_state=0)
+                ),
+            ),
+        ]
+    )
+    y = pipeline["binarizer"].fit_transform(id_labels)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        pipeline["classifier"].fit(x, y)
+    return pipeline
+
+
+def sklearn_predict(pipeline, x):
+    return pipeline["binarizer"].inverse_transform(pipeline["classifier"].predict(x))
+
+
+class TestCompiledMLP(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = compiled_path(os.path.join(self.directory, "model_pipeline.pkl"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_labels_as_sklearn(self):
+        rng = np.random.default_rng(0)
+        for hidden in [(16,), (16, 8)]:
+            pipeline = train_pipeline(rng, hidden=hidden)
+            compile_pipeline(pipeline, self.path)
+            compiled = CompiledMLP.load(self.path)
+            x = rng.normal(size=(2500, 32))
+            self.assertEqual(
+                compiled.predict(x, batch_size=1000), sklearn_predict(pipeline, x)
+            )
+            self.assertEqual(compiled.predict(x[:0]), [])
+
+    def test_memory_mapped(self):
+        compile_pipeline(train_pipeline(np.random.default_rng(1)), self.path)
+        arrays = memmap_npz(self.path)
+        self.assertIsInstance(arrays["coef_0"], np.memmap)
+        self.assertEqual(arrays["coef_0"].dtype, np.float32)
+        self.assertEqual(arrays["coef_0"].shape, (32, 16 * len(arrays["columns"])))
+        with np.load(self.path) as reference:
+            for name in reference.files:
+                np.testing.assert_array_equal(arrays[name], reference[name])
+
+    @unittest.skipUnless(
+        os.environ.get("SIANCE_BENCHMARK"), "set SIANCE_BENCHMARK=1 to run"
+    )
+    def test_benchmark(self):
+        rng = np.random.default_rng(2)
+        pipeline = train_pipeline(rng, n_samples=2000, n_features=512, n_labels=150, hidden=(100,))
+        compile_pipeline(pipeline, self.path)
+        compiled = CompiledMLP.load(self.path)
+        x = rng.normal(size=(100000, 512))
+        start = time.perf_counter()
+        expected = sklearn_predict(pipeline, x)
+        reference = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = compiled.predict(x)
+        fast = time.perf_counter() - start
+        print(
+            f"\n{len(x)} sentences, {len(compiled.columns)} labels: "
+            f"{reference:.1f} s with sklearn, {fast:.1f} s compiled"
+        )
+        self.assertEqual(predicted, expected)
+        self.assertLess(fast, reference)
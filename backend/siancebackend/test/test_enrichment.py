@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import urlparse, parse_qs
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from siancedb import models
+from siancedb.models import SiancedbInterlocutor
+from siancebackend import interlocutors
+from siancebackend.migrations import migrate_interlocutors_regions
+
+from siancebackend.enrichment import GeoClient, InseeClient, TokenBucket, TTLCache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers as the SIRENE API and geo.api.gouv.fr would
+    """
+
+    requests = []
+    throttled = set()
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, payload=None, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        StubHandler.requests.append(url.path)
+        if url.path.startswith("/entreprises/sirene/V3/siret/"):
+            if self.headers.get("Authorization") != "Bearer good":
+                return self.answer(401)
+            siret = url.path.split("/")[-1]
+            if siret == "429" and siret not in StubHandler.throttled:
+                StubHandler.throttled.add(siret)
+                return self.answer(429, headers={"Retry-After": "0"})
+            if siret == "404":
+                return self.answer(404)
+            return self.answer(
+                200,
+                {
+                    "etablissement": {
+                        "siren": siret[:9],
+                        "siret": siret,
+                        "uniteLegale": {"denominationUniteLegale": "EDF"},
+                        "adresseEtablissement": {"codePostalEtablissement": "01150"},
+                    }
+                },
+            )
+        if url.path == "/communes":
+            postal_code = parse_qs(url.query)["codePostal"][0]
+            if postal_code == "99999":
+                return self.answer(200, [])
+            return self.answer(
+                200,
+                [
+                    {
+                        "nom": "Saint-Vulbas",
+                        "codeRegion": "84",
+                        "centre": {"type": "Point", "coordinates": [5.28, 45.83]},
+                    }
+                ],
+            )
+        self.answer(404)
+
+
+class TestEnrichmentClients(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StubHandler.requests = []
+        StubHandler.throttled = set()
+        self.directory = tempfile.mkdtemp()
+        self.cache = TTLCache(os.path.join(self.directory, "cache.sqlite"), ttl=3600)
+        self.tokens = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def insee(self, rate=1000):
+        return InseeClient(
+            token=lambda: "expired",
+            refresh_token=lambda: self.tokens.append("good") or "good",
+            base_url=self.url,
+            cache=self.cache,
+            bucket=TokenBucket(rate=rate, capacity=1),
+        )
+
+    def test_insee_cached_refreshed_and_throttled(self):
+        client = self.insee()
+        self.assertEqual(client.establishment("30520716900106")["siren"], "305207169")
+        self.assertEqual(self.tokens, ["good"])
+        n_requests = len(StubHandler.requests)
+        self.assertEqual(client.establishment("30520716900106")["siret"], "30520716900106")
+        self.assertEqual(len(StubHandler.requests), n_requests)
+
+        self.assertIsNone(client.establishment("404"))
+        self.assertIsNone(client.establishment("404"))
+        self.assertEqual(StubHandler.requests.count("/entreprises/sirene/V3/siret/404"), 2)
+
+        self.assertEqual(client.establishment("429")["siret"], "429")
+
+    def test_geo_cached(self):
+        client = GeoClient(base_url=self.url, cache=self.cache)
+        commune = client.commune("01150")
+        self.assertEqual(commune["region"], "84")
+        self.assertEqual(commune["geojson"]["coordinates"], [5.28, 45.83])
+        self.assertEqual(client.commune("01150"), commune)
+        self.assertIsNone(client.commune("99999"))
+        self.assertEqual(StubHandler.requests, ["/communes", "/communes"])
+
+    def test_cache_expires(self):
+        cache = TTLCache(os.path.join(self.directory, "short.sqlite"), ttl=0.05)
+        cache.set("geo", "01150", {"city": "Saint-Vulbas"})
+        self.assertEqual(cache.get("geo", "01150"), (True, {"city": "Saint-Vulbas"}))
+        time.sleep(0.1)
+        self.assertEqual(cache.get("geo", "01150"), (False, None))
+
+    def test_token_bucket_rate(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the first token is available immediately, the 10 others at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 10 / 50 * 0.9)
+
+
+def prepare_interlocutor(siret):
+    if siret.startswith("9"):
+        raise ValueError(f"Unknown siret {siret}")
+    return {"siret": siret, "region": "84"}
+
+
+class TestPrepareInterlocutors(unittest.TestCase):
+    def test_failures_do_not_stop_the_others(self):
+        with mock.patch.object(
+            interlocutors, "prepare_interlocutor", side_effect=prepare_interlocutor
+        ), self.assertLogs("interlocutors", level="ERROR") as logs:
+            informations = interlocutors.prepare_interlocutors(["1", "9", "2", 1])
+        self.assertEqual(list(informations), ["1", "9", "2"])
+        self.assertIsNone(informations["9"])
+        self.assertEqual(informations["2"]["region"], "84")
+        self.assertIn("9", logs.output[0])
+
+    def test_migration_commits_every_chunk(self):
+        engine = create_engine("sqlite://")
+        SiancedbInterlocutor.__table__.create(engine)
+        session_local = sessionmaker(bind=engine, expire_on_commit=False)
+        with session_local() as db:
+            db.add_all(
+                SiancedbInterlocutor(id_interlocutor=k, siren=str(k), siret=str(k))
+                for k in range(1, 6)
+            )
+            db.commit()
+
+        def prepare_chunk(sirets):
+            if "5" in sirets:
+                raise KeyboardInterrupt
+            return {siret: prepare_interlocutor(siret) for siret in sirets}
+
+        with mock.patch.object(models, "SessionLocal", session_local), mock.patch.object(
+            migrate_interlocutors_regions, "prepare_interlocutors", side_effect=prepare_chunk
+        ), mock.patch("builtins.print"), self.assertRaises(KeyboardInterrupt):
+            migrate_interlocutors_regions.migrate(chunk_size=2)
+        with session_local() as db:
+            regions = dict(
+                db.query(SiancedbInterlocutor.siret, SiancedbInterlocutor.region)
+            )
+        # the chunks before the interruption are saved
+        self.assertEqual(regions, {"1": "84", "2": "84", "3": "84", "4": "84", "5": None})
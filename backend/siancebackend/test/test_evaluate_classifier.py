@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import unittest
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from siancebackend.classifiers.evaluate_classifier import (
+    agreement_counts,
+    agreement_scores,
+    evaluate_every_class,
+    evaluate_multi_output_classifier,
+    indicator_lists,
+    label_indicators,
+    label_indicators_from_pairs,
+    subset_accuracy,
+)
+
+
+def evaluate_every_class_loop(y_test, y_pred):
+    """
+    The previous implementation of `evaluate_every_class`, counting sample by sample in dictionaries
+    """
+    true_positive_dict, false_positive_dict, false_negative_dict = {}, {}, {}
+    for k, label_real_list in enumerate(y_test):
+        label_pred_list = y_pred[k]
+        if not isinstance(label_pred_list, Iterable):
+            label_pred_list = [label_pred_list]
+        if not isinstance(label_real_list, Iterable):
+            label_real_list = [label_real_list]
+        for label_real in label_real_list:
+            if label_real in label_pred_list:
+                true_positive_dict[label_real] = true_positive_dict.get(label_real, 0) + 1
+            else:
+                false_negative_dict[label_real] = false_negative_dict.get(label_real, 0) + 1
+        for label_pred in label_pred_list:
+            if label_pred not in label_real_list:
+                false_positive_dict[label_pred] = false_positive_dict.get(label_pred, 0) + 1
+
+    recall_dict, precision_dict = {}, {}
+    for label in true_positive_dict:
+        recall_dict[label] = true_positive_dict[label] / (
+            true_positive_dict[label] + false_negative_dict.get(label, 0)
+        )
+        precision_dict[label] = true_positive_dict[label] / (
+            true_positive_dict[label] + false_positive_dict.get(label, 0)
+        )
+    true_positive = sum(true_positive_dict.values())
+    false_positive = sum(false_positive_dict.values())
+    false_negative = sum(false_negative_dict.values())
+    recall = true_positive / (true_positive + false_negative)
+    precision = true_positive / (true_positive + false_positive)
+    return precision_dict, recall_dict, precision, recall
+
+
+def random_labels(rng, n_samples, n_labels=40, max_labels=4):
+    """
+    Lists of distinct labels, some of them empty
+    """
+    return [
+        sorted(rng.choice(n_labels, size=rng.integers(0, max_labels), replace=False).tolist())
+        for _ in range(n_samples)
+    ]
+
+
+class TestEvaluateEveryClass(unittest.TestCase):
+    def assertSameScores(self, scores, expected):
+        self.assertEqual(scores[0].keys(), expected[0].keys())
+        self.assertEqual(scores[1].keys(), expected[1].keys())
+        for label in expected[0]:
+            self.assertAlmostEqual(scores[0][label], expected[0][label])
+            self.assertAlmostEqual(scores[1][label], expected[1][label])
+        self.assertAlmostEqual(scores[2], expected[2])
+        self.assertAlmostEqual(scores[3], expected[3])
+
+    def test_multi_output(self):
+        rng = np.random.default_rng(0)
+        y_test = random_labels(rng, 2000)
+        y_pred = [tuple(labels) for labels in random_labels(rng, 2000)]
+        self.assertSameScores(
+            evaluate_every_class(y_test, y_pred), evaluate_every_class_loop(y_test, y_pred)
+        )
+        precision, recall = evaluate_multi_output_classifier(y_test, y_pred)
+        expected = evaluate_every_class_loop(y_test, y_pred)
+        self.assertAlmostEqual(precision, expected[2])
+        self.assertAlmostEqual(recall, expected[3])
+
+    def test_mono_output(self):
+        rng = np.random.default_rng(1)
+        y_test = rng.integers(0, 10, size=(3000, 1))
+        y_pred = np.where(rng.random(3000) < 0.7, y_test[:, 0], rng.integers(0, 10, size=3000))
+        self.assertSameScores(
+            evaluate_every_class(y_test, y_pred), evaluate_every_class_loop(y_test, y_pred)
+        )
+        # the keys are plain python labels
+        self.assertEqual({type(label) for label in evaluate_every_class(y_test, y_pred)[0]}, {int})
+
+    def test_labels_only_predicted(self):
+        precision_dict, recall_dict, precision, recall = evaluate_every_class(
+            [[1], [2], [2, 3]], [[1, 4], [], [2]]
+        )
+        self.assertEqual(precision_dict, {1: 1.0, 2: 1.0})
+        self.assertEqual(recall_dict, {1: 1.0, 2: 0.5})
+        self.assertAlmostEqual(precision, 2 / 3)
+        self.assertAlmostEqual(recall, 2 / 4)
+
+    def test_indicators(self):
+        y_true, y_pred, classes = label_indicators([[1, 1], [2], []], [[1], [2, 5], []])
+        self.assertEqual(y_true.sum(), 2)
+        self.assertEqual(indicator_lists(y_true, classes), [[1], [2], []])
+        self.assertEqual(indicator_lists(y_pred, classes), [[1], [2, 5], []])
+        self.assertAlmostEqual(subset_accuracy(y_true, y_pred), 2 / 3)
+        y_true, y_pred, classes = label_indicators_from_pairs(
+            np.array([0, 1]), np.array([7, 8]), np.array([], dtype=int), np.array([], dtype=int), 3
+        )
+        self.assertEqual(y_pred.nnz, 0)
+        self.assertEqual(indicator_lists(y_true, classes), [[7], [8], []])
+
+    def test_agreement(self):
+        columns = ["id_letter", "start", "end", "id_label"]
+        reference = pd.DataFrame(
+            [[1, 0, 10, 7], [1, 0, 10, 8], [1, 10, 20, 7], [2, 0, 10, 9]], columns=columns
+        )
+        candidate = pd.DataFrame(
+            [[1, 0, 10, 8], [1, 0, 10, 7], [1, 10, 20, 8], [2, 5, 10, 9]], columns=columns
+        )
+        counts, n_sentences, identical = agreement_counts(reference, candidate)
+        # the sentence (2, 5, 10) is only labelled by the candidate, (2, 0, 10) only by the reference
+        self.assertEqual((n_sentences, identical), (4, 1))
+        self.assertEqual(
+            counts.loc[[7, 8, 9]].values.tolist(), [[2, 1, 1], [1, 2, 1], [1, 1, 0]]
+        )
+        scores = agreement_scores(counts, n_sentences, identical)
+        self.assertAlmostEqual(scores["agreement"], 1 / 4)
+        self.assertAlmostEqual(scores["precision"], 2 / 4)
+        self.assertAlmostEqual(scores["recall"], 2 / 4)
+        self.assertEqual(scores["jaccard"], {7: 0.5, 8: 0.5, 9: 0.0})
+        counts, n_sentences, identical = agreement_counts(reference, reference.iloc[:0])
+        self.assertEqual((n_sentences, identical, int(counts.candidate.sum())), (3, 0, 0))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from siancebackend import letters
+from siancebackend.letter_management.extraction_pool import ExtractionPool
+
+
+class TestExtractionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ExtractionPool(
+            endpoints=["http://tika:9998"], concurrency=3, timeout=1, retries=0
+        )
+        self.consumed = 0
+        self.lock = threading.Lock()
+
+    def paths(self, n):
+        for k in range(n):
+            with self.lock:
+                self.consumed += 1
+            yield f"/pdf/{k}.pdf"
+
+    def extract_one(self, pdf_path):
+        time.sleep(0.005)
+        if pdf_path.endswith("7.pdf"):
+            raise RuntimeError(f"Impossible to parse {pdf_path}")
+        return {"content": pdf_path, "metadata": {}}
+
+    def test_bounded_number_of_documents_in_flight(self):
+        yielded = 0
+        results = dict()
+        with mock.patch.object(self.pool, "extract_one", side_effect=self.extract_one):
+            for pdf_path, raw in self.pool.extract(self.paths(60)):
+                yielded += 1
+                results[pdf_path] = raw
+                # the pdfs are read from the iterable only as the results are yielded
+                self.assertLessEqual(self.consumed - yielded, 2 * self.pool.concurrency)
+        self.assertEqual(len(results), 60)
+        self.assertIsNone(results["/pdf/7.pdf"])
+        self.assertEqual(results["/pdf/8.pdf"]["content"], "/pdf/8.pdf")
+
+    def test_empty(self):
+        self.assertEqual(list(self.pool.extract([])), [])
+
+
+class TestBuildOneLetter(unittest.TestCase):
+    def test_unparseable_pdf(self):
+        # the error reaches the caller, so that the Prefect task fails (and may be retried)
+        pool = mock.Mock()
+        pool.extract_one.side_effect = RuntimeError("Impossible to parse /pdf/x.pdf")
+        with mock.patch.object(letters, "default_pool", return_value=pool), self.assertRaises(
+            RuntimeError
+        ):
+            letters.build_one_letter("/pdf/x.pdf")
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import unittest
+import warnings
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+
+from siancebackend.classifiers.hierarchical_classifier import (
+    CustomHierarchicalCategoryClassifier,
+    predict_top_level,
+    predict_with_safetynet,
+)
+
+
+def predict_top_level_loop(x, classifier, encoder, top_n=1):
+    """
+    The previous implementation of `predict_top_level`, ranking and decoding sample by sample
+    """
+    probabilities = classifier.predict_proba(x)
+    best_probabilities = np.sort(-probabilities, axis=-1)[:, :top_n]
+    ids_ranking = np.argsort(-probabilities, axis=-1)[:, :top_n]
+    classes_order = classifier.classes_
+    size_encodings = len(encoder.classes_)
+    classes_ranking = np.array(
+        [[classes_order[id_] for id_ in top_ids_one_sample] for top_ids_one_sample in ids_ranking]
+    )
+    categories_ranking = np.zeros(shape=classes_ranking.shape, dtype=object)
+    for k in range(ids_ranking.shape[1]):
+        encoding_matrix = csr_matrix(
+            (
+                np.ones(ids_ranking.shape[0], dtype=int),
+                (range(ids_ranking.shape[0]), classes_ranking[:, k]),
+            ),
+            shape=(ids_ranking.shape[0], size_encodings),
+        )
+        categories_ranking[:, k] = encoder.inverse_transform(encoding_matrix).ravel()
+    return categories_ranking, best_probabilities
+
+
+def predict_with_safetynet_loop(x, top_classifier, bottom_classifiers, encoder, top_n=3):
+    """
+    The previous implementation of `predict_with_safetynet`, looping over the ranks, the top level classes
+    and the samples. Two bugs are fixed so that it can be compared: the top level probabilities are
+    positive (`predict_top_level` returned their opposite) and the best candidates are bottom level
+    classes (and not their indices in the output of the bottom level classifiers)
+    """
+    top_level_ranking, top_level_probabilities = predict_top_level_loop(
+        x, classifier=top_classifier, encoder=encoder, top_n=top_n
+    )
+    top_level_probabilities = -top_level_probabilities
+    best_probabilities = np.zeros((len(x), top_n), dtype=float)
+    best_candidates = np.zeros((len(x), top_n), dtype=int)
+    for k in range(top_n):
+        for top in bottom_classifiers.keys():
+            mask = (top_level_ranking[:, k] == top).ravel()
+            if len(x[mask]) > 0:
+                bottom_probas = bottom_classifiers[top].predict_proba(x[mask])
+                combined_probas = np.empty_like(bottom_probas, dtype=float)
+                for j in range(bottom_probas.shape[1]):
+                    combined_probas[:, j] = bottom_probas[:, j] * top_level_probabilities[:, k][mask]
+                best_probabilities[mask, k] = np.max(combined_probas, axis=-1)
+                best_candidates[mask, k] = bottom_classifiers[top].classes_[
+                    np.argmax(combined_probas, axis=-1)
+                ]
+    indices = np.argmax(best_probabilities, axis=-1)
+    return np.reshape(
+        [best_candidates[sample, indices[sample]] for sample in range(len(x))], (-1, 1)
+    )
+
+
+def train_classifier(rng, top_n, n_samples=1500, n_features=24, n_categories=6, n_labels=30):
+    """
+    A hierarchical classifier trained on clusters: every label belongs to one of the categories
+    """
+    hierarchy = {label: f"category {label % n_categories}" for label in range(n_labels)}
+    centers = rng.normal(size=(n_labels, n_features))
+    y = rng.integers(0, n_labels, size=n_samples)
+    x = centers[y] + rng.normal(scale=1.5, size=(n_samples, n_features))
+    classifier = CustomHierarchicalCategoryClassifier(
+        MLPClassifier(hidden_layer_sizes=(20,), max_iter=60, random_state=0),
+        MLPClassifier(hidden_layer_sizes=(20,), max_iter=60, random_state=0),
+        hierarchy,
+        top_n=top_n,
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        classifier.fit(x, np.reshape(y, (-1, 1)))
+    return classifier, centers
+
+
+class TestSafetynet(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(0)
+        cls.classifier, centers = train_classifier(rng, top_n=3)
+        labels = rng.integers(0, len(centers), size=3000)
+        cls.x = centers[labels] + rng.normal(scale=2, size=(3000, centers.shape[1]))
+
+    def test_same_top_level_ranking(self):
+        for top_n in [1, 2, 4]:
+            ranking, probabilities = predict_top_level(
+                self.x, self.classifier.top_classifier, self.classifier.encoder, top_n=top_n
+            )
+            expected_ranking, expected_probabilities = predict_top_level_loop(
+                self.x, self.classifier.top_classifier, self.classifier.encoder, top_n=top_n
+            )
+            np.testing.assert_array_equal(ranking, expected_ranking)
+            np.testing.assert_array_equal(probabilities, -expected_probabilities)
+            self.assertTrue((probabilities >= 0).all())
+
+    def test_same_predictions(self):
+        for top_n in [1, 2, 3]:
+            args = (
+                self.x,
+                self.classifier.top_classifier,
+                self.classifier.bottom_classifiers,
+                self.classifier.encoder,
+                top_n,
+            )
+            y_pred = predict_with_safetynet(*args)
+            self.assertEqual(y_pred.shape, (len(self.x), 1))
+            np.testing.assert_array_equal(y_pred, predict_with_safetynet_loop(*args))
+            # predictions are labels of the hierarchy
+            self.assertTrue(set(np.ravel(y_pred)) <= set(self.classifier.inverted_class_hierarchy))
+
+    def test_top_1_is_the_bottom_prediction(self):
+        ranking, _ = predict_top_level(
+            self.x, self.classifier.top_classifier, self.classifier.encoder, top_n=1
+        )
+        y_pred = predict_with_safetynet(
+            self.x,
+            self.classifier.top_classifier,
+            self.classifier.bottom_classifiers,
+            self.classifier.encoder,
+            top_n=1,
+        )
+        for top, bottom_classifier in self.classifier.bottom_classifiers.items():
+            mask = ranking[:, 0] == top
+            np.testing.assert_array_equal(
+                y_pred[mask, 0], bottom_classifier.predict(self.x[mask])
+            )
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from siancedb.config import get_config
+
+MODULES = [
+    "siancedb.letter_summary",
+    "siancedb.elasticsearch.queries",
+    "siancebackend.indexation",
+]
+
+
+def import_times(module: str, cwd: str):
+    """
+    Import the module in a new interpreter with `-X importtime`
+    and return the cumulative time in microseconds of every imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=os.environ,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise AssertionError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    def setUp(self):
+        # no database, no geojson and no logs directory: importing must still work
+        self.directory = tempfile.mkdtemp()
+        config = dict(get_config())
+        config["postgres"] = dict(config["postgres"], host="127.0.0.1", port="1")
+        config["geography"] = {"regions": os.path.join(self.directory, "missing.geojson")}
+        with open(os.path.join(self.directory, "config.json"), "w") as f:
+            json.dump(config, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_import_without_database(self):
+        for module in MODULES:
+            times = import_times(module, self.directory)
+            self.assertIn(module, times)
+            self.assertFalse(os.path.exists(os.path.join(self.directory, "logs")))
+
+    @unittest.skipUnless(
+        os.environ.get("SIANCE_BENCHMARK"), "set SIANCE_BENCHMARK=1 to run"
+    )
+    def test_benchmark(self):
+        print()
+        for module in MODULES:
+            times = import_times(module, self.directory)
+            slowest = sorted(times.items(), key=lambda item: -item[1])[1:4]
+            print(
+                f"{module}: {times[module] / 1e3:.0f} ms, slowest: "
+                + ", ".join(f"{name} {time / 1e3:.0f} ms" for name, time in slowest)
+            )
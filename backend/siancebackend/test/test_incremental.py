@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import unittest
+import warnings
+
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.model_selection import GridSearchCV
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import MultiLabelBinarizer
+from sklearn.tree import DecisionTreeClassifier
+
+from siancebackend.classifiers.incremental import partial_fit_pipeline, replay_rows
+
+
+def clusters(rng, n_samples, centers):
+    y = rng.integers(0, len(centers), size=n_samples)
+    return centers[y] + rng.normal(scale=0.8, size=(n_samples, centers.shape[1])), y
+
+
+def mlp():
+    return MLPClassifier(hidden_layer_sizes=(16,), max_iter=50, random_state=0)
+
+
+class TestReplayRows(unittest.TestCase):
+    def test_sample_of_old_rows(self):
+        new_rows = np.arange(90, 100)
+        rows = replay_rows(100, new_rows, replay=4)
+        self.assertEqual(len(rows), 40)
+        self.assertEqual(len(set(rows)), 40)
+        self.assertTrue((rows < 90).all())
+        np.testing.assert_array_equal(rows, replay_rows(100, new_rows, replay=4))
+        self.assertEqual(len(replay_rows(100, new_rows, replay=100)), 90)
+
+
+class TestPartialFitPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        cls.rng = np.random.default_rng(0)
+        cls.centers = cls.rng.normal(scale=3, size=(6, 8))
+
+    @classmethod
+    def tearDownClass(cls):
+        warnings.resetwarnings()
+
+    def test_multi_output(self):
+        x, y = clusters(self.rng, 600, self.centers)
+        # the cluster 5 is not in the training set of the parent, the label 10 is on every sentence
+        seen = y < 5
+        id_labels = [[int(label), 10] for label in y[seen]]
+        pipeline = Pipeline(
+            steps=[
+                ("binarizer", MultiLabelBinarizer(sparse_output=True)),
+                ("classifier", OneVsRestClassifier(mlp())),
+            ]
+        )
+        pipeline["classifier"].fit(x[seen], pipeline["binarizer"].fit_transform(id_labels))
+        self.assertEqual(list(pipeline["binarizer"].classes_), [0, 1, 2, 3, 4, 10])
+
+        # the new annotations: the label 2 is moved to another cluster, the label 10 is removed once
+        x_new = self.centers[[5] * 60] + self.rng.normal(scale=0.8, size=(60, 8))
+        new_labels = [[2, 10]] * 59 + [[2, 7]]
+        before = [list(e.coefs_[0].copy()) for e in pipeline["classifier"].estimators_[:5]]
+        with self.assertLogs("incremental", level="WARNING") as logs:
+            partial_fit_pipeline(pipeline, x_new, new_labels, epochs=20)
+        self.assertIn("[7]", logs.output[0])
+        for k, estimator in enumerate(pipeline["classifier"].estimators_[:5]):
+            self.assertTrue(np.any(estimator.coefs_[0] != before[k]))
+        # the constant predictor of the label 10 became a network
+        self.assertIsInstance(pipeline["classifier"].estimators_[5], MLPClassifier)
+        predictions = pipeline["binarizer"].inverse_transform(
+            pipeline["classifier"].predict(x_new)
+        )
+        self.assertGreater(np.mean([2 in labels for labels in predictions]), 0.8)
+
+    def test_mono_output(self):
+        x, y = clusters(self.rng, 600, self.centers)
+        seen = y < 5
+        for classifier in [
+            mlp(),
+            GridSearchCV(mlp(), {"alpha": [1e-4, 1e-3]}, cv=2),
+        ]:
+            pipeline = Pipeline(steps=[("classifier", classifier)])
+            pipeline["classifier"].fit(x[seen], y[seen])
+            # new annotations of the label 1 on the cluster 0, and an unknown label
+            x_new = x[y == 0][:50]
+            new_labels = np.reshape([1] * 49 + [5], (-1, 1))
+            with self.assertLogs("incremental", level="WARNING"):
+                partial_fit_pipeline(pipeline, x_new, new_labels, epochs=100)
+            self.assertGreater(np.mean(pipeline.predict(x_new) == 1), 0.8)
+
+    def test_not_refreshable(self):
+        x, y = clusters(self.rng, 100, self.centers)
+        pipeline = Pipeline(steps=[("classifier", DecisionTreeClassifier().fit(x, y))])
+        with self.assertRaises(ValueError):
+            partial_fit_pipeline(pipeline, x, y)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+import contextlib
+import datetime
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from siancedb.models import (
+    SiancedbInterlocutor,
+    SiancedbLetter,
+    SiancedbSIv2LettersMetadata,
+)
+from siancebackend import ingest_cres
+from siancebackend.ingest_cres import (
+    FolderPrefixIndex,
+    build_cres_batch,
+    resolve_interlocutors,
+    resolve_sites,
+    upsert_cres,
+    upsert_statement,
+)
+
+
+@compiles(ARRAY, "sqlite")
+def compile_array(element, compiler, **kw):
+    # the arrays of the metadata are left empty in these tests
+    return "JSON"
+
+
+@compiles(DOUBLE_PRECISION, "sqlite")
+def compile_double_precision(element, compiler, **kw):
+    return "REAL"
+
+
+INTERLOCUTORS = [
+    {"r_folder_path": ["/SIv2/Lyon/Bugey"], "siret": "11"},
+    {"r_folder_path": ["/SIv2/Paris"], "siret": "22"},
+]
+
+
+def cres_record(siv2, name, folder, description="Fuite"):
+    return {
+        "r_object_id": siv2,
+        "object_name": name,
+        "r_folder_path": [folder],
+        "description": description,
+    }
+
+
+class TestCresBatch(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        for model in [SiancedbInterlocutor, SiancedbLetter, SiancedbSIv2LettersMetadata]:
+            model.__table__.create(engine)
+        self.db = sessionmaker(bind=engine)()
+        self.addCleanup(self.db.close)
+        self.db.add(SiancedbInterlocutor(id_interlocutor=1, siren="1", siret="11"))
+        self.db.add(SiancedbInterlocutor(id_interlocutor=3, siren="3", siret="33"))
+        for id_letter, site in [(2, "Bugey 2"), (1, "Bugey")]:
+            self.db.add(
+                SiancedbLetter(
+                    id_letter=id_letter,
+                    name=f"INSSN-LYO-{id_letter}",
+                    codep="LYO",
+                    text="",
+                    sent_date=datetime.date(2020, 1, 1),
+                    id_interlocutor=1,
+                )
+            )
+            self.db.add(SiancedbSIv2LettersMetadata(id_metadata=id_letter, site=site))
+        self.db.commit()
+        # the unknown sirets are created as interlocutors, without calling the INSEE
+        patcher = mock.patch.object(
+            ingest_cres,
+            "get_or_create_interlocutor",
+            side_effect=lambda siret: SimpleNamespace(id_interlocutor=int(siret[0]) + 5),
+        )
+        self.get_or_create = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_resolve_interlocutors(self):
+        ids = resolve_interlocutors(self.db, [["99", "11"], ["22"], ["22"], []])
+        self.assertEqual(ids, [1, 7, 7, None])
+        # the interlocutor created for the first CRES is reused by the next ones
+        self.get_or_create.assert_called_once_with("22")
+
+    def test_resolve_sites(self):
+        # the site of the first letter of every interlocutor
+        self.assertEqual(resolve_sites(self.db, [1, 3, 1]), {1: "Bugey"})
+
+    def test_build_cres_batch(self):
+        records = [
+            cres_record("0b1", "INSSN-LYO-2021-0001", "/SIv2/Lyon/Bugey/INB78"),
+            cres_record("0b2", "INSSN-PRS-2021-0002", "/SIv2/Paris/Saclay"),
+            cres_record("0b3", "INSSN-XXX-2021-0003", "/SIv2/Nowhere"),
+            cres_record("0b1", "INSSN-LYO-2021-0001", "/SIv2/Lyon/Bugey", "Incendie"),
+        ]
+        with mock.patch.object(
+            ingest_cres, "folder_prefix_index", return_value=FolderPrefixIndex(INTERLOCUTORS)
+        ), self.assertLogs("siancebackend", level="WARNING") as logs:
+            rows = build_cres_batch(self.db, records)
+        self.assertIn("INSSN-XXX-2021-0003", logs.output[0])
+        self.assertEqual(
+            [(row["siv2"], row["id_interlocutor"], row["site"]) for row in rows],
+            [("0b1", 1, "Bugey"), ("0b2", 7, None)],
+        )
+        # the last version of a CRES repeated in the batch is kept
+        self.assertEqual(rows[0]["summary"], "Incendie")
+
+
+class FakeSession:
+    """
+    Executes the rows given to `upsert_statement`, failing on the names already taken
+    """
+
+    def __init__(self, taken_names):
+        self.taken_names = taken_names
+        self.executed = []
+        self.commits = 0
+
+    def begin_nested(self):
+        return contextlib.nullcontext()
+
+    def execute(self, rows):
+        self.executed.append([row["siv2"] for row in rows])
+        if any(row["name"] in self.taken_names for row in rows):
+            raise IntegrityError("INSERT INTO ape_cres", {}, Exception("ape_cres_name_key"))
+        return [(int(row["siv2"][2:]),) for row in rows]
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestUpsertCres(unittest.TestCase):
+    rows = [
+        {"siv2": f"0b{k}", "name": f"INSSN-LYO-2021-000{k}", "natures": ["REP"]}
+        for k in range(1, 4)
+    ]
+
+    def upsert(self, taken_names):
+        db = FakeSession(taken_names)
+        with mock.patch.object(ingest_cres, "upsert_statement", side_effect=lambda rows: rows):
+            return upsert_cres(db, self.rows), db
+
+    def test_statement(self):
+        sql = str(upsert_statement(self.rows).compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (siv2) DO UPDATE SET name = excluded.name", sql)
+        self.assertNotIn("siv2 = excluded.siv2", sql)
+        self.assertIn("RETURNING ape_cres.id_cres", sql)
+
+    def test_single_statement(self):
+        id_cres, db = self.upsert(set())
+        self.assertEqual(id_cres, [1, 2, 3])
+        self.assertEqual(db.executed, [["0b1", "0b2", "0b3"]])
+        self.assertEqual(db.commits, 1)
+
+    def test_name_conflict_skips_only_the_row(self):
+        with self.assertLogs("siancebackend", level="WARNING") as logs:
+            id_cres, db = self.upsert({"INSSN-LYO-2021-0002"})
+        self.assertEqual(id_cres, [1, 3])
+        self.assertEqual(db.executed[1:], [["0b1"], ["0b2"], ["0b3"]])
+        self.assertIn("INSSN-LYO-2021-0002", logs.output[0])
+        self.assertEqual(db.commits, 1)
+
+    def test_empty_batch(self):
+        self.assertEqual(upsert_cres(FakeSession(set()), []), [])
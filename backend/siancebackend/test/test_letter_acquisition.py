@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from siancebackend.letter_management import letter_acquisition
+from siancebackend.letter_management.letter_acquisition import (
+    acquire_new_letters,
+    load_acquisition_state,
+)
+
+RSS = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>ASN</title>{items}</channel></rss>"""
+
+ITEM = """<item><title>{name}</title><link>{base}/{name}.html</link><guid>{name}</guid>
+<enclosure url="{base}/{name}.pdf" type="application/pdf" length="1"/></item>"""
+
+
+class Server:
+    """
+    Serves the feeds and the pdfs of `routes`, answering 304 to the conditional requests
+    """
+
+    def __init__(self):
+        self.routes = dict()
+        self.truncated = set()
+        self.downloads = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.routes.get(self.path, (404, b""))
+                etag = f'"{hash(body)}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                if self.path.endswith(".pdf") and status == 200:
+                    server.downloads.append(self.path)
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                # the connection of a truncated route is closed before the end of the body
+                length = len(body) + (1000 if self.path in server.truncated else 0)
+                self.send_header("Content-Length", str(length))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def feed(self, path, names):
+        items = "".join(ITEM.format(name=name, base=self.base) for name in names)
+        self.routes[path] = (200, RSS.format(items=items).encode("utf-8"))
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestAcquireNewLetters(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = Server()
+        self.addCleanup(self.server.close)
+        self.addCleanup(shutil.rmtree, self.directory)
+        letters = {
+            "path": self.directory + "/",
+            "rss": [self.server.base + "/feed-a", self.server.base + "/feed-b"],
+            "acquisition_state": os.path.join(self.directory, "state.json"),
+        }
+        patcher = mock.patch.object(letter_acquisition, "LETTERS", letters)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server.feed("/feed-a", ["INSSN-LYO-2021-0001"])
+        self.server.routes["/feed-b"] = (500, b"")
+        self.server.routes["/INSSN-LYO-2021-0001.pdf"] = (200, b"%PDF-1")
+
+    def acquire(self, known_names=()):
+        with self.assertLogs("siancebackend", level="INFO"):
+            return [letter.name for letter in acquire_new_letters(known_names)]
+
+    def test_letters_not_in_the_database_are_returned_again(self):
+        self.assertEqual(self.acquire(), ["INSSN-LYO-2021-0001"])
+        # the build of the letter failed: the feed and the pdf did not change
+        self.assertEqual(self.acquire(), ["INSSN-LYO-2021-0001"])
+        self.assertEqual(self.server.downloads, ["/INSSN-LYO-2021-0001.pdf"])
+        # once in the database, the letter is not returned anymore
+        self.assertEqual(self.acquire(["INSSN-LYO-2021-0001"]), [])
+
+    def test_failing_feed(self):
+        self.acquire()
+        feeds = load_acquisition_state()["feeds"]
+        self.assertIn(self.server.base + "/feed-a", feeds)
+        self.assertNotIn(self.server.base + "/feed-b", feeds)
+        # the letters of the feed b are found once it is back
+        self.server.feed("/feed-b", ["INSSN-LYO-2021-0002"])
+        self.server.routes["/INSSN-LYO-2021-0002.pdf"] = (200, b"%PDF-2")
+        self.assertEqual(
+            sorted(self.acquire(["INSSN-LYO-2021-0001"])), ["INSSN-LYO-2021-0002"]
+        )
+
+    def test_failing_letter(self):
+        self.server.feed("/feed-a", ["INSSN-LYO-2021-0001", "INSSN-LYO-2021-0003"])
+        self.assertEqual(self.acquire(), ["INSSN-LYO-2021-0001"])
+        # the feed is read again next time, to retry the missing letter
+        self.assertNotIn(self.server.base + "/feed-a", load_acquisition_state()["feeds"])
+        self.server.routes["/INSSN-LYO-2021-0003.pdf"] = (200, b"%PDF-3")
+        self.assertEqual(
+            self.acquire(["INSSN-LYO-2021-0001"]), ["INSSN-LYO-2021-0003"]
+        )
+
+    def test_interrupted_download(self):
+        self.server.feed("/feed-a", ["INSSN-LYO-2021-0001", "INSSN-LYO-2021-0003"])
+        self.server.routes["/INSSN-LYO-2021-0003.pdf"] = (200, b"%PDF-3")
+        self.server.truncated.add("/INSSN-LYO-2021-0003.pdf")
+        self.assertEqual(self.acquire(), ["INSSN-LYO-2021-0001"])
+        # neither the partial file nor the pdf are left on disk
+        files = [name for _, _, names in os.walk(self.directory) for name in names]
+        self.assertFalse([name for name in files if "INSSN-LYO-2021-0003" in name])
+        self.server.truncated.clear()
+        self.assertEqual(self.acquire(["INSSN-LYO-2021-0001"]), ["INSSN-LYO-2021-0003"])
+
+    def test_state_not_saved_after_an_interrupted_pass(self):
+        with mock.patch.object(
+            letter_acquisition, "fetch_letter", side_effect=KeyboardInterrupt
+        ), self.assertRaises(KeyboardInterrupt), self.assertLogs("siancebackend", level="INFO"):
+            acquire_new_letters([])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "state.json")))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import time
+import random
+import unittest
+
+from datetime import date, timedelta
+
+import dateparser
+
+from siancebackend.letter_management.letter_cleaning import extract_sent_date
+
+
+def extract_sent_date_dateparser(text: str):
+    """
+    The previous implementation of `extract_sent_date`, based on dateparser.
+    Dates that dateparser cannot read give 1970-01-01
+    """
+    pattern = "|".join(
+        [
+            r"le[ ]*[0-9]{1,2}[ ]*janvier[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*f[e|é]vrier[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*mars[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*avril[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*mai[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*juin[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*juillet[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*ao[u|û]t[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*septembre[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*octobre[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*novembre[ ]*[0-9]{4}",
+            r"le[ ]*[0-9]{1,2}[ ]*d[e|é]cembre[ ]*[0-9]{4}",
+        ]
+    )
+    try:
+        date_str = re.findall(pattern=pattern, string=text[:500])[0]
+        parsed = dateparser.parse(date_str)
+        if parsed is None:
+            return date(1970, 1, 1)
+        date_dt = parsed.date()
+        if date_dt <= date.today():
+            return date_dt
+        return date(1970, 1, 1)
+    except IndexError:
+        return date(1970, 1, 1)
+
+
+MONTHS = [
+    ["janvier"],
+    ["février", "fevrier"],
+    ["mars"],
+    ["avril"],
+    ["mai"],
+    ["juin"],
+    ["juillet"],
+    ["août", "aout"],
+    ["septembre"],
+    ["octobre"],
+    ["novembre"],
+    ["décembre", "decembre"],
+]
+
+HEADS = [
+    "RÉPUBLIQUE FRANÇAISE\nDIVISION DE LYON\nLyon, {date}\n\nN/Réf. : CODEP-LYO-2019-012345\n",
+    "Objet : Contrôle des installations nucléaires\nMarseille, {date}\nMonsieur le directeur,",
+    "{date}\nRéférence : INSSN-BDX-2017-0123",
+    "Le chef de la division,\n" + "x" * 480 + "{date}",
+]
+
+
+def letter_corpus(n: int, seed: int = 0):
+    """
+    Letters heads with dates written as in the letters of the ASN,
+    including a few edge cases (no space, invalid day, future date, no date)
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(n):
+        day = date(2000, 1, 1) + timedelta(days=rng.randint(0, 9000))
+        month = rng.choice(MONTHS[day.month - 1])
+        space = rng.choice([" ", "  ", ""])
+        written = f"le{space}{day.day}{space}{month}{space}{day.year}"
+        texts.append(rng.choice(HEADS).format(date=written))
+    texts += [
+        "Lyon, le 31 avril 2015",
+        "Lyon, le 30 février 2015",
+        "Lyon, le 0 mars 2015",
+        "Lyon, le 12 f|vrier 2015",
+        "Lyon, le 12 mars 2999",
+        "Lyon, le 12/03/2015",
+        "Pas de date ici",
+        "",
+        "le 12 mars 2015 puis le 13 avril 2016",
+        "le 5 juin 2018 et le 6 mai 2017",
+    ]
+    return texts
+
+
+class TestExtractSentDate(unittest.TestCase):
+    def test_same_dates_as_dateparser(self):
+        for text in letter_corpus(2000):
+            self.assertEqual(
+                extract_sent_date(text), extract_sent_date_dateparser(text), text
+            )
+
+    def test_examples(self):
+        self.assertEqual(extract_sent_date("Lyon, le 3 août 2018"), date(2018, 8, 3))
+        self.assertEqual(extract_sent_date("Lyon, le 3 aout 2018"), date(2018, 8, 3))
+        self.assertEqual(extract_sent_date("le12décembre2012"), date(2012, 12, 12))
+        self.assertEqual(extract_sent_date("le 31 avril 2015"), date(1970, 1, 1))
+        self.assertEqual(extract_sent_date("sans date"), date(1970, 1, 1))
+
+    @unittest.skipUnless(
+        os.environ.get("SIANCE_BENCHMARK"), "set SIANCE_BENCHMARK=1 to run"
+    )
+    def test_benchmark(self):
+        texts = letter_corpus(500, seed=1)
+        start = time.perf_counter()
+        for text in texts:
+            extract_sent_date_dateparser(text)
+        reference = (time.perf_counter() - start) / len(texts)
+        start = time.perf_counter()
+        for text in texts:
+            extract_sent_date(text)
+        compiled = (time.perf_counter() - start) / len(texts)
+        print(
+            f"\nextract_sent_date: {reference * 1e6:.1f} µs/letter with dateparser, "
+            f"{compiled * 1e6:.1f} µs/letter compiled ({reference / compiled:.0f}x)"
+        )
+        self.assertLess(compiled, reference)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from siancebackend.letter_management import parse_cache
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        config = {"tika": {"cache_directory": os.path.join(self.directory, "cache")}}
+        for patcher in [
+            mock.patch.object(parse_cache, "get_config", return_value=config),
+            mock.patch.dict(parse_cache.STATS, {"hits": 0, "misses": 0, "errors": 0}),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def from_file(self, pdf_path, url_tika, requestOptions=None):
+        time.sleep(0.01)
+        return {"status": 200, "content": "Lettre de suite", "metadata": {"producer": "Word"}}
+
+    def test_identical_pdfs_parsed_by_several_threads(self):
+        # the same bytes under different names share their cache entry
+        pdf_paths = []
+        for k in range(16):
+            pdf_paths.append(os.path.join(self.directory, f"INSSN-LYO-2021-{k:04d}.pdf"))
+            with open(pdf_paths[-1], "wb") as f:
+                f.write(b"%PDF-1.4 same bytes")
+        with mock.patch.object(parse_cache.parser, "from_file", side_effect=self.from_file):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(
+                    executor.map(lambda path: parse_cache.parse_pdf(path, "http://tika"), pdf_paths)
+                )
+        self.assertEqual({raw["content"] for raw in results}, {"Lettre de suite"})
+        stats = parse_cache.cache_stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["hits"] + stats["misses"], 16)
+        sha256 = parse_cache.pdf_sha256(pdf_paths[0])
+        self.assertEqual(parse_cache.read_cached_parse(sha256)["content"], "Lettre de suite")
+        # no temporary file is left
+        self.assertEqual(
+            os.listdir(os.path.dirname(parse_cache.cache_path(sha256))),
+            [os.path.basename(parse_cache.cache_path(sha256))],
+        )
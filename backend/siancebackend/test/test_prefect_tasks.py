@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from siancedb import models
+from siancedb.models import (
+    SiancedbInterlocutor,
+    SiancedbLetter,
+    SiancedbSIv2LettersMetadata,
+)
+from siancebackend import prefect_tasks
+from siancebackend.enrichment import TTLCache
+from siancebackend.siv2_client import Siv2Client
+
+
+@compiles(ARRAY, "sqlite")
+def compile_array(element, compiler, **kw):
+    # the arrays of the metadata are left empty in these tests
+    return "JSON"
+
+
+@compiles(DOUBLE_PRECISION, "sqlite")
+def compile_double_precision(element, compiler, **kw):
+    return "REAL"
+
+
+class TestRefreshSiv2MetadataInterlocutor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        engine = create_engine("sqlite://")
+        for model in [SiancedbInterlocutor, SiancedbLetter, SiancedbSIv2LettersMetadata]:
+            model.__table__.create(engine)
+        session_local = sessionmaker(bind=engine, expire_on_commit=False)
+        self.db = session_local()
+        self.addCleanup(self.db.close)
+        self.letter = SiancedbLetter(
+            id_letter=1,
+            name="INSSN-LYO-2019-0001",
+            codep="LYO",
+            text="",
+            sent_date=datetime.date(2019, 1, 1),
+        )
+        self.db.add(self.letter)
+        self.db.add(SiancedbSIv2LettersMetadata(id_metadata=1, site="TRICASTIN"))
+        self.db.commit()
+        self.db.expunge_all()
+        self.client = Siv2Client(
+            "http://127.0.0.1:1",
+            hashes=TTLCache(os.path.join(self.directory, "hashes.sqlite"), ttl=3600),
+        )
+        self.payload = {"name": "INSSN-LYO-2019-0001", "site": "BUGEY"}
+        for patcher in [
+            mock.patch.object(models, "SessionLocal", session_local),
+            mock.patch.object(prefect_tasks, "siv2_client", return_value=self.client),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def changed(self):
+        return self.client.payload_changed("INSSN-LYO-2019-0001", self.payload)
+
+    def run_task(self, refreshed):
+        with mock.patch.object(
+            prefect_tasks, "refresh_siv2metadata_one_letter", return_value=refreshed
+        ):
+            return prefect_tasks.RefreshSiv2MetadataInterlocutor().run(self.letter)
+
+    def test_hash_recorded_once_the_metadata_are_committed(self):
+        metadata = SiancedbSIv2LettersMetadata(id_metadata=1, site="BUGEY")
+        self.assertTrue(self.changed())
+        self.run_task((metadata, None, self.payload))
+        self.assertEqual(
+            [row.site for row in self.db.query(SiancedbSIv2LettersMetadata)], ["BUGEY"]
+        )
+        self.assertFalse(self.changed())
+
+    def test_unchanged_payload(self):
+        self.run_task(None)
+        self.assertEqual(
+            [row.site for row in self.db.query(SiancedbSIv2LettersMetadata)], ["TRICASTIN"]
+        )
+        self.assertIsNotNone(self.db.query(SiancedbLetter).one().last_touched)
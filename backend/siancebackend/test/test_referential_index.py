@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import pandas as pd
+import unidecode
+
+from siancebackend.consolidate_metadata import (
+    CLASSIFICATION_COLUMN,
+    INB_CODE_COLUMN,
+    INB_NAME_COLUMN,
+    INB_SITE_COLUMN,
+    KEY_THEME_COLUMN,
+    OLD_CLASSIFICATION_COLUMN,
+    SIRET_COLUMN,
+    THEME_COLUMN,
+    SIv2SmartResponse,
+    consolidate_smart_response,
+    dataframe_matching_hospitals,
+    dataframe_matching_INBs,
+    dataframe_matching_themes,
+    fix_common_errors_cnpe_siret,
+    hospitals_referential,
+    inb_referential,
+    sectors_to_classification,
+    themes_referential,
+)
+
+# loaded by `TestReferentialIndex.setUpClass`
+INB_DF = HOSPITALS_DF = THEMES_DF = None
+
+
+def matching_INBs_pandas(sr: SIv2SmartResponse) -> pd.DataFrame:
+    """
+    The previous implementation of `dataframe_matching_INBs`,
+    filtering the whole referential with pandas for every response
+    """
+    checkable_sirets = [
+        siret
+        for possible_siret in sr.siret
+        for siret in (possible_siret, fix_common_errors_cnpe_siret(possible_siret))
+    ]
+    checkable_inb_num = [nom.lower().replace(" ", "") for nom in sr.num_nom_inb]
+    checkable_inb_name = [nom.lower().replace(" ", "") for nom in sr.nom_ura]
+    if "réacteur1" in checkable_inb_name or "réacteur2" in checkable_inb_name:
+        checkable_inb_name.append("réacteurs1&2")
+    if "réacteur3" in checkable_inb_name or "réacteur4" in checkable_inb_name:
+        checkable_inb_name.append("réacteurs3&4")
+    if "réacteur5" in checkable_inb_name or "réacteur6" in checkable_inb_name:
+        checkable_inb_name.append("réacteurs5&6")
+    checkable_classification = []
+    if "REP" in sr.inb_type_rep_ludd:
+        checkable_classification.extend(sectors_to_classification(["REP"]))
+    if "LUDD" in sr.inb_type_rep_ludd:
+        checkable_classification.extend(sectors_to_classification(["LUDD"]))
+    checkable_classification = [u.lower() for u in checkable_classification]
+
+    def normalized(df, column):
+        return df[column].str.lower().str.replace(" ", "")
+
+    df = INB_DF
+    for (colname, condition) in [
+        (SIRET_COLUMN, checkable_sirets),
+        (CLASSIFICATION_COLUMN, checkable_classification),
+        (INB_NAME_COLUMN, checkable_inb_name),
+        (INB_CODE_COLUMN, checkable_inb_num),
+    ]:
+        if len(condition) == 0:
+            continue
+        if colname == CLASSIFICATION_COLUMN:
+            df = df[
+                normalized(df, CLASSIFICATION_COLUMN).isin(condition)
+                | normalized(df, OLD_CLASSIFICATION_COLUMN).isin(condition)
+            ]
+        else:
+            df = df[normalized(df, colname).isin(condition)]
+    return df
+
+
+def matching_themes_pandas(sr: SIv2SmartResponse) -> pd.DataFrame:
+    return THEMES_DF[
+        THEMES_DF[KEY_THEME_COLUMN].isin(
+            [unidecode.unidecode(theme.lower().replace(" ", "")) for theme in sr.themes]
+        )
+    ]
+
+
+def matching_hospitals_pandas(sr: SIv2SmartResponse) -> pd.DataFrame:
+    return HOSPITALS_DF[HOSPITALS_DF[SIRET_COLUMN].isin(sr.siret)]
+
+
+def cell(df: pd.DataFrame, rng: random.Random, column: str):
+    values = df[column].dropna()
+    return values.iloc[rng.randrange(len(values))]
+
+
+def sample_responses(n: int, seed: int = 0):
+    """
+    Smart responses built from the referentials themselves,
+    with case and space variations, unknown values and missing fields
+    """
+    rng = random.Random(seed)
+
+    def vary(value: str) -> str:
+        return rng.choice([value, value.upper(), value.replace(" ", ""), f" {value}"])
+
+    def some(values):
+        return [value for value in values if rng.random() < 0.7]
+
+    responses = []
+    for _ in range(n):
+        row = INB_DF.iloc[rng.randrange(len(INB_DF))]
+        sirets = [cell(INB_DF, rng, SIRET_COLUMN), cell(HOSPITALS_DF, rng, SIRET_COLUMN)]
+        if isinstance(row[SIRET_COLUMN], str):
+            sirets.append(row[SIRET_COLUMN])
+        names = [vary(row[INB_NAME_COLUMN])] if isinstance(row[INB_NAME_COLUMN], str) else []
+        names += rng.choice([[], ["Réacteur 2"], ["Réacteur 5"], ["inconnu"]])
+        codes = [vary(row[INB_CODE_COLUMN])] if isinstance(row[INB_CODE_COLUMN], str) else []
+        themes = [vary(cell(THEMES_DF, rng, THEME_COLUMN)), "thème inconnu"]
+        responses.append(
+            SIv2SmartResponse(
+                r_object_id=[None],
+                exploitant=[],
+                siret=some(sirets) or sirets[:1],
+                nom_ura=some(names),
+                site=[cell(INB_DF, rng, INB_SITE_COLUMN)],
+                num_nom_inb=some(codes),
+                inb_type_rep_ludd=some(["REP", "LUDD"]),
+                natures=[],
+                themes=some(themes),
+                date_env_let_suite=[],
+                date_fin_inspect=[],
+                date_deb_inspect=[],
+                type_inspect=[],
+                priorite=[],
+                inspect_prog=[],
+                inspect_inop=[],
+                agent_pilotes=[],
+                agent_copilotes=[],
+                entite_resp=[],
+                entite_pilote=[],
+            )
+        )
+    return responses
+
+
+class TestReferentialIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        global INB_DF, HOSPITALS_DF, THEMES_DF
+        try:
+            INB_DF = inb_referential()
+            HOSPITALS_DF = hospitals_referential()
+            THEMES_DF = themes_referential()
+        except FileNotFoundError as e:
+            raise unittest.SkipTest(f"The referentials are not available: {e}")
+
+    def test_same_rows_as_pandas(self):
+        for sr in sample_responses(1000):
+            pd.testing.assert_frame_equal(
+                dataframe_matching_INBs(sr), matching_INBs_pandas(sr)
+            )
+            pd.testing.assert_frame_equal(
+                dataframe_matching_themes(sr), matching_themes_pandas(sr)
+            )
+            pd.testing.assert_frame_equal(
+                dataframe_matching_hospitals(sr), matching_hospitals_pandas(sr)
+            )
+
+    def test_consolidation(self):
+        for sr in sample_responses(200, seed=1):
+            consolidate_smart_response(sr)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from siancebackend import referentials
+from siancebackend.referentials import read_referential
+
+
+class TestReadReferential(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = os.path.join(self.directory, "cache")
+        self.path = os.path.join(self.directory, "referentiel.xlsx")
+        pd.DataFrame({"Code": ["ABC", "DEF"], "Libellé": ["a", "b"]}).to_excel(
+            self.path, index=False
+        )
+        patcher = mock.patch.object(
+            referentials, "cache_directory", return_value=self.cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.read_excel = mock.patch.object(
+            referentials.pd, "read_excel", wraps=pd.read_excel
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        referentials._loaded.clear()
+
+    def test_converted_once(self):
+        expected = pd.read_excel(self.path, engine="openpyxl")
+        with self.read_excel as read_excel:
+            df = read_referential(self.path, engine="openpyxl")
+            self.assertEqual(list(df["Code"]), ["ABC", "DEF"])
+            self.assertEqual(len(os.listdir(self.cache)), 1)
+
+            df["Code"] = "modified"
+            self.assertEqual(
+                list(read_referential(self.path, engine="openpyxl")["Code"]),
+                ["ABC", "DEF"],
+            )
+
+            # a new process only reads the pickle
+            referentials._loaded.clear()
+            pd.testing.assert_frame_equal(
+                read_referential(self.path, engine="openpyxl"), expected
+            )
+            self.assertEqual(read_excel.call_count, 1)
+
+            # other arguments, other dataframe
+            read_referential(self.path, engine="openpyxl", dtype=str)
+            self.assertEqual(read_excel.call_count, 2)
+
+    def test_modified_referential_is_read_again(self):
+        with self.read_excel as read_excel:
+            read_referential(self.path)
+            pd.DataFrame({"Code": ["GHI"], "Libellé": ["c"]}).to_excel(
+                self.path, index=False
+            )
+            os.utime(self.path, ns=(0, 0))
+            self.assertEqual(list(read_referential(self.path)["Code"]), ["GHI"])
+            self.assertEqual(read_excel.call_count, 2)
+            self.assertEqual(len(referentials._loaded), 1)
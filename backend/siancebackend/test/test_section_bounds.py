@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from siancebackend.classifiers.section_bounds import (
+    letters_bounds,
+    section_bounds,
+    synthesis_mask,
+)
+
+
+def random_sections(rng: random.Random, n_letters: int):
+    rows = []
+    for id_letter in range(n_letters):
+        for priority in rng.sample([0, 0, 1, 2, 3], rng.randint(0, 4)):
+            start = rng.randint(0, 5000)
+            rows.append([len(rows), id_letter, priority, start, start + rng.randint(1, 3000)])
+    rng.shuffle(rows)
+    sections_df = pd.DataFrame(
+        rows, columns=["id_section", "id_letter", "priority", "start", "end"]
+    )
+    return sections_df.sort_values("id_section")
+
+
+def letters(n_letters: int):
+    return pd.DataFrame(
+        {
+            "id_letter": np.arange(n_letters + 5)[::-1],
+            "text": ["x" * (8000 + k) for k in range(n_letters + 5)],
+        }
+    )
+
+
+class TestSectionBounds(unittest.TestCase):
+    def test_same_bounds_as_masks(self):
+        sections_df = random_sections(random.Random(0), 200)
+        letters_df = letters(200)
+        bounds = letters_bounds(letters_df, section_bounds(sections_df))
+        self.assertEqual(list(bounds.index), list(letters_df.id_letter))
+        mask = synthesis_mask(bounds)
+        for k, (id_letter, text) in enumerate(letters_df.values):
+            sections = sections_df[sections_df.id_letter == id_letter]
+            if len(sections) == 0:
+                expected = (0, len(text))
+            else:
+                expected = (sections["start"].min(), sections["end"].max())
+            self.assertEqual(tuple(bounds[["start", "end"]].values[k]), expected)
+            synthesis = sections[sections.priority == 0][["start", "end"]].values
+            self.assertEqual(mask[k], len(synthesis) > 0)
+            if len(synthesis) > 0:
+                self.assertEqual(
+                    tuple(bounds[["synthesis_start", "synthesis_end"]].values[k]),
+                    tuple(synthesis[0]),
+                )
+
+    def test_without_sections(self):
+        sections_df = random_sections(random.Random(1), 0)
+        bounds = letters_bounds(letters(0), section_bounds(sections_df))
+        self.assertEqual(list(bounds["end"]), [8000 + k for k in range(5)])
+        self.assertFalse(synthesis_mask(bounds).any())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator
+from sklearn.pipeline import Pipeline
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+
+from siancedb import models
+from siancedb.models import SiancedbLetter, SiancedbModel, SiancedbPrediction
+from siancebackend.classifiers import classify_topics, shadow_predictions
+from siancebackend.classifiers.section_bounds import section_bounds
+from siancebackend.letter_management.sentencizer import prepare_sentencizer
+
+
+@compiles(ARRAY, "sqlite")
+def compile_array(element, compiler, **kw):
+    return "JSON"
+
+
+LETTERS = [
+    (1, "Le tube fuit. La vanne est neuve."),
+    (2, "Rien."),
+    (3, "La pompe est neuve. Le joint fuit."),
+]
+
+
+class StubClassifier(BaseEstimator):
+    """
+    Predicts labels from the "embedding" of a sentence (its length), failing on the batches larger than `max_batch`
+    """
+
+    def __init__(self, labels=None, max_batch=None):
+        self.labels = labels
+        self.max_batch = max_batch
+
+    def fit(self, x, y):
+        return self
+
+    def predict(self, x):
+        if self.max_batch is not None and len(x) > self.max_batch:
+            raise ValueError("Batch too large")
+        return [self.labels(int(length)) for length, in x]
+
+
+def stub_pipeline(labels, max_batch=None):
+    return Pipeline(steps=[("classifier", StubClassifier(labels, max_batch))])
+
+
+# the reference labels every sentence, the candidate only the sentences of odd length
+REFERENCE = stub_pipeline(lambda length: [length % 2, 10])
+CANDIDATE = stub_pipeline(lambda length: [1] if length % 2 else [])
+
+
+class StubEmbeddings:
+    def __init__(self):
+        self.sentences = []
+
+    def __call__(self, sentences):
+        self.sentences.extend(sentences)
+        return np.array([[len(sentence)] for sentence in sentences], dtype=float)
+
+
+class TestSplitParity(unittest.TestCase):
+    def setUp(self):
+        self.letters_df = pd.DataFrame(LETTERS, columns=["id_letter", "text"])
+        self.bounds = section_bounds(
+            pd.DataFrame(columns=["id_letter", "priority", "start", "end"])
+        )
+        self.nlp = prepare_sentencizer()
+        self.embeddings = StubEmbeddings()
+        for module in [classify_topics, shadow_predictions]:
+            patcher = mock.patch.object(
+                module, "get_embeddings_sentences", side_effect=self.embeddings
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def expected(self, pipeline):
+        # the rows of `classify_topics` before the split: every sentence of every letter with each of its labels
+        rows = []
+        for id_letter, text in LETTERS:
+            for sent in self.nlp(text).sents:
+                for id_label in pipeline["classifier"].labels(len(sent.text)):
+                    rows.append((id_letter, sent.text, id_label, sent.start_char, sent.end_char))
+        return rows
+
+    def assertRows(self, predictions_df, rows):
+        columns = ["id_letter", "sentence", "id_label", "start", "end"]
+        self.assertEqual(
+            list(predictions_df[columns].itertuples(index=False, name=None)), rows
+        )
+
+    def test_same_predictions(self):
+        for pipeline in [REFERENCE, CANDIDATE]:
+            self.assertRows(
+                classify_topics.classify_topics(pipeline, self.letters_df, self.bounds),
+                self.expected(pipeline),
+            )
+            self.assertRows(
+                shadow_predictions.shadow_predict({1: pipeline}, self.letters_df, self.bounds)[1],
+                self.expected(pipeline),
+            )
+
+    def test_letter_by_letter_when_the_batch_fails(self):
+        pipeline = stub_pipeline(REFERENCE["classifier"].labels, max_batch=2)
+        self.assertRows(
+            classify_topics.classify_topics(pipeline, self.letters_df, self.bounds),
+            self.expected(pipeline),
+        )
+        self.assertRows(
+            shadow_predictions.shadow_predict({1: pipeline}, self.letters_df, self.bounds)[1],
+            self.expected(pipeline),
+        )
+
+
+class TestBuildShadowPredictions(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        engine = create_engine("sqlite://")
+        for model in [SiancedbLetter, SiancedbModel, SiancedbPrediction]:
+            model.__table__.create(engine)
+        session_local = sessionmaker(bind=engine, expire_on_commit=False)
+        self.db = session_local()
+        self.addCleanup(self.db.close)
+        for id_letter, letter_text in LETTERS:
+            self.db.add(
+                SiancedbLetter(
+                    id_letter=id_letter,
+                    name=f"INSSN-LYO-2021-000{id_letter}",
+                    codep="LYO",
+                    text=letter_text,
+                    sent_date=datetime.date(2021, 1, 1),
+                )
+            )
+        for id_model in [1, 2]:
+            # the arrays cannot be bound by SQLite: `prepare_score_dict` is patched instead
+            self.db.execute(
+                text(
+                    "INSERT INTO ape_models (id_model, is_active, link, creation_date, id_labels, user)"
+                    " VALUES (:id_model, :is_active, :link, '2021-01-01', '[]', 1)"
+                ),
+                {"id_model": id_model, "is_active": id_model == 1, "link": f"model-{id_model}.pkl"},
+            )
+        self.db.commit()
+        self.embeddings = StubEmbeddings()
+        pipelines = {"model-1.pkl": REFERENCE, "model-2.pkl": CANDIDATE}
+        config = {"learning": {"evaluations": self.directory}}
+        for patcher in [
+            mock.patch.object(models, "SessionLocal", session_local),
+            mock.patch.object(shadow_predictions, "get_config", return_value=config),
+            mock.patch.object(shadow_predictions, "load_pipeline", side_effect=pipelines.get),
+            mock.patch.object(shadow_predictions, "prepare_score_dict", return_value=dict()),
+            mock.patch.object(
+                shadow_predictions, "get_embeddings_sentences", side_effect=self.embeddings
+            ),
+            mock.patch.object(
+                shadow_predictions,
+                "load_section_bounds",
+                return_value=section_bounds(
+                    pd.DataFrame(columns=["id_letter", "priority", "start", "end"])
+                ),
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sentences = [
+            sent.text
+            for _, letter_text in LETTERS
+            for sent in prepare_sentencizer()(letter_text).sents
+        ]
+
+    def predictions(self, id_model):
+        return sorted(
+            (row.id_letter, row.start, row.id_label)
+            for row in self.db.query(SiancedbPrediction).filter(
+                SiancedbPrediction.id_model == id_model
+            )
+        )
+
+    def test_every_letter_embedded_once(self):
+        report = shadow_predictions.build_shadow_predictions(self.db, [1, 2], chunk_size=2)
+        self.assertEqual(sorted(self.embeddings.sentences), sorted(self.sentences))
+        self.assertEqual(len(self.predictions(1)), 2 * len(self.sentences))
+        # "Rien." (5 characters) is labelled by the candidate
+        self.assertEqual({id_letter for id_letter, _, _ in self.predictions(2)}, {1, 2, 3})
+        self.assertEqual(report[2]["sentences"], len(self.sentences))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_predicted_letters_are_not_inserted_again(self):
+        self.db.add(
+            SiancedbPrediction(
+                id_letter=1, start=0, end=13, sentence="Le tube fuit.", id_label=42, id_model=1
+            )
+        )
+        self.db.commit()
+        shadow_predictions.build_shadow_predictions(self.db, [1, 2])
+        self.assertEqual([row for row in self.predictions(1) if row[0] == 1], [(1, 0, 42)])
+        self.assertIn(1, {id_letter for id_letter, _, _ in self.predictions(2)})
+        # every model has predicted every letter: nothing is predicted at the next run
+        self.embeddings.sentences = []
+        self.assertEqual(shadow_predictions.build_shadow_predictions(self.db, [1, 2]), dict())
+        self.assertEqual(self.embeddings.sentences, [])
+
+    def test_letters_without_label_are_recorded(self):
+        # the model 1 labels nothing: its letters are recorded instead of being selected again,
+        # so that two runs of 2 letters process the 3 letters
+        with mock.patch.object(REFERENCE["classifier"], "labels", lambda length: []):
+            shadow_predictions.build_shadow_predictions(self.db, [2, 1], limit=2)
+            shadow_predictions.build_shadow_predictions(self.db, [2, 1], limit=2)
+            self.embeddings.sentences = []
+            self.assertEqual(shadow_predictions.build_shadow_predictions(self.db, [2, 1]), dict())
+        self.assertEqual(self.embeddings.sentences, [])
+        self.assertEqual(self.predictions(1), [])
+        with open(os.path.join(self.directory, "shadow_unlabelled.json")) as f:
+            self.assertEqual(json.load(f)["1"], [1, 2, 3])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+
+from siancebackend import siv2metadata
+from siancebackend.enrichment import TTLCache
+from siancebackend.siv2_client import Siv2Client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers as the searchInstruct endpoint of the SIv2 would
+    """
+
+    names = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        name = json.loads(self.rfile.read(length))["instructName"]
+        StubHandler.names.append(name)
+        if name == "broken":
+            payload = {"unexpected": True}
+        elif name == "unknown":
+            payload = {"successful": False}
+        else:
+            payload = {"successful": True, "result": {"name": name, "site": "BUGEY"}}
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestSiv2Client(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StubHandler.names = []
+        self.directory = tempfile.mkdtemp()
+        self.client = Siv2Client(
+            self.url,
+            timeout=5,
+            concurrency=4,
+            hashes=TTLCache(os.path.join(self.directory, "hashes.sqlite"), ttl=3600),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_request(self):
+        self.assertEqual(self.client.request("INSSN-LYO-2019-0001")["site"], "BUGEY")
+        self.assertEqual(self.client.request("unknown"), dict())
+        self.assertIsNone(self.client.request("broken"))
+
+    def test_prefetched_responses_are_used_once(self):
+        names = [f"INSSN-LYO-2019-{i:04d}" for i in range(20)]
+        responses = self.client.fetch_many(names + names[:5])
+        self.assertEqual(len(responses), 20)
+        self.assertEqual(sorted(StubHandler.names), sorted(names))
+        self.assertEqual(self.client.fetch(names[3]), {"name": names[3], "site": "BUGEY"})
+        self.assertEqual(len(StubHandler.names), 20)
+        self.client.fetch(names[3])
+        self.assertEqual(len(StubHandler.names), 21)
+
+    def test_payload_changed(self):
+        payload = {"name": "INSSN-LYO-2019-0001", "site": "BUGEY"}
+        self.assertTrue(self.client.payload_changed("INSSN-LYO-2019-0001", payload))
+        # the check alone does not record the payload
+        self.assertTrue(self.client.payload_changed("INSSN-LYO-2019-0001", payload))
+        self.client.record_payload_hash("INSSN-LYO-2019-0001", payload)
+        self.assertFalse(
+            self.client.payload_changed("INSSN-LYO-2019-0001", dict(reversed(payload.items())))
+        )
+        self.assertTrue(
+            self.client.payload_changed("INSSN-LYO-2019-0001", {**payload, "site": "TRICASTIN"})
+        )
+
+
+class TestRefreshMetadata(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.client = Siv2Client(
+            "http://127.0.0.1:1",
+            hashes=TTLCache(os.path.join(self.directory, "hashes.sqlite"), ttl=3600),
+        )
+        self.payload = {"name": "INSSN-LYO-2019-0001", "site": "BUGEY"}
+        self.letter = SimpleNamespace(
+            id_letter=1, name="INSSN-LYO-2019-0001", text="", last_touched=date(2000, 1, 1)
+        )
+        self.db = mock.Mock()
+        self.db.query.return_value.all.return_value = [self.letter]
+        for patcher in [
+            mock.patch.object(siv2metadata, "siv2_client", return_value=self.client),
+            mock.patch.object(siv2metadata, "prefetch_siv2"),
+            mock.patch.object(
+                siv2metadata,
+                "safe_fetch_siv2",
+                return_value=(self.payload, "INSSN-LYO-2019-0001"),
+            ),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def changed(self):
+        return self.client.payload_changed("INSSN-LYO-2019-0001", self.payload)
+
+    def test_hash_recorded_after_the_commit(self):
+        metadata = SimpleNamespace(id_metadata=None)
+        # the hash is not recorded yet when the metadata are committed
+        self.db.commit.side_effect = lambda: self.assertTrue(self.changed())
+        with mock.patch.object(
+            siv2metadata,
+            "prepare_siv2metadata_interlocutor_one_letter",
+            return_value=(metadata, None),
+        ):
+            siv2metadata.refresh_metadata(self.db)
+        self.db.merge.assert_called_once_with(metadata)
+        self.assertFalse(self.changed())
+
+    def test_failed_build_is_attempted_again(self):
+        with mock.patch.object(
+            siv2metadata,
+            "prepare_siv2metadata_interlocutor_one_letter",
+            side_effect=KeyError("site"),
+        ), self.assertRaises(KeyError):
+            siv2metadata.refresh_metadata(self.db)
+        self.db.commit.assert_not_called()
+        self.assertTrue(self.changed())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+
+import datetime
+
+import pandas as pd
+
+from siancebackend.siv2_store import Siv2Store
+from siancebackend.ingest_cres import FolderPrefixIndex
+from siancebackend.letter_management.letter_cleaning import process_french_date
+
+
+RECORDS = [
+    {
+        "object_name": "INSSN-LYO-2019-0001",
+        "r_object_id": "0b001",
+        "r_folder_path": ["/SIv2/Lyon/Bugey", "/SIv2/Lyon/Bugey/INB78"],
+        "r_modify_date": "12/03/2019",
+        "siret": "1",
+    },
+    {
+        "object_name": "INSSN-LYO-2020-0002",
+        "r_object_id": "0b002",
+        "r_folder_path": "/SIv2/Lyon/Bugey",
+        "r_modify_date": "2020-05-01T10:00:00Z",
+        "siret": "2",
+    },
+    {
+        "object_name": "INSSN-LYO-2019-0001",
+        "r_object_id": "0b003",
+        "r_folder_path": ["/SIv2/Paris"],
+        "siret": "3",
+    },
+    {
+        "object_name": "INSSN-PRS-2021-0004",
+        "r_object_id": "0b004",
+        "r_folder_path": [],
+        "r_modify_date": "not a date",
+        "siret": "4",
+    },
+]
+
+
+class TestSiv2Store(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dump = os.path.join(self.directory, "asn_dump.txt")
+        with open(self.dump, "w") as f:
+            for record in RECORDS:
+                f.write(json.dumps(record) + "\n")
+        self.store = Siv2Store(self.dump, directory=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookups(self):
+        self.assertEqual(len(self.store), len(RECORDS))
+        self.assertEqual(self.store.by_object_name("INSSN-LYO-2019-0001"), RECORDS[0])
+        self.assertEqual(self.store.by_r_object_id("0b003"), RECORDS[2])
+        self.assertIsNone(self.store.by_object_name("INSSN-XXX-0000-0000"))
+        self.assertEqual(
+            self.store.by_folder_path("/SIv2/Lyon/Bugey"), [RECORDS[0], RECORDS[1]]
+        )
+
+    def test_scan_by_modify_date(self):
+        self.assertEqual(list(self.store.scan()), RECORDS)
+        for since in [
+            datetime.date(1970, 1, 1),
+            datetime.date(2019, 3, 12),
+            datetime.date(2020, 1, 1),
+            datetime.date(2030, 1, 1),
+        ]:
+            expected = [
+                record
+                for record in RECORDS
+                if process_french_date(record.get("r_modify_date")).date() >= since
+            ]
+            self.assertEqual(list(self.store.scan(modified_since=since)), expected)
+
+    def test_rebuilt_when_source_changes(self):
+        with open(self.dump, "a") as f:
+            f.write(json.dumps({"object_name": "NEW", "r_object_id": "0b005"}) + "\n")
+        os.utime(self.dump, ns=(0, 10 ** 9))
+        self.store.refresh()
+        self.assertEqual(len(self.store), len(RECORDS) + 1)
+        self.assertEqual(self.store.by_object_name("NEW")["r_object_id"], "0b005")
+
+    def test_mock_pickle(self):
+        mock = pd.DataFrame(RECORDS, index=[10, 11, 12, 13])
+        path = os.path.join(self.directory, "mock.pkl")
+        mock.to_pickle(path)
+        store = Siv2Store(path, directory=self.directory)
+        for name in mock.object_name:
+            expected = mock[mock.object_name == name].iloc[0]
+            pd.testing.assert_series_equal(store.series_by_object_name(name), expected)
+
+
+class TestFolderPrefixIndex(unittest.TestCase):
+    def test_same_matches_as_startswith(self):
+        rng = random.Random(0)
+        folders = ["/SIv2", "/SIv2/Lyon", "/SIv2/Lyon/Bugey", "/SIv2/Paris", "/Autre"]
+        interlocutors = [
+            {"siret": str(i), "r_folder_path": rng.sample(folders, rng.randint(0, 2))}
+            for i in range(200)
+        ]
+        interlocutors.append({"siret": "no folder"})
+        index = FolderPrefixIndex(interlocutors)
+        for paths in [
+            ["/SIv2/Lyon/Bugey/INB78"],
+            ["/SIv2/Paris", "/Autre/x"],
+            ["/SIv2"],
+            ["/Nowhere"],
+            [],
+        ]:
+            expected = [
+                x
+                for x in interlocutors
+                if any(ps.startswith(tuple(x.get("r_folder_path", []))) for ps in paths)
+            ]
+            self.assertEqual(index.matching(paths), expected)
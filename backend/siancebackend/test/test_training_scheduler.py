@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.neural_network import MLPClassifier
+
+from siancebackend.classifiers.hierarchical_classifier import (
+    CustomHierarchicalCategoryClassifier,
+)
+from siancebackend.classifiers.training_scheduler import array_location, fit_parallel
+
+
+def clusters(rng, n_samples=800, n_features=16, n_labels=12):
+    centers = rng.normal(size=(n_labels, n_features))
+    y = rng.integers(0, n_labels, size=n_samples)
+    return centers[y] + rng.normal(scale=1.5, size=(n_samples, n_features)), y
+
+
+def jobs(y, n_jobs=4):
+    return {
+        k: (
+            MLPClassifier(hidden_layer_sizes=(8,), max_iter=40, random_state=k),
+            np.flatnonzero(y % n_jobs == k),
+            y[y % n_jobs == k],
+        )
+        for k in range(n_jobs)
+    }
+
+
+class TestFitParallel(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        self.addCleanup(warnings.resetwarnings)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_models_as_sequential(self):
+        x, y = clusters(np.random.default_rng(0))
+        sequential, _ = fit_parallel(x, jobs(y), n_workers=1)
+        parallel, times = fit_parallel(x, jobs(y), n_workers=2)
+        self.assertEqual(set(times), set(sequential))
+        for k, estimator in sequential.items():
+            for coef, other in zip(estimator.coefs_, parallel[k].coefs_):
+                np.testing.assert_array_equal(coef, other)
+
+    def test_memory_mapped_embeddings_are_reused(self):
+        x, y = clusters(np.random.default_rng(1))
+        path = os.path.join(self.directory, "embeddings.npy")
+        np.save(path, x)
+        mapped = np.load(path, mmap_mode="r")
+        self.assertEqual(array_location(mapped)[0], path)
+        self.assertIsNone(array_location(mapped[10:]))
+        self.assertIsNone(array_location(x))
+        fitted, _ = fit_parallel(mapped, jobs(y, n_jobs=2), n_workers=2)
+        self.assertEqual(len(fitted), 2)
+
+    def test_hierarchical_classifier(self):
+        x, y = clusters(np.random.default_rng(2))
+        hierarchy = {label: f"category {label % 3}" for label in range(12)}
+        predictions = []
+        for n_workers in [1, 3]:
+            classifier = CustomHierarchicalCategoryClassifier(
+                MLPClassifier(hidden_layer_sizes=(8,), max_iter=40, random_state=0),
+                MLPClassifier(hidden_layer_sizes=(8,), max_iter=40, random_state=0),
+                hierarchy,
+                n_workers=n_workers,
+            )
+            classifier.fit(x, np.reshape(y, (-1, 1)))
+            self.assertEqual(set(classifier.fit_times_), set(hierarchy.values()))
+            predictions.append(classifier.predict(x))
+        np.testing.assert_array_equal(*predictions)
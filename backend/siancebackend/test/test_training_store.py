@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from siancebackend.classifiers.training_store import (
+    TrainingStore,
+    append_npy,
+    sentence_key,
+)
+
+
+class TestAppendNpy(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "embeddings.npy")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_in_place(self):
+        x = np.arange(12, dtype=np.float32).reshape(4, 3)
+        np.save(self.path, x)
+        size = os.path.getsize(self.path)
+        append_npy(self.path, x[:2] + 100)
+        self.assertEqual(os.path.getsize(self.path), size + x[:2].nbytes)
+        np.testing.assert_array_equal(np.load(self.path), np.concatenate([x, x[:2] + 100]))
+        np.testing.assert_array_equal(np.load(self.path, mmap_mode="r")[-1], x[1] + 100)
+
+    def test_rows_are_cast(self):
+        np.save(self.path, np.zeros((2, 2), dtype=np.int64))
+        append_npy(self.path, np.ones((1, 2), dtype=np.int32))
+        result = np.load(self.path)
+        self.assertEqual(result.dtype, np.int64)
+        np.testing.assert_array_equal(result, [[0, 0], [0, 0], [1, 1]])
+
+    def test_fortran_order(self):
+        # the rows of a Fortran-ordered array are not contiguous: the file is rewritten
+        x = np.asfortranarray(np.arange(6).reshape(3, 2))
+        np.save(self.path, x)
+        append_npy(self.path, [[6, 7]])
+        np.testing.assert_array_equal(np.load(self.path), np.arange(8).reshape(4, 2))
+
+    def test_objects_and_missing_file(self):
+        append_npy(self.path, np.array([1, 2]))
+        np.testing.assert_array_equal(np.load(self.path), [1, 2])
+        labels = np.empty(2, dtype=object)
+        labels[:] = [[1, 2], [3]]
+        np.save(self.path, labels)
+        more = np.empty(1, dtype=object)
+        more[:] = [[4, 5]]
+        append_npy(self.path, more)
+        self.assertEqual(list(np.load(self.path, allow_pickle=True)), [[1, 2], [3], [4, 5]])
+
+
+def training_rows(rows):
+    """
+    Rows of ape_training: (id_annotation, name, sentence, id_label)
+    """
+    return pd.DataFrame(
+        [
+            {
+                "id_annotation": id_annotation,
+                "name": name,
+                "start": 0,
+                "end": len(sentence),
+                "sentence": sentence,
+                "id_label": id_label,
+            }
+            for id_annotation, name, sentence, id_label in rows
+        ]
+    )
+
+
+class FakeEmbedder:
+    """
+    Embed a sentence with its length and its first character, and remember the calls
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, sentences):
+        self.calls.append(list(sentences))
+        return np.array([[len(s), ord(s[0])] for s in sentences], dtype=np.float64)
+
+
+class TestTrainingStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = TrainingStore(self.directory)
+        self.embed = FakeEmbedder()
+        self.store.append(
+            training_rows(
+                [
+                    (1, "L1", "a first sentence", 10),
+                    (2, "L1", "a first sentence", 11),
+                    (3, "L2", "bb", 10),
+                    (4, "L2", "ccc", 12),
+                ]
+            ),
+            self.embed,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sentences_are_embedded_once(self):
+        self.assertEqual(len(self.embed.calls), 1)
+        self.assertEqual(sorted(self.embed.calls[0]), ["a first sentence", "bb", "ccc"])
+        self.assertEqual(self.store.last_id_annotation(), 4)
+        # a new label on a known sentence, a new sentence twice, and the same text in another letter
+        embedded = self.store.append(
+            training_rows(
+                [
+                    (5, "L2", "bb", 13),
+                    (6, "L3", "dddd", 10),
+                    (7, "L3", "dddd", 11),
+                    (8, "L4", "bb", 10),
+                ]
+            ),
+            self.embed,
+        )
+        self.assertEqual(embedded, 2)
+        self.assertEqual(sorted(self.embed.calls[1]), ["bb", "dddd"])
+        self.assertEqual(self.store.embeddings().shape, (5, 2))
+        self.assertEqual(self.store.last_id_annotation(), 8)
+        self.assertEqual(self.store.append(training_rows([]), self.embed), 0)
+
+    def test_views(self):
+        x, y, last_ids = self.store.mono_output()
+        np.testing.assert_array_equal(x[:, 0], [16, 16, 2, 3])
+        np.testing.assert_array_equal(y, [[10], [11], [10], [12]])
+        np.testing.assert_array_equal(last_ids, [1, 2, 3, 4])
+        self.assertEqual(x.dtype, np.float32)
+
+        x, id_labels, last_ids = self.store.multi_output()
+        self.assertIsInstance(x, np.memmap)
+        by_length = {int(row[0]): labels for row, labels in zip(x, id_labels)}
+        self.assertEqual(by_length, {16: [10, 11], 2: [10], 3: [12]})
+        by_length = {int(row[0]): last for row, last in zip(x, last_ids)}
+        self.assertEqual(by_length, {16: 2, 2: 3, 3: 4})
+
+    def test_removed_annotations(self):
+        self.assertEqual(self.store.remove_annotations([1, 2, 4]), 1)
+        x, id_labels, _ = self.store.multi_output()
+        # the sentence of the removed annotation is not in the training set anymore
+        self.assertEqual(sorted(x[:, 0].tolist()), [3, 16])
+        self.assertEqual(self.store.remove_annotations([1, 2, 4]), 0)
+
+    def test_interrupted_update(self):
+        # embeddings appended without their keys are replaced by the next update
+        append_npy(self.store.path("training_embeddings.npy"), np.zeros((2, 2), dtype=np.float32))
+        self.assertEqual(len(self.store.embeddings()), 3)
+        self.store.append(training_rows([(5, "L5", "eeeee", 10)]), self.embed)
+        x, y, _ = self.store.mono_output()
+        self.assertEqual(x.shape, (5, 2))
+        np.testing.assert_array_equal(x[-1], [5, ord("e")])
+
+    def test_sentence_key(self):
+        key = sentence_key("L1", 0, 2, "bb")
+        self.assertEqual(key, sentence_key("L1", 0, 2, "bb"))
+        self.assertNotEqual(key, sentence_key("L1", 0, 2, "bc"))
+        self.assertNotEqual(key, sentence_key("L1", 1, 2, "bb"))
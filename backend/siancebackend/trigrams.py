@@ -6,12 +6,13 @@ from siancebackend.pipe_logger import update_log_state
 from siancedb.models import Session, SessionWrapper, SiancedbLetter, SiancedbTrigram
 from siancedb.pandas_writer import chunker
 from siancedb.config import get_config
+from siancebackend.referentials import read_referential
 
 import logging
 
 logger = logging.getLogger("trigrams")
 logger.setLevel(logging.DEBUG)
-fh = logging.FileHandler("logs/trigrams.log")
+fh = logging.FileHandler("logs/trigrams.log", delay=True)
 fh.setLevel(logging.DEBUG)
 logger.addHandler(fh)
 
@@ -54,7 +55,7 @@ def build_trigrams(db: Session, pipe_logger=None):
 
 
 def get_edf_trigrams_ref():
-    edf_trigrams_df = pd.read_excel(
+    edf_trigrams_df = read_referential(
         CONFIG["letters"]["trigrams"]["edf"], engine="openpyxl"
     )
     cleaned_trigrams_df = clean_edf_trigrams(edf_trigrams_df)
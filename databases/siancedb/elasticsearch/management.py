@@ -20,7 +20,7 @@ CRES = ES["cres"]
 logger = logging.getLogger("elasticsearch-management")
 logger.setLevel(logging.DEBUG)
 # create file handler which logs even debug messages
-fh = logging.FileHandler("logs/elasticsearch_management.log")
+fh = logging.FileHandler("logs/elasticsearch_management.log", delay=True)
 fh.setLevel(logging.DEBUG)
 # create console handler with a higher log level
 ch = logging.StreamHandler()
@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
-import json
 import re
 import datetime
 from siancedb.config import get_config
+from siancedb.geography import region_codes
 from typing import List, Optional, Tuple, Union
 from siancedb.elasticsearch.schemes import EFilter, EValue, EQuery, FieldValuesPost
 
@@ -331,11 +331,7 @@ def build_explain_query(q: EQuery):
     }
 
 
-with open(get_config()["geography"]["regions"], "r") as f:
-    GEO = json.load(f)
-
-
-def build_geo_query(q: EQuery, id_interlocutors: List[int] = []):
+def build_geo_query(q: EQuery):
     b = dict()
     if q.sentence.strip() != "":
         b["must"] = simple_query_string(q.sentence)
@@ -349,20 +345,15 @@ def build_geo_query(q: EQuery, id_interlocutors: List[int] = []):
             }
         },
         "aggs": {
-            "ludd_and_rep": {
-                "filter": {"terms": {"id_interlocutor": id_interlocutors}},
-                "aggs": {"id_interlocutor": {"terms": {"field": "id_interlocutor"}}},
-            },
-            **{
-                r["properties"]["code"]: {
-                    "filter": {
-                        "term": {"region_code": r["properties"]["code"]},
-                    },
-                    "aggs": {
-                        "interlocutors": {"cardinality": {"field": "id_interlocutor"}}
-                    },
-                }
-                for r in GEO["features"]
+            "regions": {
+                "terms": {
+                    "field": "region_code",
+                    "include": region_codes(),
+                    "size": len(region_codes()),
+                },
+                "aggs": {
+                    "interlocutors": {"cardinality": {"field": "id_interlocutor"}}
+                },
             },
         },
     }
@@ -0,0 +1,53 @@
+"""
+    Lookup tables built from the regions GeoJSON.
+
+    The GeoJSON file referenced by `geography.regions` in the
+    configuration is read once, the first time one of the
+    accessors below is called, and turned into a plain dictionary
+    so that finding the name of a region is a single
+    dictionary access.
+"""
+
+import json
+from functools import lru_cache
+from typing import Dict, List
+
+from siancedb.config import get_config
+
+UNKNOWN_REGION = "INCONNU·E·S"
+
+
+@lru_cache(maxsize=None)
+def load_regions() -> Dict:
+    """
+    Read the GeoJSON of the regions. The result is cached,
+    the file is only opened once per process.
+    """
+    with open(get_config()["geography"]["regions"], "r") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def region_names() -> Dict[str, str]:
+    """
+    The dictionary region code -> region name,
+    ordered as in the GeoJSON file.
+    """
+    return {
+        feature["properties"]["code"]: feature["properties"]["nom"]
+        for feature in load_regions()["features"]
+    }
+
+
+def region_codes() -> List[str]:
+    return list(region_names().keys())
+
+
+def get_region_name(region_code: str) -> str:
+    """
+    Name of the region with the given code (as written by geo.api.gouv.fr),
+    or UNKNOWN_REGION when the code is empty or unknown.
+    """
+    if region_code is None or region_code == "":
+        region_code = "0"
+    return region_names().get(str(region_code), UNKNOWN_REGION)
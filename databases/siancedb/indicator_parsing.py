@@ -52,7 +52,7 @@ import logging
 logger = logging.getLogger("indicators")
 logger.setLevel(logging.DEBUG)
 # create file handler which logs even debug messages
-fh = logging.FileHandler("logs/indicators.log")
+fh = logging.FileHandler("logs/indicators.log", delay=True)
 
 
 def transformExcelSheetToDataFrame(df, sheet):
@@ -1,9 +1,21 @@
-from siancedb.models import SiancedbLetter, SiancedbLabel, SessionWrapper
+from siancedb.models import (
+    Session,
+    SiancedbLetter,
+    SiancedbPrediction,
+    SiancedbTraining,
+)
+from siancedb.config import get_config
+from siancedb.reference_cache import LABELS, cached, load_labels
+from siancedb.reference_cache import labels as cached_labels
 
-from typing import List, Optional, Tuple, Sequence, Union
+from typing import Dict, List, Optional, Tuple, Sequence, Union
 from pydantic import BaseModel
+from sqlalchemy import func
 
 import re
+import bisect
+import threading
+from collections import OrderedDict
 
 
 import itertools
@@ -40,20 +52,51 @@ AnnotatedText = TreeNode
 
 label_sep_char = " : "
 
-with SessionWrapper() as db:
-    LabelTranslate = {
-        label.id_label: label.category.upper() + label_sep_char + label.subcategory
-        for label in db.query(SiancedbLabel).all()
+
+def label_translate() -> Dict[int, str]:
+    """
+    The name displayed for each label
+    """
+    return {
+        label["id_label"]: label["category"].upper() + label_sep_char + label["subcategory"]
+        for label in cached_labels()
+    }
+
+
+def warm_up():
+    """
+    Load what `hydrate_letter` needs, so that the first request does not wait for it
+    """
+    label_translate()
+
+
+# a block of the letter: absolute start and end, and the list of its semantics
+Block = Tuple[int, int, List[Dict]]
+
+
+def block_semantics(
+    id_semantics: int, kind: str, value: str, confidence: Optional[float] = None
+) -> Dict:
+    """
+    A `BlockSemantics` as a dictionary
+    """
+    return {
+        "id_semantics": id_semantics,
+        "kind": kind,
+        "value": value,
+        "confidence": confidence,
     }
 
 
-def hydrate_letter(letter: SiancedbLetter, mode: str, id_model: int):
+def hydrate_letter(letter: SiancedbLetter, mode: str, id_model: int) -> List[Dict]:
     """
     Transforms a flat letter into a enriched tree
     using the mode {mode} which can be either "predictions" or
     "training"
     We use the {id_model} version of the predictions to compute
     predictions...
+
+    The tree is made of dictionaries with the structure of `AnnotatedText`
     """
 
     #
@@ -68,63 +111,50 @@ def hydrate_letter(letter: SiancedbLetter, mode: str, id_model: int):
 
     sections = sorted(
         [
-            LetterBlock(
-                start=section.start,
-                end=section.end,
-                semantics=[
-                    BlockSemantics(
-                        id_semantics=section.id_section,
-                        kind="sections",
-                        value=f"{section.priority}",
-                    )
-                ],
+            (
+                section.start,
+                section.end,
+                [block_semantics(section.id_section, "sections", f"{section.priority}")],
             )
             for section in letter.sections
         ],
-        key=lambda x: x.start,
+        key=lambda x: x[0],
     )
 
     demands = sorted(
         [
-            LetterBlock(
-                start=demand.start,
-                end=demand.end,
-                semantics=[
-                    BlockSemantics(
-                        id_semantics=demand.id_demand,
-                        kind="demands",
-                        value=demand.priority,
-                    )
-                ],
+            (
+                demand.start,
+                demand.end,
+                [block_semantics(demand.id_demand, "demands", f"{demand.priority}")],
             )
-            for index, demand in enumerate(letter.demands)
+            for demand in letter.demands
         ],
-        key=lambda x: x.start,
+        key=lambda x: x[0],
     )
 
-    last_demand_a = len(
-        [demand for demand in demands if demand.semantics[0].value == "1"]
-    )
+    last_demand_a = len([demand for demand in demands if demand[2][0]["value"] == "1"])
 
     for num_demand, demand in enumerate(demands):
-        if demand.semantics[0].value == "1":
-            demand.semantics[0].value = f"{1  + num_demand}"
-        elif demand.semantics[0].value == "2":
-            demand.semantics[0].value = f"{1 + num_demand - last_demand_a}"
+        if demand[2][0]["value"] == "1":
+            demand[2][0]["value"] = f"{1  + num_demand}"
+        elif demand[2][0]["value"] == "2":
+            demand[2][0]["value"] = f"{1 + num_demand - last_demand_a}"
 
+    labels = label_translate()
     sentences = sorted(
         [
-            LetterBlock(
-                start=sentence.start,
-                end=sentence.end,
-                semantics=[
-                    BlockSemantics(
-                        id_semantics=sentence.id_prediction
+            (
+                sentence.start,
+                sentence.end,
+                [
+                    block_semantics(
+                        sentence.id_prediction
                         if mode == PREDICTION_MODE
                         else sentence.id_annotation,
-                        kind=mode,
-                        value=LabelTranslate[sentence.id_label],
-                        confidence=sentence.decision_score,
+                        mode,
+                        labels[sentence.id_label],
+                        getattr(sentence, "decision_score", None),
                     )
                 ],
             )
@@ -134,84 +164,151 @@ def hydrate_letter(letter: SiancedbLetter, mode: str, id_model: int):
             # take all predictions in training mode and only the ones of the expected model in prediction mode
             if mode == TRAINING_MODE or sentence.id_model == id_model
         ],
-        key=lambda x: x.start,
+        key=lambda x: x[0],
     )
 
     # we now group sentences by starting positions
     def repr_group(group):
         group = list(group)
-        return LetterBlock(
-            start=group[0].start,
-            end=group[0].end,
-            semantics=[
-                prediction
-                for predicted_sentence in group
-                for prediction in predicted_sentence.semantics
-            ],
+        return (
+            group[0][0],
+            group[0][1],
+            [prediction for sentence in group for prediction in sentence[2]],
         )
 
-    sentences = [
-        repr_group(g) for _, g in itertools.groupby(sentences, key=lambda x: x.start)
-    ]
+    sentences = [repr_group(g) for _, g in itertools.groupby(sentences, key=lambda x: x[0])]
 
     return recursive_split(letter.text, sections, demands, sentences)
 
 
-def recursive_split(
-    text: str, *annotation_levels: List[List[LetterBlock]]
-) -> List[AnnotatedText]:
+def recursive_split(text: str, *annotation_levels: List[Block]) -> List[Dict]:
     """
     Split the text using the annotations in the list,
     each annotation levels splits the text further into a tree.
+
+    Every level must be sorted by starting position. The positions in the tree
+    are relative to the parent block, as in `AnnotatedText`.
+    """
+    return split_level(text, 0, len(text), 0, annotation_levels)
+
+
+def split_level(
+    text: str, lo: int, length: int, origin: int, annotation_levels: Sequence[List[Block]]
+) -> List[Dict]:
+    """
+    Split `text[lo:lo + length]`, the text of a block starting at `origin`.
+    The blocks keep their absolute positions, so the annotations of the lower levels
+    are never copied, and the children of a block are found by bisection.
     """
     if len(annotation_levels) == 0:
-        return [TreeLeaf(leaf=text)]
+        return [{"leaf": text[lo : lo + length]}]
+
+    annotations = annotation_levels[0]
+    if len(annotations) == 0:  # base case. When we are at the thinest level of imbrications
+        blocks = [(origin, origin + length, [])]
     else:
-        if (
-            len(annotation_levels[0]) == 0
-        ):  # base case. When we are at the thinest level of imbrications
-            blocks = [LetterBlock(start=0, end=len(text), semantics=[])]
-        else:
-            annotations = annotation_levels[
-                0
-            ]  # 'myse en abime'. getting inside a thiner level of imbrication
-            blocks = [LetterBlock(start=0, end=annotations[0].start, semantics=[])]
-            blocks.extend(
-                [
-                    u
-                    for a1, a2 in zip(annotations[:-1], annotations[1:])
-                    for u in [
-                        a1,
-                        LetterBlock(start=a1.end, end=a2.start, semantics=[]),
-                    ]
-                ]
-            )
-            blocks.append(annotations[-1])
-            blocks.append(
-                LetterBlock(start=annotations[-1].end, end=len(text), semantics=[])
-            )
-            # at this point the 'blocks' consists of starting and ending positions. Then it is enriched with 'semantics' parameter
-            blocks = list(filter(lambda x: x.end != x.start, blocks))
+        blocks = [(origin, annotations[0][0], [])]
+        for a1, a2 in zip(annotations[:-1], annotations[1:]):
+            blocks.append(a1)
+            blocks.append((a1[1], a2[0], []))
+        blocks.append(annotations[-1])
+        blocks.append((annotations[-1][1], origin + length, []))
+        # at this point the 'blocks' consists of starting and ending positions with their semantics
+        blocks = [block for block in blocks if block[1] != block[0]]
+
+    lower_levels = annotation_levels[1:]
+    lower_starts = [[u[0] for u in level] for level in lower_levels]
+    nodes = []
+    for start, end, semantics in blocks:
         # at this point, we assume that the start and stop of an inner block are included in its parent
         # in particular, this should be true with the cut in sections/demands (entirely included in a section)/sentences
-        return [
-            TreeNode(
-                children=recursive_split(
-                    text[block.start : block.end],
-                    *[
-                        [
-                            LetterBlock(
-                                semantics=u.semantics,
-                                start=u.start - block.start,
-                                end=u.end - block.start,
-                            )
-                            for u in l
-                            if u.start >= block.start and u.end <= block.end
-                        ]
-                        for l in annotation_levels[1:]
-                    ],
+        children_levels = [
+            [
+                u
+                for u in level[
+                    bisect.bisect_left(starts, start) : bisect.bisect_right(starts, end)
+                ]
+                if u[1] <= end
+            ]
+            for level, starts in zip(lower_levels, lower_starts)
+        ]
+        child_start, child_end, _ = slice(start - origin, end - origin).indices(length)
+        nodes.append(
+            {
+                "children": split_level(
+                    text,
+                    lo + child_start,
+                    max(0, child_end - child_start),
+                    start,
+                    children_levels,
                 ),
-                value=block,
+                "value": {
+                    "start": start - origin,
+                    "end": end - origin,
+                    "semantics": semantics,
+                },
+            }
+        )
+    return nodes
+
+
+_hydrated: "OrderedDict[Tuple, Tuple[Tuple, List[Dict]]]" = OrderedDict()
+_hydrated_lock = threading.Lock()
+
+
+def hydration_cache_size() -> int:
+    return get_config().get("observe", dict()).get("hydration_cache_size", 256)
+
+
+def hydration_fingerprint(
+    db: Session, letter: SiancedbLetter, mode: str, id_model: int
+) -> Tuple:
+    """
+    Changes whenever the letter is predicted again (or annotated) or the labels change
+    """
+    if mode == PREDICTION_MODE:
+        count, last = (
+            db.query(
+                func.count(SiancedbPrediction.id_prediction),
+                func.max(SiancedbPrediction.id_prediction),
             )
-            for block in blocks
-        ]
+            .filter(
+                SiancedbPrediction.id_letter == letter.id_letter,
+                SiancedbPrediction.id_model == id_model,
+            )
+            .one()
+        )
+    else:
+        count, last = (
+            db.query(
+                func.count(SiancedbTraining.id_annotation),
+                func.max(SiancedbTraining.id_annotation),
+            )
+            .filter(SiancedbTraining.name == letter.name)
+            .one()
+        )
+    return count, last, cached(LABELS, load_labels)[1]
+
+
+def hydrate_letter_cached(
+    db: Session, letter: SiancedbLetter, mode: str, id_model: int
+) -> List[Dict]:
+    """
+    Same as `hydrate_letter`, but the trees of the last letters observed are kept
+    in memory (`observe.hydration_cache_size` of the configuration)
+    as long as their predictions do not change. The result must not be modified.
+    """
+    key = (letter.id_letter, id_model, mode)
+    fingerprint = hydration_fingerprint(db, letter, mode, id_model)
+    with _hydrated_lock:
+        entry = _hydrated.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            _hydrated.move_to_end(key)
+            return entry[1]
+    content = hydrate_letter(letter, mode=mode, id_model=id_model)
+    with _hydrated_lock:
+        _hydrated[key] = (fingerprint, content)
+        _hydrated.move_to_end(key)
+        while len(_hydrated) > hydration_cache_size():
+            _hydrated.popitem(last=False)
+    return content
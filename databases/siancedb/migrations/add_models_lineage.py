@@ -0,0 +1,25 @@
+"""
+Update the models' table
+by adding the model each one was refreshed from
+and the last annotation it was trained on
+"""
+from sqlalchemy import text
+from siancedb.models import SessionWrapper
+
+STATEMENTS = [
+    "ALTER TABLE ape_models ADD COLUMN IF NOT EXISTS parent_id_model INTEGER "
+    "REFERENCES ape_models (id_model)",
+    "ALTER TABLE ape_models ADD COLUMN IF NOT EXISTS last_id_annotation INTEGER",
+]
+
+
+def add_models_lineage():
+    """ Does the migration """
+    with SessionWrapper() as db:
+        for statement in STATEMENTS:
+            db.execute(text(statement))
+        db.commit()
+
+
+if __name__ == "__main__":
+    add_models_lineage()
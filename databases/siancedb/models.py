@@ -297,6 +297,10 @@ class SiancedbModel(Base):
     the value is None. `id_labels` and `score_labels` must be aligned"""
     is_multi_output = Column(Boolean, nullable=True)
     "Boolean indicating whether the model is multi-label"
+    parent_id_model = Column(Integer, ForeignKey("ape_models.id_model"), nullable=True)
+    "The model this one was refreshed from with the new annotations, None if it was trained from scratch"
+    last_id_annotation = Column(Integer, nullable=True)
+    "The last annotation of ape_training (`id_annotation`) the model was trained on"
 
     user = Column(Integer, ForeignKey("ape_users.id_user"), nullable=False)
     "Who trained the model"
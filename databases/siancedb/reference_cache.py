@@ -0,0 +1,128 @@
+"""
+    Cache of the reference data of the database.
+
+    The active model, the labels and the list of themes change rarely
+    but are needed by most requests of the API. They are read from
+    Postgres at most once every `reference_cache.ttl_seconds` of the
+    configuration (default 600) in each process, and dropped at once
+    when this process activates a model (`activate_model`).
+    Other processes see the change when their entry expires.
+
+    Every entry comes with an ETag (a hash of its value), so that the
+    API can answer `304 Not Modified` to clients that are up to date.
+"""
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from siancedb.config import get_config
+from siancedb.models import (
+    Session,
+    SessionWrapper,
+    SiancedbLabel,
+    SiancedbModel,
+    SiancedbSIv2LettersMetadata,
+    get_active_model_id,
+)
+
+ACTIVE_MODEL = "active_model"
+LABELS = "labels"
+THEMES = "themes"
+
+_entries: Dict[str, Tuple[float, object, str]] = dict()
+_lock = threading.Lock()
+
+
+def ttl_seconds() -> float:
+    return get_config().get("reference_cache", dict()).get("ttl_seconds", 600)
+
+
+def compute_etag(value) -> str:
+    serialized = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
+
+def cached(name: str, load: Callable[[], object]) -> Tuple[object, str]:
+    """
+    The pair (value, etag) of the entry, loaded with `load` when it is
+    missing or expired. The value is shared: it must not be modified.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(name)
+        if entry is not None and now - entry[0] < ttl_seconds():
+            return entry[1], entry[2]
+    value = load()
+    etag = compute_etag(value)
+    with _lock:
+        _entries[name] = (now, value, etag)
+    return value, etag
+
+
+def invalidate(*names: str):
+    """
+    Drop the given entries (all of them when no name is given)
+    """
+    with _lock:
+        if not names:
+            _entries.clear()
+        for name in names:
+            _entries.pop(name, None)
+
+
+def load_labels() -> List[Dict]:
+    with SessionWrapper() as db:
+        return [
+            {
+                column.name: getattr(label, column.name)
+                for column in SiancedbLabel.__table__.columns
+            }
+            for label in db.query(SiancedbLabel).order_by(SiancedbLabel.id_label)
+        ]
+
+
+def load_themes() -> List[str]:
+    with SessionWrapper() as db:
+        return [
+            theme
+            for theme, in db.query(SiancedbSIv2LettersMetadata.theme)
+            .distinct(SiancedbSIv2LettersMetadata.theme)
+            .all()
+        ]
+
+
+def active_model_id() -> int:
+    return cached(ACTIVE_MODEL, get_active_model_id)[0]
+
+
+def labels() -> List[Dict]:
+    """
+    The columns of every label, as dictionaries
+    """
+    return cached(LABELS, load_labels)[0]
+
+
+def themes() -> List[str]:
+    """
+    The distinct themes of the SIv2 metadata
+    """
+    return cached(THEMES, load_themes)[0]
+
+
+def activate_model(db: Session, id_model: int):
+    """
+    Make `id_model` the only active model
+    """
+    # pylint: disable=no-member
+    if db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).count() == 0:
+        raise ValueError(f"There is no model {id_model}")
+    db.query(SiancedbModel).filter(SiancedbModel.id_model != id_model).update(
+        {SiancedbModel.is_active: False}, synchronize_session=False
+    )
+    db.query(SiancedbModel).filter(SiancedbModel.id_model == id_model).update(
+        {SiancedbModel.is_active: True}, synchronize_session=False
+    )
+    db.commit()
+    invalidate(ACTIVE_MODEL)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import random
+import itertools
+import unittest
+from types import SimpleNamespace
+from typing import List
+from unittest import mock
+
+from siancedb import letter_summary
+from siancedb.letter_summary import (
+    PREDICTION_MODE,
+    AnnotatedText,
+    BlockSemantics,
+    LetterBlock,
+    TreeLeaf,
+    TreeNode,
+    hydrate_letter,
+    hydrate_letter_cached,
+)
+
+LABELS = {id_label: f"CATEGORY : label {id_label}" for id_label in range(40)}
+
+
+def hydrate_letter_pydantic(letter, mode: str, id_model: int):
+    """
+    The previous implementation of `hydrate_letter`, with pydantic blocks
+    """
+    sections = sorted(
+        [
+            LetterBlock(
+                start=section.start,
+                end=section.end,
+                semantics=[
+                    BlockSemantics(
+                        id_semantics=section.id_section,
+                        kind="sections",
+                        value=f"{section.priority}",
+                    )
+                ],
+            )
+            for section in letter.sections
+        ],
+        key=lambda x: x.start,
+    )
+    demands = sorted(
+        [
+            LetterBlock(
+                start=demand.start,
+                end=demand.end,
+                semantics=[
+                    BlockSemantics(
+                        id_semantics=demand.id_demand,
+                        kind="demands",
+                        value=demand.priority,
+                    )
+                ],
+            )
+            for demand in letter.demands
+        ],
+        key=lambda x: x.start,
+    )
+    last_demand_a = len([d for d in demands if d.semantics[0].value == "1"])
+    for num_demand, demand in enumerate(demands):
+        if demand.semantics[0].value == "1":
+            demand.semantics[0].value = f"{1  + num_demand}"
+        elif demand.semantics[0].value == "2":
+            demand.semantics[0].value = f"{1 + num_demand - last_demand_a}"
+    sentences = sorted(
+        [
+            LetterBlock(
+                start=sentence.start,
+                end=sentence.end,
+                semantics=[
+                    BlockSemantics(
+                        id_semantics=sentence.id_prediction,
+                        kind=mode,
+                        value=LABELS[sentence.id_label],
+                        confidence=sentence.decision_score,
+                    )
+                ],
+            )
+            for sentence in letter.predictions
+            if sentence.id_model == id_model
+        ],
+        key=lambda x: x.start,
+    )
+
+    def repr_group(group):
+        group = list(group)
+        return LetterBlock(
+            start=group[0].start,
+            end=group[0].end,
+            semantics=[p for sentence in group for p in sentence.semantics],
+        )
+
+    sentences = [
+        repr_group(g) for _, g in itertools.groupby(sentences, key=lambda x: x.start)
+    ]
+    return recursive_split_pydantic(letter.text, sections, demands, sentences)
+
+
+def recursive_split_pydantic(text: str, *annotation_levels) -> List[AnnotatedText]:
+    if len(annotation_levels) == 0:
+        return [TreeLeaf(leaf=text)]
+    if len(annotation_levels[0]) == 0:
+        blocks = [LetterBlock(start=0, end=len(text), semantics=[])]
+    else:
+        annotations = annotation_levels[0]
+        blocks = [LetterBlock(start=0, end=annotations[0].start, semantics=[])]
+        blocks.extend(
+            [
+                u
+                for a1, a2 in zip(annotations[:-1], annotations[1:])
+                for u in [a1, LetterBlock(start=a1.end, end=a2.start, semantics=[])]
+            ]
+        )
+        blocks.append(annotations[-1])
+        blocks.append(
+            LetterBlock(start=annotations[-1].end, end=len(text), semantics=[])
+        )
+        blocks = list(filter(lambda x: x.end != x.start, blocks))
+    return [
+        TreeNode(
+            children=recursive_split_pydantic(
+                text[block.start : block.end],
+                *[
+                    [
+                        LetterBlock(
+                            semantics=u.semantics,
+                            start=u.start - block.start,
+                            end=u.end - block.start,
+                        )
+                        for u in level
+                        if u.start >= block.start and u.end <= block.end
+                    ]
+                    for level in annotation_levels[1:]
+                ],
+            ),
+            value=block,
+        )
+        for block in blocks
+    ]
+
+
+def random_letter(rng: random.Random, n_sections: int = 6, length: int = 6000):
+    """
+    A letter with sections, demands inside (or across) the sections,
+    and predictions of two models, some of them sharing their start
+    """
+    text = "".join(rng.choice("abcdefgh .\n") for _ in range(length))
+    cuts = sorted(rng.sample(range(1, length), 2 * n_sections))
+    sections, demands, predictions = [], [], []
+    for i in range(n_sections):
+        start, end = cuts[2 * i], cuts[2 * i + 1]
+        sections.append(
+            SimpleNamespace(id_section=i, priority=rng.choice([0, 1, 2]), start=start, end=end)
+        )
+        position = start
+        while position < end:
+            demand_end = min(position + rng.randint(0, 400), end + rng.choice([0, 0, 0, 5]))
+            if rng.random() < 0.7:
+                demands.append(
+                    SimpleNamespace(
+                        id_demand=len(demands),
+                        priority=rng.choice([1, 2]),
+                        start=position,
+                        end=demand_end,
+                    )
+                )
+                sentence = position
+                while sentence < demand_end:
+                    sentence_end = min(sentence + rng.randint(0, 80), demand_end)
+                    for _ in range(rng.choice([1, 1, 2, 3])):
+                        predictions.append(
+                            SimpleNamespace(
+                                id_prediction=len(predictions),
+                                id_label=rng.randrange(40),
+                                id_model=rng.choice([1, 1, 1, 2]),
+                                decision_score=rng.random(),
+                                start=sentence,
+                                end=sentence_end + rng.choice([0, 0, 0, 0, 3]),
+                            )
+                        )
+                    sentence = sentence_end + rng.randint(1, 20)
+            position = demand_end + rng.randint(1, 50)
+    rng.shuffle(predictions)
+    return SimpleNamespace(
+        id_letter=1, text=text, sections=sections, demands=demands, predictions=predictions
+    )
+
+
+class TestHydrateLetter(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(letter_summary, "label_translate", return_value=LABELS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(letter_summary._hydrated.clear)
+
+    def test_same_tree_as_pydantic(self):
+        rng = random.Random(0)
+        for _ in range(30):
+            letter = random_letter(rng, n_sections=rng.randint(0, 6), length=rng.randint(0, 6000))
+            expected = [node.dict() for node in hydrate_letter_pydantic(letter, PREDICTION_MODE, 1)]
+            self.assertEqual(hydrate_letter(letter, PREDICTION_MODE, 1), expected)
+
+    def test_valid_annotated_text(self):
+        letter = random_letter(random.Random(1))
+        for node in hydrate_letter(letter, PREDICTION_MODE, 1):
+            TreeNode.parse_obj(node)
+
+    def test_cached_until_predicted_again(self):
+        letter = random_letter(random.Random(3))
+        fingerprint = mock.patch.object(
+            letter_summary, "hydration_fingerprint", return_value=(10, 123, "labels")
+        )
+        hydrate = mock.patch.object(
+            letter_summary, "hydrate_letter", wraps=letter_summary.hydrate_letter
+        )
+        with fingerprint as fingerprint, hydrate as hydrate:
+            content = hydrate_letter_cached(None, letter, PREDICTION_MODE, 1)
+            self.assertIs(hydrate_letter_cached(None, letter, PREDICTION_MODE, 1), content)
+            hydrate_letter_cached(None, letter, PREDICTION_MODE, 2)
+            self.assertEqual(hydrate.call_count, 2)
+            fingerprint.return_value = (10, 456, "labels")
+            self.assertEqual(hydrate_letter_cached(None, letter, PREDICTION_MODE, 1), content)
+            self.assertEqual(hydrate.call_count, 3)
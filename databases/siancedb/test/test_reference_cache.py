@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from unittest import mock
+
+from siancedb import reference_cache
+from siancedb.reference_cache import cached, invalidate
+
+
+class TestReferenceCache(unittest.TestCase):
+    def setUp(self):
+        invalidate()
+        self.calls = 0
+
+    def tearDown(self):
+        invalidate()
+
+    def load(self):
+        self.calls += 1
+        return ["LT3d-Incendie", "R.5.1 Génie civil"]
+
+    def test_loaded_once(self):
+        value, etag = cached("themes", self.load)
+        self.assertEqual(cached("themes", self.load), (value, etag))
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate(self):
+        _, etag = cached("themes", self.load)
+        invalidate("labels")
+        cached("themes", self.load)
+        self.assertEqual(self.calls, 1)
+        invalidate("themes")
+        self.assertEqual(cached("themes", self.load)[1], etag)
+        self.assertEqual(self.calls, 2)
+
+    def test_expires(self):
+        with mock.patch.object(reference_cache, "ttl_seconds", return_value=0.05):
+            cached("themes", self.load)
+            time.sleep(0.1)
+            cached("themes", self.load)
+        self.assertEqual(self.calls, 2)
+
+    def test_etag_follows_the_value(self):
+        _, etag = cached("themes", self.load)
+        invalidate()
+        _, other = cached("themes", lambda: ["LT3d-Incendie"])
+        self.assertNotEqual(etag, other)